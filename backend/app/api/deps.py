@@ -1,22 +1,117 @@
-from typing import Generator, Annotated, Optional
-from fastapi import Header, HTTPException, Depends, status
-from sqlmodel import Session
+import json
+from typing import AsyncGenerator, Annotated, Any, Dict, Optional
+from fastapi import Header, HTTPException, Depends, Query, status
+from starlette.concurrency import run_in_threadpool
 
-from app.db.database import get_session as get_db_session_gen
+from app.db.database import DatabaseSession, get_database_session
 from app.models.client import Client
-from app.core.security import verify_api_key
 from app.crud import crud_client
+from app.core.auth_cache import ClientIdentity, api_key_cache, legacy_key_scan_limiter, rejected_key_cache
+from app.core.config import settings
+from app.core.security import compute_api_key_fingerprint, verify_api_key
+from app.core.pagination import Cursor, decode_cursor
 
-def get_db() -> Generator[Session, None, None]:
-    yield from get_db_session_gen()
+async def get_db() -> AsyncGenerator[DatabaseSession, None]:
+    async for db in get_database_session():
+        yield db
 
-DBSession = Annotated[Session, Depends(get_db)]
+DBSession = Annotated[DatabaseSession, Depends(get_db)]
+
+
+def get_page_cursor(
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+) -> Optional[Cursor]:
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+
+PageCursor = Annotated[Optional[Cursor], Depends(get_page_cursor)]
+
+
+def parse_json_filter(value: Optional[str], parameter: str) -> Optional[Dict[str, Any]]:
+    """JSON-объект из параметра запроса для фильтра по вхождению (@>). Некорректный JSON - 400."""
+    if value is None:
+        return None
+    try:
+        document = json.loads(value)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON in {parameter}")
+    if not isinstance(document, dict):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{parameter} must be a JSON object")
+    return document
+
+
+def get_details_contains(
+    details_contains: Optional[str] = Query(None, description='Events whose details contain this JSON object, e.g. {"code": 403}'),
+) -> Optional[Dict[str, Any]]:
+    return parse_json_filter(details_contains, "details_contains")
+
+
+def get_payload_contains(
+    payload_contains: Optional[str] = Query(None, description='Commands whose payload contains this JSON object, e.g. {"ip": "10.0.0.5"}'),
+) -> Optional[Dict[str, Any]]:
+    return parse_json_filter(payload_contains, "payload_contains")
+
+# Фильтры по вхождению JSON-объекта в details/payload (JSONB @>, используют GIN-индексы)
+DetailsContains = Annotated[Optional[Dict[str, Any]], Depends(get_details_contains)]
+PayloadContains = Annotated[Optional[Dict[str, Any]], Depends(get_payload_contains)]
+
+# Статусы клиентов, которым разрешен доступ. "offline" выставляет фоновая проверка живости,
+# и агент должен иметь возможность прислать heartbeat, чтобы снова стать активным.
+# Любой другой статус ("inactive", "maintenance", "disabled", ...) закрывает доступ.
+ALLOWED_CLIENT_STATUSES = (crud_client.CLIENT_STATUS_ACTIVE, crud_client.CLIENT_STATUS_OFFLINE)
+
+
+async def authenticate_api_key(session: DatabaseSession, api_key: str, key_fingerprint: str) -> Optional[Client]:
+    """
+    Находит клиента по предъявленному API ключу.
+    Клиент ищется по отпечатку ключа, после чего выполняется ровно одна проверка bcrypt
+    (в пуле потоков, чтобы не блокировать event loop).
+    Для клиентов, зарегистрированных до появления отпечатков, выполняется перебор
+    только среди записей без отпечатка; при совпадении отпечаток сохраняется,
+    и следующие запросы этого клиента идут по быстрому пути.
+    Перебор стоит по bcrypt на каждого такого клиента, поэтому он выполняется, только пока
+    включен AUTH_LEGACY_KEY_SCAN_ENABLED, и не чаще AUTH_LEGACY_KEY_SCANS_PER_MINUTE
+    (сверх лимита - 429); отвергнутый ключ запоминается в rejected_key_cache.
+    """
+    client = await session.run(crud_client.get_client_by_api_key_fingerprint, api_key_fingerprint=key_fingerprint)
+    if client is not None:
+        is_valid = await run_in_threadpool(verify_api_key, api_key, client.api_key_hash)
+        return client if is_valid else None
+    if not settings.AUTH_LEGACY_KEY_SCAN_ENABLED:
+        return None
+
+    retry_after = legacy_key_scan_limiter.try_acquire()
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many API key checks, retry later",
+            headers={"Retry-After": str(max(1, round(retry_after)))},
+        )
+    legacy_clients = await session.run(crud_client.get_clients_without_api_key_fingerprint)
+    for legacy_client in legacy_clients:
+        if await run_in_threadpool(verify_api_key, api_key, legacy_client.api_key_hash):
+            return await session.run(
+                crud_client.set_client_api_key_fingerprint,
+                db_client=legacy_client,
+                api_key_fingerprint=key_fingerprint,
+            )
+    return None
 
 
 async def get_current_client(
-    session: DBSession, 
+    session: DBSession,
     x_api_key: Annotated[str | None, Header()] = None,
-) -> Client:
+) -> ClientIdentity:
+    """
+    Проверяет X-API-Key и возвращает идентичность клиента (id, имя, статус), а не строку client.
+    Если ключ есть в кэше, запрос не обращается к БД: ни bcrypt, ни чтения клиента. Смена статуса
+    или ключа сбрасывает кэш этого воркера сразу, остальных - по NOTIFY (см. command_notifier),
+    а без LISTEN-соединения - по истечении AUTH_CACHE_TTL_SECONDS.
+    """
     if x_api_key is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -24,26 +119,38 @@ async def get_current_client(
             headers={"WWW-Authenticate": "ApiKey"},
         )
 
-    clients = crud_client.get_clients(session, limit=10000) # Осторожно с лимитом в проде
-    authenticated_client: Optional[Client] = None
-    for client_record in clients:
-        if verify_api_key(x_api_key, client_record.api_key_hash):
-            authenticated_client = client_record
-            break
-            
-    if authenticated_client is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid API Key",
-            headers={"WWW-Authenticate": "ApiKey"},
+    key_fingerprint = compute_api_key_fingerprint(x_api_key)
+    identity = api_key_cache.get(key_fingerprint) # Ключ уже проверен недавно: ни bcrypt, ни запроса к БД
+    if identity is None:
+        # Ключ недавно отвергнут: ответ без БД и bcrypt
+        if rejected_key_cache.contains(key_fingerprint):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid API Key",
+                headers={"WWW-Authenticate": "ApiKey"},
+            )
+        # Поиск по HMAC-отпечатку ключа: одна строка из БД и одна проверка bcrypt
+        authenticated_client = await authenticate_api_key(session, x_api_key, key_fingerprint)
+        if authenticated_client is None:
+            rejected_key_cache.add(key_fingerprint)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid API Key",
+                headers={"WWW-Authenticate": "ApiKey"},
+            )
+        identity = ClientIdentity(
+            id=authenticated_client.id,
+            client_name=authenticated_client.client_name,
+            status=authenticated_client.status,
         )
-    
-    if authenticated_client.status != "active":
+        api_key_cache.set(key_fingerprint, identity)
+
+    if identity.status not in ALLOWED_CLIENT_STATUSES:
          raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Client is not active",
         )
-        
-    return authenticated_client
 
-AuthenticatedClient = Annotated[Client, Depends(get_current_client)]
\ No newline at end of file
+    return identity
+
+AuthenticatedClient = Annotated[ClientIdentity, Depends(get_current_client)]
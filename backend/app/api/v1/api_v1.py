@@ -3,9 +3,13 @@ from fastapi import APIRouter
 from app.api.v1.endpoints import clients
 from app.api.v1.endpoints import events
 from app.api.v1.endpoints import commands
+from app.api.v1.endpoints import metrics
+from app.api.v1.endpoints import agent_ws
 
 api_router = APIRouter()
 
 api_router.include_router(clients.router, tags=["Clients"])
 api_router.include_router(events.router, tags=["Security Events"])
-api_router.include_router(commands.router, tags=["Commands"])
\ No newline at end of file
+api_router.include_router(commands.router, tags=["Commands"])
+api_router.include_router(metrics.router, tags=["Metrics"])
+api_router.include_router(agent_ws.router, tags=["Agent Channel"])
\ No newline at end of file
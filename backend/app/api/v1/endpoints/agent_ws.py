@@ -0,0 +1,236 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Annotated, Any, Dict, List, Optional, Set
+from uuid import UUID, uuid4
+
+from fastapi import APIRouter, Header, HTTPException, WebSocket, WebSocketDisconnect, status
+from pydantic import TypeAdapter, ValidationError
+
+from app.api.deps import get_current_client
+from app.core.auth_cache import ClientIdentity
+from app.core.config import settings
+from app.core.security import compute_api_key_fingerprint
+from app.crud import crud_command, crud_event
+from app.db.database import database_session, is_transient_db_error, run_in_new_session
+from app.models.command import CommandRead, CommandStatusUpdateItem
+from app.models.event import SecurityEventCreate
+from app.services.agent_connections import AgentConnection, agent_connections
+from app.services.command_notifier import command_notifier
+from app.services.event_ingest import event_ingest_queue, IngestQueueFull
+from app.services.heartbeat_buffer import heartbeat_buffer
+
+router = APIRouter()
+
+EVENTS_ADAPTER = TypeAdapter(list[SecurityEventCreate])
+_release_tasks: Set[asyncio.Task] = set()
+COMMAND_STATUS_UPDATES_ADAPTER = TypeAdapter(list[CommandStatusUpdateItem])
+
+# --- Постоянный канал агента (WebSocket) ---
+#
+# Агент -> сервер (JSON):
+#   {"type": "heartbeat"}
+#   {"type": "command_status", "updates": [{"command_id": "...", "status": "...", "execution_result": "..."}, ...]}
+#   {"type": "events", "batch_id": "...", "events": [SecurityEventCreate, ...]}  - batch_id задает агент
+# Сервер -> агент:
+#   {"type": "commands", "commands": [CommandRead, ...]}  - сразу после создания команды
+#   {"type": "heartbeat_ack", "status": "..."}
+#   {"type": "command_status_ack", "results": [CommandStatusUpdateResult, ...]}
+#   {"type": "events_accepted", "batch_id": "...", "accepted": N}
+#   {"type": "events_rejected", "batch_id": "...", "detail": "...", "retry_after_seconds": N}  - пачка не принята,
+#       агент откладывает ее и отправляет позже (как при ошибке POST /events/batch)
+#   {"type": "error", "detail": "...", ...}  - в том числе на бинарный кадр; если не удалось записать статусы
+#       команд, в ошибке возвращается "updates" сообщения, и агент отправляет их позже (или по HTTP)
+
+
+@router.websocket("/agents/ws")
+async def agent_channel(
+    websocket: WebSocket,
+    x_api_key: Annotated[str | None, Header()] = None,
+) -> None:
+    """
+    Постоянное двунаправленное соединение агента вместо трех циклов опроса:
+    команды доставляются в момент создания, а heartbeat, статусы команд и пачки
+    событий агент отправляет по этому же соединению.
+    Аутентификация - заголовок X-API-Key при подключении; смена ключа или блокировка клиента
+    закрывают соединение с кодом 1008 (в других воркерах - при перепроверке, см. agent_credentials).
+    """
+    async with database_session() as session:
+        try:
+            current_client = await get_current_client(session, x_api_key)
+        except HTTPException as e:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+            return
+
+    await websocket.accept()
+    connection = agent_connections.register(current_client.id, compute_api_key_fingerprint(x_api_key), websocket)
+    # Подписка до первой выборки команд, чтобы не пропустить команду, созданную между ними
+    wakeup = command_notifier.subscribe(current_client.id)
+    push_task = asyncio.create_task(_push_commands(connection, wakeup))
+    try:
+        while connection.close_code is None: # Сервер мог закрыть соединение (см. agent_connections.close_client)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", status.WS_1000_NORMAL_CLOSURE))
+            agent_connections.messages_received += 1
+            raw_message = frame.get("text")
+            if raw_message is None:
+                reply = {"type": "error", "detail": "Binary frames are not supported: send JSON as text"}
+            else:
+                reply = await _handle_agent_message(current_client, raw_message)
+            if reply is not None:
+                await _send(connection, reply)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        push_task.cancel()
+        command_notifier.unsubscribe(current_client.id, wakeup)
+        agent_connections.unregister(connection)
+
+
+async def _send(connection: AgentConnection, message: Dict[str, Any]) -> None:
+    await connection.send(message)
+    agent_connections.messages_sent += 1
+
+
+async def _push_commands(connection: AgentConnection, wakeup: asyncio.Event) -> None:
+    """
+    Забирает ожидающие команды клиента и отправляет их агенту при каждом уведомлении.
+    Если доставка не удалась (ошибка БД или отправки), забранные команды возвращаются
+    в `pending_dispatch`, а соединение закрывается: агент переподключится (или перейдет
+    на HTTP) и получит их снова. Доставка "хотя бы один раз": при обрыве во время отправки
+    агент может получить команду повторно.
+    """
+    commands: List[Dict[str, Any]] = []
+    # Ближайшее not_before отложенных команд клиента. Перечитывается, только когда могло измениться:
+    # после уведомления (новая команда могла быть отложенной) или когда это время наступило
+    release_at: Optional[datetime] = None
+    refresh_release_at = True
+    try:
+        while True:
+            wakeup.clear()
+            commands = await run_in_new_session(
+                crud_command.claim_pending_commands,
+                client_id=connection.client_id,
+                limit=settings.AGENT_WS_COMMAND_BATCH_SIZE,
+            )
+            if commands:
+                await _send(connection, {
+                    "type": "commands",
+                    "commands": [CommandRead.model_validate(command).model_dump(mode="json") for command in commands],
+                })
+                agent_connections.commands_pushed += len(commands)
+                commands = []
+                continue # Возможно, забраны не все ожидающие команды
+            # Периодическая перепроверка страхует от потерянного уведомления (например, при разрыве LISTEN);
+            # отложенная команда (not_before) будит соединение к своему времени
+            timeout = settings.AGENT_WS_COMMAND_RECHECK_SECONDS
+            now = datetime.now(timezone.utc)
+            if refresh_release_at or (release_at is not None and release_at <= now):
+                release_at = await run_in_new_session(crud_command.get_next_command_release_time, client_id=connection.client_id)
+            if release_at is not None:
+                timeout = min(timeout, max((release_at - now).total_seconds(), 0))
+            refresh_release_at = await command_notifier.wait(wakeup, timeout)
+    except asyncio.CancelledError:
+        # Соединение закрывается во время отправки: возвращаем команды без ожидания
+        if commands:
+            release_task = asyncio.create_task(_release_commands(connection.client_id, commands))
+            _release_tasks.add(release_task) # Ссылка на задачу, пока она не завершится
+            release_task.add_done_callback(_release_tasks.discard)
+        raise
+    except Exception as e:
+        print(f"Error pushing commands to client {connection.client_id}: {e}")
+        await _release_commands(connection.client_id, commands)
+        await connection.close(code=status.WS_1011_INTERNAL_ERROR, reason="Command delivery failed")
+
+
+async def _release_commands(client_id: UUID, commands: List[Dict[str, Any]]) -> None:
+    if not commands:
+        return
+    try:
+        released = await run_in_new_session(
+            crud_command.release_dispatched_commands,
+            client_id=client_id,
+            command_ids=[command["id"] for command in commands],
+        )
+    except Exception as e:
+        print(f"Error releasing {len(commands)} undelivered commands of client {client_id}: {e}")
+        return
+    print(f"Released {released} undelivered commands of client {client_id} back to pending_dispatch")
+    command_notifier.notify(client_id)
+
+
+async def _handle_agent_message(current_client: ClientIdentity, raw_message: str) -> Optional[Dict[str, Any]]:
+    try:
+        message = json.loads(raw_message)
+    except ValueError:
+        return {"type": "error", "detail": "Message is not valid JSON"}
+    if not isinstance(message, dict):
+        return {"type": "error", "detail": "Message must be a JSON object"}
+
+    message_type = message.get("type")
+    if message_type == "heartbeat":
+        heartbeat_buffer.record(current_client.id)
+        return {"type": "heartbeat_ack", "status": heartbeat_buffer.overlay_status(current_client.status)}
+    if message_type == "command_status":
+        return await _handle_command_status(current_client, message)
+    if message_type == "events":
+        return _handle_events(current_client, message)
+    return {"type": "error", "detail": f"Unknown message type: {message_type!r}"}
+
+
+async def _handle_command_status(current_client: ClientIdentity, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Пакет обновлений статусов - то же, что PATCH /commands."""
+    try:
+        updates = COMMAND_STATUS_UPDATES_ADAPTER.validate_python(message.get("updates"))
+    except ValidationError as e:
+        return {"type": "error", "detail": f"Invalid command_status message: {e}"}
+    if not updates:
+        return {"type": "error", "detail": "No updates provided."}
+    if len(updates) > settings.COMMAND_STATUS_BATCH_MAX_ITEMS:
+        return {"type": "error", "detail": f"Batch too large: at most {settings.COMMAND_STATUS_BATCH_MAX_ITEMS} updates per message."}
+
+    try:
+        results = await run_in_new_session(
+            crud_command.update_command_statuses_by_client, client_id=current_client.id, updates=updates
+        )
+    except Exception as e:
+        # Ошибка БД не закрывает соединение: агент получает свои обновления обратно и повторит их
+        print(f"Error updating command statuses of client {current_client.id}: {e}")
+        return {
+            "type": "error",
+            "detail": "Command statuses were not saved, retry later",
+            "retryable": is_transient_db_error(e),
+            "updates": [update.model_dump(mode="json") for update in updates],
+        }
+    return {"type": "command_status_ack", "results": [result.model_dump(mode="json") for result in results]}
+
+
+def _handle_events(current_client: ClientIdentity, message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Пачка событий уходит в ту же write-behind очередь, что и POST /events/batch.
+    Ответ - events_accepted или events_rejected с batch_id агента, чтобы агент мог
+    отложить непринятую пачку.
+    """
+    batch_id = message.get("batch_id")
+    if not isinstance(batch_id, str) or not batch_id:
+        batch_id = str(uuid4()) # Агент без batch_id (прежняя версия)
+
+    def rejected(detail: str, **extra: Any) -> Dict[str, Any]:
+        return {"type": "events_rejected", "batch_id": batch_id, "detail": detail, **extra}
+
+    try:
+        events_in = EVENTS_ADAPTER.validate_python(message.get("events"))
+    except ValidationError as e:
+        return rejected(f"Invalid events message: {e}")
+    if not events_in:
+        return rejected("No events provided.")
+    if len(events_in) > event_ingest_queue.max_pending_events:
+        return rejected(f"Batch too large: at most {event_ingest_queue.max_pending_events} events per message.")
+
+    rows = crud_event.prepare_event_rows(events_in, client_id=current_client.id)
+    try:
+        event_ingest_queue.submit(rows)
+    except IngestQueueFull as e:
+        return rejected(str(e), retry_after_seconds=e.retry_after_seconds)
+    return {"type": "events_accepted", "batch_id": batch_id, "accepted": len(rows)}
@@ -1,27 +1,35 @@
 from typing import List, Any
 from uuid import UUID
-from fastapi import APIRouter, HTTPException, Depends, status, Body
+from fastapi import APIRouter, HTTPException, Depends, status, Body, Response
+from starlette.concurrency import run_in_threadpool
 
-from app.models.client import ClientCreate, ClientRead, ClientReadWithApiKey, ClientUpdate
+from app.models.client import ClientCreate, ClientHeartbeatRead, ClientRead, ClientReadWithApiKey, ClientUpdate
 from app.crud import crud_client
-from app.api.deps import DBSession, AuthenticatedClient # Используем типизированные зависимости
+from app.core.security import issue_api_key
+from app.api.deps import ALLOWED_CLIENT_STATUSES, DBSession, AuthenticatedClient, PageCursor # Используем типизированные зависимости
+from app.core.pagination import NEXT_CURSOR_HEADER, next_cursor
+from app.services.agent_connections import agent_connections
+from app.services.heartbeat_buffer import heartbeat_buffer
 
 router = APIRouter()
 
 @router.post("/admin/clients", response_model=ClientReadWithApiKey, status_code=status.HTTP_201_CREATED)
-def register_new_client(
+async def register_new_client(
     *,
     session: DBSession,
     client_in: ClientCreate,
 ) -> Any:
-    existing_client = crud_client.get_client_by_name(session, client_name=client_in.client_name)
+    existing_client = await session.run(crud_client.get_client_by_name, client_name=client_in.client_name)
     if existing_client:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Client with this name already exists.",
         )
     
-    db_client, plain_api_key = crud_client.create_client_with_api_key(session=session, client_in=client_in)
+    issued_api_key = await run_in_threadpool(issue_api_key) # bcrypt - вне event loop
+    db_client, plain_api_key = await session.run(
+        crud_client.create_client_with_api_key, client_in=client_in, issued_api_key=issued_api_key
+    )
     
     # Собираем ответ, включая нехешированный API ключ
     response_data = ClientRead.model_validate(db_client).model_dump()
@@ -31,33 +39,90 @@ def register_new_client(
 
 
 @router.get("/admin/clients", response_model=List[ClientRead])
-def read_clients_list(
+async def read_clients_list(
     session: DBSession,
+    response: Response,
+    cursor: PageCursor,
     skip: int = 0,
     limit: int = 100,
 ) -> Any:
-    clients = crud_client.get_clients(session=session, skip=skip, limit=limit)
-    return clients
+    clients = await session.run(crud_client.get_clients, skip=skip, limit=limit, cursor=cursor)
+    cursor_for_next_page = next_cursor(clients, limit, "registered_at")
+    if cursor_for_next_page:
+        response.headers[NEXT_CURSOR_HEADER] = cursor_for_next_page
+    # last_heartbeat - с учетом еще не записанных в БД heartbeat
+    return [heartbeat_buffer.overlay(ClientRead.model_validate(client)) for client in clients]
 
 
 @router.get("/admin/clients/{client_id}", response_model=ClientRead)
-def read_client_by_id(
+async def read_client_by_id(
     client_id: UUID,
     session: DBSession,
 ) -> Any:
-    client = crud_client.get_client(session=session, client_id=client_id)
+    client = await session.run(crud_client.get_client, client_id=client_id)
     if not client:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
-    return client
+    return heartbeat_buffer.overlay(ClientRead.model_validate(client))
 
-@router.post("/clients/heartbeat", response_model=ClientRead)
-def client_heartbeat(
-    current_client: AuthenticatedClient, # Зависимость для аутентификации клиента
+@router.patch("/admin/clients/{client_id}", response_model=ClientRead)
+async def update_client_by_admin(
+    client_id: UUID,
+    client_update_data: ClientUpdate,
     session: DBSession,
 ) -> Any:
-    updated_client = crud_client.update_client_heartbeat(session=session, client=current_client)
+    """
+    Администратор меняет данные клиента, например статус ("maintenance", "disabled").
+    Клиент со статусом, отличным от "active"/"offline" (например, "inactive"), теряет доступ сразу, минуя кэш проверенных ключей;
+    его открытые WebSocket соединения закрываются.
+    """
+    client = await session.run(crud_client.get_client, client_id=client_id)
+    if not client:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
+    updated_client = await session.run(crud_client.update_client, db_client=client, client_update_data=client_update_data)
+    if updated_client.status not in ALLOWED_CLIENT_STATUSES:
+        await agent_connections.close_client(updated_client.id, reason="Client disabled")
     return updated_client
 
+
+@router.post("/admin/clients/{client_id}/api-key", response_model=ClientReadWithApiKey)
+async def rotate_client_api_key(
+    client_id: UUID,
+    session: DBSession,
+) -> Any:
+    """Выпускает клиенту новый API ключ. Старый ключ перестает действовать."""
+    client = await session.run(crud_client.get_client, client_id=client_id)
+    if not client:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Client not found")
+
+    issued_api_key = await run_in_threadpool(issue_api_key)
+    db_client, plain_api_key = await session.run(
+        crud_client.rotate_client_api_key, db_client=client, issued_api_key=issued_api_key
+    )
+    # Соединения, открытые со старым ключом
+    await agent_connections.close_client(db_client.id, reason="API key revoked")
+
+    response_data = ClientRead.model_validate(db_client).model_dump()
+    response_data["api_key"] = plain_api_key
+    return ClientReadWithApiKey(**response_data)
+
+@router.post("/clients/heartbeat", response_model=ClientHeartbeatRead)
+async def client_heartbeat(
+    current_client: AuthenticatedClient, # Зависимость для аутентификации клиента
+) -> Any:
+    """
+    Heartbeat только записывается в память; в client.last_heartbeat он попадает
+    пакетным UPDATE раз в HEARTBEAT_FLUSH_INTERVAL_SECONDS.
+    Ответ строится из идентичности клиента и буфера, без обращения к БД: при попадании
+    в кэш ключей heartbeat не выполняет ни одного запроса.
+    """
+    heartbeat_buffer.record(current_client.id)
+    return ClientHeartbeatRead(
+        id=current_client.id,
+        client_name=current_client.client_name,
+        status=heartbeat_buffer.overlay_status(current_client.status),
+        last_heartbeat=heartbeat_buffer.latest(current_client.id),
+    )
+
 # Эндпоинт для обновления информации о клиенте (пока не требуется, но может пригодиться)
 # @router.patch("/clients/me", response_model=ClientRead)
 # def update_client_info(
@@ -1,17 +1,28 @@
+import asyncio
+from datetime import datetime
 from typing import List, Any, Optional
 from uuid import UUID
 from fastapi import APIRouter, HTTPException, Depends, status, Query
 
-from app.models.command import CommandCreate, CommandRead, CommandUpdateByClient, CommandUpdateByAdmin
+from app.models.command import (
+    CommandCreate, CommandRead, CommandUpdateByClient, CommandUpdateByAdmin,
+    CommandStatusUpdateItem, CommandStatusUpdateResult,
+    CommandBroadcastCreate, CommandCampaignRead, CommandField, CommandStatsDimension, CommandStatsRow,
+)
+from app.models.event import StatsBucket
 from app.crud import crud_command, crud_client # Добавляем crud_client для проверки существования
-from app.api.deps import DBSession, AuthenticatedClient
+from app.api.deps import DBSession, AuthenticatedClient, PageCursor, PayloadContains
+from app.core.config import settings
+from app.core.pagination import NEXT_CURSOR_HEADER, next_cursor
+from app.core.responses import FastJSONResponse
+from app.services.command_notifier import command_notifier
 
 router = APIRouter()
 
 # --- Admin-like Endpoints ---
 
 @router.post("/admin/commands", response_model=CommandRead, status_code=status.HTTP_201_CREATED)
-def create_new_command_for_client(
+async def create_new_command_for_client(
     *,
     session: DBSession,
     command_in: CommandCreate, # В command_in должен быть client_id
@@ -21,7 +32,7 @@ def create_new_command_for_client(
     `command_in` должен содержать `client_id`.
     """
     # Проверяем, существует ли клиент
-    client = crud_client.get_client(session=session, client_id=command_in.client_id)
+    client = await session.run(crud_client.get_client, client_id=command_in.client_id)
     if not client:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -34,76 +45,204 @@ def create_new_command_for_client(
         # пока клиент не станет активным. Для начала, будем создавать.
         pass # log a warning maybe? "Client is not active, command will be pending."
 
-    command = crud_command.create_command(session=session, command_in=command_in, client_id=command_in.client_id)
+    command = await session.run(crud_command.create_command, command_in=command_in, client_id=command_in.client_id)
+    # Будим long-poll запросы клиента в этом воркере; остальные воркеры получат NOTIFY из create_command
+    command_notifier.notify(command.client_id)
     return command
 
 
+@router.post("/admin/commands/broadcast", response_model=CommandCampaignRead, status_code=status.HTTP_201_CREATED)
+async def create_broadcast_command(
+    *,
+    session: DBSession,
+    broadcast_in: CommandBroadcastCreate,
+) -> Any:
+    """
+    Администратор создает одну и ту же команду для группы клиентов: по списку `client_ids`
+    и/или фильтрам `client_status`, `os_info_contains`, `client_name_like`.
+    Все команды вставляются одним запросом и объединяются общим `campaign_id`;
+    прогресс рассылки - GET /admin/commands/campaigns/{campaign_id}.
+    """
+    target = broadcast_in.target
+    has_conditions = any(
+        value is not None
+        for value in (target.client_ids, target.client_status, target.os_info_contains, target.client_name_like)
+    )
+    if not has_conditions and not target.all_clients:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No target conditions provided. Set target.all_clients=true to send the command to every client.",
+        )
+
+    campaign_id, client_ids = await session.run(crud_command.create_broadcast_commands, broadcast_in=broadcast_in)
+    for client_id in client_ids:
+        command_notifier.notify(client_id)
+    return CommandCampaignRead(
+        campaign_id=campaign_id,
+        total=len(client_ids),
+        status_counts={"pending_dispatch": len(client_ids)} if client_ids else {},
+    )
+
+
+@router.get("/admin/commands/campaigns/{campaign_id}", response_model=CommandCampaignRead)
+async def read_command_campaign(
+    campaign_id: UUID,
+    session: DBSession,
+) -> Any:
+    """
+    Прогресс рассылки: число команд кампании в каждом статусе (один GROUP BY).
+    """
+    campaign = await session.run(crud_command.get_campaign_status_counts, campaign_id=campaign_id)
+    if not campaign:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Campaign not found")
+    return campaign
+
+
 @router.get("/admin/commands", response_model=List[CommandRead])
-def read_all_system_commands(
+async def read_all_system_commands(
     session: DBSession,
+    cursor: PageCursor,
+    payload_contains: PayloadContains,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=200),
     client_id: Optional[UUID] = Query(None, description="Filter by Client ID"),
     status: Optional[str] = Query(None, description="Filter by command status"),
+    campaign_id: Optional[UUID] = Query(None, description="Filter by broadcast campaign ID"),
+    fields: List[CommandField] = Query([], description="Columns to return (id and created_at are always included); all by default"),
 ) -> Any:
     """
     Получает список всех команд в системе с возможностью фильтрации.
+    Следующая страница - по `cursor` из заголовка `X-Next-Cursor`.
+    `fields` (можно повторять) ограничивает набор колонок, например без тяжелых `payload`/`execution_result`.
+    `payload_contains` - JSON-объект, который должен входить в payload, например `{"ip": "10.0.0.5"}`.
+    """
+    commands = await session.run(
+        crud_command.get_all_commands, skip=skip, limit=limit, client_id=client_id, status=status, cursor=cursor,
+        campaign_id=campaign_id, fields=fields, payload_contains=payload_contains,
+    )
+    cursor_for_next_page = next_cursor(commands, limit, "created_at")
+    headers = {NEXT_CURSOR_HEADER: cursor_for_next_page} if cursor_for_next_page else None
+    return FastJSONResponse(commands, headers=headers)
+
+
+@router.get("/admin/stats/commands", response_model=List[CommandStatsRow])
+async def read_command_stats(
+    session: DBSession,
+    payload_contains: PayloadContains,
+    bucket: Optional[StatsBucket] = Query(None, description="Time bucket of created_at: minute, hour or day"),
+    group_by: List[CommandStatsDimension] = Query([], description="Group by client_id, command_type and/or status"),
+    client_id: Optional[UUID] = Query(None, description="Filter by Client ID"),
+    command_type: Optional[str] = Query(None, max_length=100),
+    campaign_id: Optional[UUID] = Query(None, description="Filter by broadcast campaign ID"),
+    start_date: Optional[datetime] = Query(None, description="Created at or after (ISO format)"),
+    end_date: Optional[datetime] = Query(None, description="Created at or before (ISO format)"),
+    limit: int = Query(1000, ge=1, le=10000, description="Max number of result rows"),
+) -> Any:
     """
-    commands = crud_command.get_all_commands(
-        session=session, skip=skip, limit=limit, client_id=client_id, status=status
+    Агрегаты команд для графиков: число команд по интервалам создания (`bucket`)
+    и/или по полям `group_by`. Например, `?group_by=status` - число команд в каждом статусе.
+    """
+    return await session.run(
+        crud_command.get_command_stats,
+        bucket=bucket,
+        group_by=list(dict.fromkeys(group_by)), # Без повторов
+        client_id=client_id,
+        command_type=command_type,
+        campaign_id=campaign_id,
+        start_date=start_date,
+        end_date=end_date,
+        payload_contains=payload_contains,
+        limit=limit,
     )
-    return commands
 
 
 @router.get("/admin/commands/{command_id}", response_model=CommandRead)
-def read_specific_command_by_id(
+async def read_specific_command_by_id(
     command_id: UUID,
     session: DBSession,
 ) -> Any:
     """
     Получает детали конкретной команды по ее ID.
     """
-    command = crud_command.get_command(session=session, command_id=command_id)
+    command = await session.run(crud_command.get_command, command_id=command_id)
     if not command:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Command not found")
     return command
 
 @router.get("/commands", response_model=List[CommandRead])
-def fetch_pending_commands_for_client(
+async def fetch_pending_commands_for_client(
     current_client: AuthenticatedClient, # Аутентифицированный клиент
     session: DBSession,
-    limit: int = Query(10, ge=1, le=50, description="Max number of commands to fetch")
+    limit: int = Query(10, ge=1, le=50, description="Max number of commands to fetch"),
+    wait: float = Query(
+        0, ge=0, le=settings.COMMAND_LONG_POLL_MAX_SECONDS,
+        description="Long-poll: hold the request up to this many seconds until a command arrives",
+    ),
 ) -> Any:
     """
     Клиент запрашивает новые команды, ожидающие выполнения (`pending_dispatch`).
-    Сервер возвращает команды и меняет их статус на `dispatched`.
+    Сервер возвращает команды и меняет их статус на `dispatched` одним запросом:
+    каждая команда выдается ровно один раз, даже при параллельных опросах.
+    С `wait` > 0 при отсутствии команд запрос удерживается до появления команды
+    для клиента или до истечения `wait` секунд (тогда ответ - пустой список).
     Требует валидный X-API-Key.
     """
-    pending_commands = crud_command.get_commands_for_client(
-        session=session, client_id=current_client.id, status="pending_dispatch", limit=limit
-    )
-    
-    if not pending_commands:
-        return [] # Возвращаем пустой список, если нет команд
+    if wait == 0:
+        commands = await session.run(crud_command.claim_pending_commands, client_id=current_client.id, limit=limit)
+        return FastJSONResponse(commands)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    wakeup = command_notifier.subscribe(current_client.id)
+    try:
+        while True:
+            wakeup.clear()
+            # Соединение возвращается в пул после commit в claim, поэтому ожидание его не занимает
+            commands = await session.run(crud_command.claim_pending_commands, client_id=current_client.id, limit=limit)
+            remaining = deadline - loop.time()
+            if commands or remaining <= 0:
+                return FastJSONResponse(commands)
+            if not await command_notifier.wait(wakeup, remaining):
+                return FastJSONResponse([])
+    finally:
+        command_notifier.unsubscribe(current_client.id, wakeup)
 
-    # Меняем статус команд на 'dispatched'
-    dispatched_commands = crud_command.mark_commands_as_dispatched(session=session, commands=pending_commands)
-    
-    return dispatched_commands
+
+@router.patch("/commands", response_model=List[CommandStatusUpdateResult])
+async def update_command_statuses_by_client_agent(
+    updates: List[CommandStatusUpdateItem],
+    current_client: AuthenticatedClient,
+    session: DBSession,
+) -> Any:
+    """
+    Клиент обновляет статусы нескольких команд одним запросом и в одной транзакции.
+    Для каждого элемента возвращается результат: `updated=false` и `error`, если команда
+    не найдена, принадлежит другому клиенту, уже в финальном статусе или переход не допускается.
+    Требует валидный X-API-Key.
+    """
+    if not updates:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No updates provided.")
+    if len(updates) > settings.COMMAND_STATUS_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Batch too large: at most {settings.COMMAND_STATUS_BATCH_MAX_ITEMS} updates per request."
+        )
+    return await session.run(crud_command.update_command_statuses_by_client, client_id=current_client.id, updates=updates)
 
 
 @router.patch("/commands/{command_id}", response_model=CommandRead)
-def update_command_status_by_client_agent(
+async def update_command_status_by_client_agent(
     command_id: UUID,
     command_update_data: CommandUpdateByClient, # Статус и результат
     current_client: AuthenticatedClient,
     session: DBSession,
 ) -> Any:
     """
-    Клиент обновляет статус выполнения команды (e.g., acknowledged, in_progress, completed, failed).
-    Требует валидный X-API-Key.
+    Клиент обновляет статус выполнения команды (acknowledged, in_progress, completed, failed).
+    Допустимые переходы - crud_command.CLIENT_STATUS_TRANSITIONS. Требует валидный X-API-Key.
     """
-    db_command = crud_command.get_command(session=session, command_id=command_id)
+    # Строка заблокирована до commit в update_command_status_by_client (при отказе - до отката при закрытии сессии)
+    db_command = await session.run(crud_command.get_command_for_update, command_id=command_id)
     if not db_command:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Command not found")
 
@@ -114,13 +253,14 @@ def update_command_status_by_client_agent(
             detail="Not authorized to update this command"
         )
     
-    if db_command.status == "completed" or db_command.status == "failed":
+    transition_error = crud_command.client_status_transition_error(db_command.status, command_update_data.status)
+    if transition_error:
         raise HTTPException(
         status_code=status.HTTP_400_BAD_REQUEST,
-        detail=f"Command is already in a final state: {db_command.status}"
+        detail=transition_error
         )
 
-    updated_command = crud_command.update_command_status_by_client(
-        session=session, db_command=db_command, command_update_data=command_update_data
+    updated_command = await session.run(
+        crud_command.update_command_status_by_client, db_command=db_command, command_update_data=command_update_data
     )
     return updated_command
\ No newline at end of file
@@ -1,16 +1,25 @@
-from typing import List, Any, Optional
-from uuid import UUID
-from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends, status, Query
+from typing import Annotated, List, Any, Literal, Optional
+from uuid import UUID, uuid4
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, HTTPException, Depends, Header, status, Query, Request
+from fastapi.responses import StreamingResponse
 
-from app.models.event import SecurityEventCreate, SecurityEventRead
+from app.models.event import (
+    SecurityEventCreate, SecurityEventRead, SecurityEventBatchAccepted, SecurityEventStreamAccepted,
+    SecurityEventField, StatsBucket, EventStatsDimension, SecurityEventStatsRow,
+)
+from app.core.config import settings
 from app.crud import crud_event
-from app.api.deps import DBSession, AuthenticatedClient
+from app.api.deps import DBSession, AuthenticatedClient, PageCursor, DetailsContains
+from app.core.pagination import NEXT_CURSOR_HEADER, next_cursor
+from app.core.responses import FastJSONResponse
+from app.services.event_ingest import event_ingest_queue, IngestQueueFull
+from app.services import event_export, event_stream_ingest
 
 router = APIRouter()
 
 @router.post("/events", response_model=List[SecurityEventRead], status_code=status.HTTP_201_CREATED)
-def submit_security_events(
+async def submit_security_events(
     *,
     session: DBSession,
     events_in: List[SecurityEventCreate], # Клиент может отправить пачку событий
@@ -21,15 +30,89 @@ def submit_security_events(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No events provided."
         )
-    created_events = crud_event.create_multiple_events(session=session, events_in=events_in, client=current_client)
-    return created_events
+    created_events = await session.run(crud_event.create_multiple_events, events_in=events_in, client_id=current_client.id)
+    # Вставленные строки уже совпадают с SecurityEventRead - без повторной проверки
+    return FastJSONResponse(created_events, status_code=status.HTTP_201_CREATED)
+
+
+@router.post("/events/batch", response_model=SecurityEventBatchAccepted, status_code=status.HTTP_202_ACCEPTED)
+async def submit_security_events_batch(
+    *,
+    events_in: List[SecurityEventCreate],
+    current_client: AuthenticatedClient,
+) -> Any:
+    """
+    Облегченный прием пачки событий: события валидируются, ставятся в очередь на запись
+    и сервер сразу отвечает 202 с числом принятых событий и ID пачки,
+    не возвращая сохраненные события обратно.
+    Фоновый воркер объединяет пачки многих агентов в крупные INSERT.
+    Если очередь заполнена - 429 (при остановке сервера - 503) с заголовком Retry-After.
+    """
+    if not events_in:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No events provided."
+        )
+    if len(events_in) > event_ingest_queue.max_pending_events:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"Batch too large: at most {event_ingest_queue.max_pending_events} events per request."
+        )
+    batch_id = uuid4()
+    rows = crud_event.prepare_event_rows(events_in, client_id=current_client.id)
+    try:
+        event_ingest_queue.submit(rows)
+    except IngestQueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE if e.shutting_down else status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after_seconds)},
+        )
+    return SecurityEventBatchAccepted(batch_id=batch_id, accepted=len(rows))
+
+
+@router.post("/events/ndjson", response_model=SecurityEventStreamAccepted)
+async def submit_security_events_stream(
+    request: Request,
+    session: DBSession,
+    current_client: AuthenticatedClient,
+    content_encoding: Annotated[str | None, Header()] = None,
+) -> Any:
+    """
+    Потоковый прием большого объема событий (например, накопленных агентом за время без связи).
+    Тело - NDJSON: одно событие `SecurityEventCreate` на строку; `Content-Encoding: gzip` или `zstd`
+    для сжатого тела. Строки проверяются по мере поступления тела, проверенные события пишутся
+    в БД порциями, не дожидаясь конца запроса; ошибочные строки пропускаются и перечисляются
+    в ответе с номерами. Если тело не распаковывается - 400 (записанные до ошибки события остаются).
+    """
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding not in event_stream_ingest.SUPPORTED_ENCODINGS or not event_stream_ingest.encoding_available(encoding):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported Content-Encoding: {encoding}",
+        )
+
+    async def write_rows(rows: List[dict]) -> None:
+        await session.run(crud_event.insert_event_rows, rows)
+
+    try:
+        return await event_stream_ingest.ingest_ndjson_stream(
+            request.stream(), encoding=encoding, client_id=current_client.id, write_rows=write_rows
+        )
+    except event_stream_ingest.StreamDecodeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{e}. Events stored before the error: {e.accepted}.",
+        )
 
 
 # --- Admin-like Endpoints (пока без явной админской аутентификации) ---
 
 @router.get("/admin/events", response_model=List[SecurityEventRead])
-def read_security_events_log(
+async def read_security_events_log(
     session: DBSession,
+    cursor: PageCursor,
+    details_contains: DetailsContains,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=200),
     client_id: Optional[UUID] = Query(None),
@@ -37,9 +120,16 @@ def read_security_events_log(
     severity: Optional[str] = Query(None, max_length=50),
     start_date: Optional[datetime] = Query(None, description="Start date for filtering (ISO format)"),
     end_date: Optional[datetime] = Query(None, description="End date for filtering (ISO format)"),
+    fields: List[SecurityEventField] = Query([], description="Columns to return (id and timestamp are always included); all by default"),
 ) -> Any:
-    events = crud_event.get_events(
-        session=session,
+    """
+    Лог событий, новые сначала. Для постраничного просмотра передавайте `cursor`
+    из заголовка `X-Next-Cursor` предыдущего ответа (вместо `skip`).
+    `fields` (можно повторять) ограничивает набор колонок, например `?fields=severity&fields=event_type`.
+    `details_contains` - JSON-объект, который должен входить в details, например `{"code": 403}`.
+    """
+    events = await session.run(
+        crud_event.get_events,
         skip=skip,
         limit=limit,
         client_id=client_id,
@@ -47,5 +137,96 @@ def read_security_events_log(
         severity=severity,
         start_date=start_date,
         end_date=end_date,
+        cursor=cursor,
+        fields=fields,
+        details_contains=details_contains,
+    )
+    cursor_for_next_page = next_cursor(events, limit, "timestamp")
+    headers = {NEXT_CURSOR_HEADER: cursor_for_next_page} if cursor_for_next_page else None
+    return FastJSONResponse(events, headers=headers)
+
+
+@router.get("/admin/events/export")
+def export_security_events(
+    details_contains: DetailsContains,
+    export_format: Literal["ndjson", "csv", "parquet"] = Query("ndjson", alias="format"),
+    client_id: Optional[UUID] = Query(None),
+    event_type: Optional[str] = Query(None, max_length=100),
+    severity: Optional[str] = Query(None, max_length=50),
+    start_date: Optional[datetime] = Query(None, description="Start date for filtering (ISO format)"),
+    end_date: Optional[datetime] = Query(None, description="End date for filtering (ISO format)"),
+) -> StreamingResponse:
+    """
+    Потоковая выгрузка событий по тем же фильтрам, что и лог, без ограничения числа строк
+    (старые сначала). Форматы: NDJSON (по умолчанию), CSV (`details` - JSON-строкой в ячейке)
+    и Parquet (если на сервере установлен pyarrow). Ответ передается по частям
+    по мере чтения курсором, память сервера не зависит от размера выгрузки.
+    """
+    if export_format == "parquet" and not event_export.parquet_available():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Parquet export is not available: pyarrow is not installed on the server.",
+        )
+    filename = f"security_events_{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.{export_format}"
+    return StreamingResponse(
+        event_export.export_events(
+            export_format,
+            client_id=client_id,
+            event_type=event_type,
+            severity=severity,
+            start_date=start_date,
+            end_date=end_date,
+            details_contains=details_contains,
+        ),
+        media_type=event_export.EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/admin/stats/events", response_model=List[SecurityEventStatsRow])
+async def read_security_event_stats(
+    session: DBSession,
+    details_contains: DetailsContains,
+    bucket: Optional[StatsBucket] = Query(None, description="Time bucket: minute, hour or day"),
+    group_by: List[EventStatsDimension] = Query([], description="Group by client_id, event_type and/or severity"),
+    client_id: Optional[UUID] = Query(None),
+    event_type: Optional[str] = Query(None, max_length=100),
+    severity: Optional[str] = Query(None, max_length=50),
+    start_date: Optional[datetime] = Query(None, description="Start date for filtering (ISO format)"),
+    end_date: Optional[datetime] = Query(None, description="End date for filtering (ISO format)"),
+    exact: bool = Query(False, description="Count raw events instead of the pre-aggregated rollups"),
+    limit: int = Query(1000, ge=1, le=10000, description="Max number of result rows"),
+) -> Any:
+    """
+    Агрегаты событий для графиков: число событий по интервалам времени (`bucket`)
+    и/или по полям `group_by`, с теми же фильтрами, что и лог событий.
+    Например, `?bucket=hour&group_by=severity` - число событий каждой серьезности по часам.
+    Считается по сводке (поминутной для `bucket=minute`, иначе часовой): период учитывается
+    с точностью до ее интервала. `exact=true` - точный подсчет по сырым событиям
+    (с `details_contains` - всегда по сырым событиям).
+    Поминутная сводка хранится EVENT_ROLLUP_MINUTE_RETENTION_DAYS дней, поэтому для `bucket=minute`
+    по сводке нужен `start_date` в этих пределах, иначе 400 (а не график с пустым началом).
+    """
+    if bucket == "minute" and not exact and details_contains is None:
+        retained_since = datetime.now(timezone.utc) - timedelta(days=settings.EVENT_ROLLUP_MINUTE_RETENTION_DAYS)
+        if start_date is None or start_date.replace(tzinfo=start_date.tzinfo or timezone.utc) < retained_since:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=(
+                    f"Minute buckets are kept for {settings.EVENT_ROLLUP_MINUTE_RETENTION_DAYS} days: "
+                    "pass a start_date within that period or exact=true."
+                ),
+            )
+    return await session.run(
+        crud_event.get_event_stats,
+        bucket=bucket,
+        group_by=list(dict.fromkeys(group_by)), # Без повторов
+        client_id=client_id,
+        event_type=event_type,
+        severity=severity,
+        start_date=start_date,
+        end_date=end_date,
+        details_contains=details_contains,
+        exact=exact,
+        limit=limit,
     )
-    return events
@@ -0,0 +1,81 @@
+from typing import Any
+from fastapi import APIRouter
+
+from app.core.auth_cache import api_key_cache, legacy_key_scan_limiter, rejected_key_cache
+from app.db.database import get_pool_stats
+from app.services.agent_connections import agent_connections
+from app.services.agent_credentials import agent_credentials_checker
+from app.services.command_notifier import command_notifier
+from app.services.event_ingest import event_ingest_queue
+from app.services.event_partitions import event_partition_maintenance
+from app.services.event_rollups import event_rollup_pruning
+from app.services.heartbeat_buffer import heartbeat_buffer
+from app.services.liveness_sweeper import liveness_sweeper
+
+router = APIRouter()
+
+# --- Инструментирование (для подбора размеров кэшей и пулов) ---
+
+@router.get("/admin/metrics/auth-cache")
+def read_auth_cache_metrics() -> Any:
+    """
+    Счетчики кэша проверенных API ключей: попадания, промахи, вытеснения;
+    кэш отвергнутых ключей и переборы bcrypt по клиентам без отпечатка ключа.
+    """
+    return {
+        **api_key_cache.stats(),
+        "rejected_keys": rejected_key_cache.stats(),
+        "legacy_key_scans": legacy_key_scan_limiter.stats(),
+    }
+
+
+@router.get("/admin/metrics/db-pool")
+def read_db_pool_metrics() -> Any:
+    """Загрузка пула соединений: занятые/свободные соединения и время ожидания checkout."""
+    return get_pool_stats()
+
+
+@router.get("/admin/metrics/event-ingest")
+def read_event_ingest_metrics() -> Any:
+    """Состояние очереди приема событий: заполненность, записанные и отклоненные события."""
+    return event_ingest_queue.stats()
+
+
+
+@router.get("/admin/metrics/event-partitions")
+def read_event_partition_metrics() -> Any:
+    """Обслуживание секций таблицы событий: число проходов, ошибки, созданные и удаленные секции."""
+    return event_partition_maintenance.stats()
+
+
+@router.get("/admin/metrics/event-rollups")
+def read_event_rollup_metrics() -> Any:
+    """Удаление устаревшей поминутной сводки событий: число проходов, ошибки, удаленные строки."""
+    return event_rollup_pruning.stats()
+
+
+@router.get("/admin/metrics/command-notifier")
+def read_command_notifier_metrics() -> Any:
+    """Ожидающие long-poll запросы агентов, число уведомлений и состояние LISTEN-соединения."""
+    return command_notifier.stats()
+
+
+@router.get("/admin/metrics/agent-connections")
+def read_agent_connection_metrics() -> Any:
+    """
+    Постоянные соединения агентов в этом воркере: число подключений, сообщений и доставленных команд;
+    перепроверка ключей открытых соединений.
+    """
+    return {**agent_connections.stats(), "credentials": agent_credentials_checker.stats()}
+
+
+@router.get("/admin/metrics/heartbeats")
+def read_heartbeat_buffer_metrics() -> Any:
+    """Буфер heartbeat: клиенты, ожидающие записи, число heartbeat и записанных строк."""
+    return heartbeat_buffer.stats()
+
+
+@router.get("/admin/metrics/liveness-sweeper")
+def read_liveness_sweeper_metrics() -> Any:
+    """Проверка живости: длительность последнего прохода, помеченные клиенты и просроченные команды."""
+    return liveness_sweeper.stats()
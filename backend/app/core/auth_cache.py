@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Set
+from uuid import UUID
+
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class ClientIdentity:
+    """
+    Клиент, предъявивший проверенный API ключ: все, что нужно эндпоинтам агента
+    без чтения строки client из БД. Полную запись эндпоинт загружает сам, если она нужна.
+    """
+    id: UUID
+    client_name: str
+    status: str
+
+
+@dataclass(frozen=True)
+class CachedClientIdentity:
+    """То, что известно об успешно проверенном API ключе."""
+    identity: ClientIdentity
+    expires_at: float
+
+
+class ApiKeyCache:
+    """
+    Ограниченный LRU-кэш с TTL: отпечаток API ключа -> проверенный клиент.
+    Позволяет не выполнять bcrypt на каждый запрос агента.
+    Кэш живет в памяти процесса; другие воркеры сбрасывают записи клиента по NOTIFY
+    (crud_client.CLIENT_CREDENTIALS_CHANGED_CHANNEL), TTL - страховка на случай потери уведомления.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, CachedClientIdentity]" = OrderedDict()
+        self._keys_by_client: Dict[UUID, Set[str]] = {}
+        # Синхронные эндпоинты выполняются в пуле потоков, поэтому нужна блокировка
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key_fingerprint: str) -> Optional[ClientIdentity]:
+        with self._lock:
+            entry = self._entries.get(key_fingerprint)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key_fingerprint)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key_fingerprint)
+            self.hits += 1
+            return entry.identity
+
+    def set(self, key_fingerprint: str, identity: ClientIdentity) -> None:
+        if self.max_size <= 0:
+            return
+        entry = CachedClientIdentity(identity=identity, expires_at=time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            if key_fingerprint in self._entries:
+                self._remove(key_fingerprint)
+            self._entries[key_fingerprint] = entry
+            self._keys_by_client.setdefault(identity.id, set()).add(key_fingerprint)
+            while len(self._entries) > self.max_size:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate_client(self, client_id: UUID) -> None:
+        """Удаляет все записи клиента (деактивация, смена ключа, удаление)."""
+        with self._lock:
+            for key_fingerprint in list(self._keys_by_client.get(client_id, ())):
+                self._remove(key_fingerprint)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_client.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key_fingerprint: str) -> None:
+        entry = self._entries.pop(key_fingerprint, None)
+        if entry is None:
+            return
+        client_id = entry.identity.id
+        client_keys = self._keys_by_client.get(client_id)
+        if client_keys is not None:
+            client_keys.discard(key_fingerprint)
+            if not client_keys:
+                del self._keys_by_client[client_id]
+
+
+class RejectedKeyCache:
+    """
+    Ограниченный LRU-кэш с TTL отпечатков ключей, не прошедших проверку.
+    Повтор неверного ключа отвергается без запроса к БД и без bcrypt. Новый ключ
+    всегда случайный, поэтому запись не может заслонить выданный позже ключ.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._expires_at: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.evictions = 0
+
+    def contains(self, key_fingerprint: str) -> bool:
+        with self._lock:
+            expires_at = self._expires_at.get(key_fingerprint)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._expires_at[key_fingerprint]
+                return False
+            self.hits += 1
+            return True
+
+    def add(self, key_fingerprint: str) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._expires_at.pop(key_fingerprint, None)
+            self._expires_at[key_fingerprint] = time.monotonic() + self.ttl_seconds
+            while len(self._expires_at) > self.max_size:
+                self._expires_at.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expires_at.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._expires_at),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "evictions": self.evictions,
+            }
+
+
+class LegacyKeyScanLimiter:
+    """
+    Ограничение числа переборов bcrypt по клиентам без отпечатка ключа: не больше
+    max_per_minute на воркер (фиксированное окно в минуту). Один перебор стоит
+    по bcrypt на каждого такого клиента, и без лимита его мог бы запускать любой
+    неаутентифицированный запрос.
+    """
+
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self, max_per_minute: int):
+        self.max_per_minute = max_per_minute
+        self._window_started = time.monotonic()
+        self._scans = 0
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> Optional[float]:
+        """None - перебор разрешен; иначе через сколько секунд откроется следующее окно."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_started >= self.WINDOW_SECONDS:
+                self._window_started = now
+                self._scans = 0
+            if self._scans >= self.max_per_minute:
+                self.rejected += 1
+                return self._window_started + self.WINDOW_SECONDS - now
+            self._scans += 1
+            self.scans += 1
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"max_per_minute": self.max_per_minute, "scans": self.scans, "rejected": self.rejected}
+
+
+api_key_cache = ApiKeyCache(
+    max_size=settings.AUTH_CACHE_MAX_SIZE,
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+)
+rejected_key_cache = RejectedKeyCache(
+    max_size=settings.AUTH_REJECTED_CACHE_MAX_SIZE,
+    ttl_seconds=settings.AUTH_REJECTED_CACHE_TTL_SECONDS,
+)
+legacy_key_scan_limiter = LegacyKeyScanLimiter(max_per_minute=settings.AUTH_LEGACY_KEY_SCANS_PER_MINUTE)
@@ -15,7 +15,24 @@ class Settings(BaseSettings):
     # SQLModel / SQLAlchemy используют DATABASE_URL для подключения
     @property
     def DATABASE_URL(self) -> str:
-        return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
+        return f"postgresql+psycopg2://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
+
+    # Та же БД через асинхронный драйвер asyncpg
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
+
+    # True: эндпоинты работают с БД через AsyncSession (asyncpg), не занимая потоки.
+    # False: прежний синхронный путь (psycopg2), запросы выполняются в пуле потоков.
+    DB_ASYNC_ENABLED: bool = True
+
+    # Пул соединений (общие настройки для синхронного и асинхронного движков)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT_SECONDS: int = 30 # Сколько ждать свободное соединение
+    DB_POOL_RECYCLE_SECONDS: int = 1800 # Пересоздавать соединения старше этого возраста
+    DB_POOL_PRE_PING: bool = True
+    DB_ECHO: bool = False # Логирование всех SQL-запросов (только для отладки)
 
     # Ключ для создания/проверки API-ключей клиентов или JWT токенов
     SECRET_KEY: str = "your_super_secret_key_which_should_be_long_and_random"
@@ -24,6 +41,67 @@ class Settings(BaseSettings):
     # Время жизни токена доступа (например, для админки)
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Кэш проверенных API ключей (в памяти процесса)
+    AUTH_CACHE_MAX_SIZE: int = 100_000 # 0 отключает кэш
+    AUTH_CACHE_TTL_SECONDS: int = 60 # Предел устаревания, если уведомление о смене ключа не дошло до воркера
+    # Отвергнутые ключи (отпечаток -> отказ без БД и bcrypt), чтобы неверный ключ не стоил запроса каждый раз
+    AUTH_REJECTED_CACHE_MAX_SIZE: int = 10_000
+    AUTH_REJECTED_CACHE_TTL_SECONDS: int = 300
+    # Перебор bcrypt среди клиентов без отпечатка ключа (зарегистрированных до отпечатков).
+    # Включен, пока такие клиенты есть; после перевыпуска их ключей выключить (False).
+    AUTH_LEGACY_KEY_SCAN_ENABLED: bool = True
+    AUTH_LEGACY_KEY_SCANS_PER_MINUTE: int = 30 # На воркер; сверх лимита - 429 с Retry-After
+
+    # Write-behind очередь приема событий (POST /events/batch)
+    EVENT_INGEST_QUEUE_MAX_EVENTS: int = 100_000 # Сверх этого агенты получают 429 с Retry-After
+    EVENT_INGEST_FLUSH_SIZE: int = 5_000 # Запись в БД по набору стольких событий...
+    EVENT_INGEST_FLUSH_INTERVAL_SECONDS: float = 1.0 # ...или через столько секунд после первой пачки
+    # Пока БД недоступна, запись повторяется с паузой (удвоение от интервала записи до максимума);
+    # после стольких неудачных попыток пачка отбрасывается
+    EVENT_INGEST_MAX_FLUSH_ATTEMPTS: int = 20
+    EVENT_INGEST_MAX_RETRY_DELAY_SECONDS: float = 30
+    # NDJSON-файл для событий, которые не удалось записать (отвергнуты БД или отброшены); пусто - только лог
+    EVENT_INGEST_DEAD_LETTER_FILE: str = ""
+
+    # Секционирование таблицы событий по времени (RANGE по timestamp)
+    EVENT_PARTITION_INTERVAL_DAYS: int = 1 # 1 - секция на день, 7 - на неделю
+    EVENT_PARTITION_PREMAKE_DAYS: int = 7 # Секции создаются заранее на столько дней вперед
+    EVENT_RETENTION_DAYS: int = 0 # Секции старше удаляются целиком; 0 - хранить бессрочно
+    EVENT_PARTITION_MAINTENANCE_INTERVAL_SECONDS: float = 3600
+
+    # Сводные таблицы числа событий (securityeventrollup): часовые хранятся бессрочно,
+    # поминутные - столько дней (их строк в 60 раз больше)
+    EVENT_ROLLUP_MINUTE_RETENTION_DAYS: int = 2
+    EVENT_ROLLUP_PRUNE_INTERVAL_SECONDS: float = 3600
+
+    # Потоковая выгрузка событий (GET /admin/events/export): строк в одной порции чтения и записи
+    EVENT_EXPORT_CHUNK_SIZE: int = 5_000
+
+    # Потоковый прием NDJSON (POST /events/ndjson, в т.ч. gzip/zstd)
+    EVENT_STREAM_INGEST_CHUNK_SIZE: int = 5_000 # Проверенные события пишутся в БД порциями такого размера
+    EVENT_STREAM_MAX_LINE_BYTES: int = 1_048_576 # Более длинные строки отклоняются, не накапливаясь в памяти
+    EVENT_STREAM_INGEST_MAX_REPORTED_ERRORS: int = 100 # Ошибок строк в ответе (rejected считает все)
+
+    # Heartbeat агентов копятся в памяти и пишутся в БД пакетно раз в столько секунд
+    HEARTBEAT_FLUSH_INTERVAL_SECONDS: float = 5
+
+    # Фоновая проверка живости: клиенты без heartbeat дольше порога становятся "offline",
+    # невыданные команды с истекшим dispatch_deadline - "timeout"
+    CLIENT_INACTIVE_AFTER_SECONDS: int = 180 # Должно с запасом превышать интервал heartbeat агентов
+    LIVENESS_SWEEP_INTERVAL_SECONDS: float = 30
+
+    # Long-poll выдача команд (GET /commands?wait=...)
+    COMMAND_LONG_POLL_MAX_SECONDS: float = 30 # Верхняя граница параметра wait
+    COMMAND_NOTIFY_LISTEN_ENABLED: bool = True # LISTEN/NOTIFY для пробуждения запросов на других воркерах
+    COMMAND_STATUS_BATCH_MAX_ITEMS: int = 500 # Максимум обновлений в одном PATCH /commands
+
+    # Постоянный канал агентов (WebSocket /agents/ws)
+    AGENT_WS_COMMAND_BATCH_SIZE: int = 50 # Команд в одном сообщении
+    AGENT_WS_COMMAND_RECHECK_SECONDS: float = 300 # Перепроверка ожидающих команд без уведомления
+    # Перепроверка ключей и статусов клиентов открытых соединений (один запрос на воркер): отзыв ключа
+    # или блокировка в другом воркере закрывают соединение не позже чем через столько секунд
+    AGENT_WS_REAUTH_INTERVAL_SECONDS: float = 60
+
 
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
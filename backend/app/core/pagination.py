@@ -0,0 +1,53 @@
+import base64
+import json
+from datetime import datetime
+from collections.abc import Mapping
+from typing import Any, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import Column, Table
+
+# Keyset-пагинация: курсор хранит ключ сортировки последней строки страницы (время, id).
+# Следующая страница начинается строго после него, поэтому страница N стоит столько же,
+# сколько первая, в отличие от OFFSET, при котором БД читает и отбрасывает все предыдущие строки.
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+Cursor = Tuple[datetime, UUID]
+
+
+def encode_cursor(sort_value: datetime, row_id: UUID) -> str:
+    """Кодирует позицию (время, id) в непрозрачную строку для клиента."""
+    raw = json.dumps({"t": sort_value.isoformat(), "id": str(row_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Раскодирует курсор. Бросает ValueError, если курсор поврежден."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(data["t"]), UUID(data["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid pagination cursor") from e
+
+
+def next_cursor(items: Sequence[Any], limit: int, sort_attr: str) -> Optional[str]:
+    """Курсор следующей страницы или None, если страница неполная (дальше строк нет)."""
+    if len(items) < limit:
+        return None
+    last_item = items[-1]
+    if isinstance(last_item, Mapping): # Строка Core-запроса (RowMapping) или dict
+        return encode_cursor(last_item[sort_attr], last_item["id"])
+    return encode_cursor(getattr(last_item, sort_attr), last_item.id)
+
+
+def projected_columns(table: Table, fields: Sequence[str], sort_attr: str) -> List[Column]:
+    """
+    Колонки таблицы для выборки списка (в порядке таблицы): только `fields`, если они заданы,
+    иначе все. id и колонка сортировки `sort_attr` входят всегда - по ним строится курсор.
+    """
+    if not fields:
+        return list(table.columns)
+    requested = {*fields, "id", sort_attr}
+    return [column for column in table.columns if column.name in requested]
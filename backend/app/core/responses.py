@@ -0,0 +1,25 @@
+from collections.abc import Mapping
+from typing import Any
+
+import orjson
+from starlette.responses import Response
+
+
+def _orjson_default(value: Any) -> Any:
+    if isinstance(value, Mapping): # RowMapping строк Core-запросов
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(Response):
+    """
+    JSON-ответ для горячих списочных эндпоинтов: готовые строки (dict / RowMapping)
+    кодируются orjson напрямую, без ORM-объектов и повторной проверки по response_model
+    (response_model у эндпоинта остается для схемы OpenAPI). UUID и datetime orjson
+    кодирует сам; время в UTC - с суффиксом "Z", как у Pydantic.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default, option=orjson.OPT_UTC_Z)
@@ -1,6 +1,10 @@
+import hashlib
+import hmac
 import secrets
 import bcrypt # Импортируем bcrypt
 
+from app.core.config import settings
+
 API_KEY_LENGTH = 32 # Длина генерируемого API ключа (до хеширования)
 
 def generate_api_key() -> str:
@@ -14,6 +18,11 @@ def hash_api_key(api_key: str) -> str:
     hashed_bytes = bcrypt.hashpw(api_key_bytes, salt)
     return hashed_bytes.decode('utf-8')
 
+def issue_api_key() -> tuple[str, str]:
+    """Генерирует новый API ключ и его bcrypt-хеш. Возвращает (ключ, хеш)."""
+    plain_api_key = generate_api_key()
+    return plain_api_key, hash_api_key(plain_api_key)
+
 def verify_api_key(plain_api_key: str, hashed_api_key_from_db: str) -> bool:
     """
     Проверяет обычный API ключ путем сравнения с его хешем, хранящимся в БД.
@@ -25,4 +34,16 @@ def verify_api_key(plain_api_key: str, hashed_api_key_from_db: str) -> bool:
         return bcrypt.checkpw(plain_api_key_bytes, hashed_api_key_from_db_bytes)
     except Exception as e:
         print(f"Error during bcrypt.checkpw: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def compute_api_key_fingerprint(api_key: str) -> str:
+    """
+    Вычисляет HMAC-SHA256 отпечаток API ключа под SECRET_KEY.
+    Отпечаток не раскрывает ключ и хранится в индексируемой колонке,
+    поэтому клиента можно найти одним запросом, а bcrypt проверять только один раз.
+    """
+    return hmac.new(
+        settings.SECRET_KEY.encode('utf-8'),
+        api_key.encode('utf-8'),
+        hashlib.sha256,
+    ).hexdigest()
@@ -1,18 +1,31 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 from uuid import UUID
-from sqlmodel import Session, select
+from sqlalchemy import DateTime, Uuid, and_, case, column, func, or_, values
+from sqlmodel import Session, select, tuple_, update
 from datetime import datetime, timezone
 
-from app.models.client import Client, ClientCreate
-from app.core.security import generate_api_key, hash_api_key
+from app.models.client import Client, ClientCreate, ClientUpdate
+from app.core.auth_cache import api_key_cache
+from app.core.security import issue_api_key, compute_api_key_fingerprint
+from app.core.pagination import Cursor
 
-def create_client_with_api_key(session: Session, *, client_in: ClientCreate) -> tuple[Client, str]:
+# Канал Postgres NOTIFY о смене ключа или статуса клиента; полезная нагрузка - id клиента.
+# Слушатель каждого воркера (app/services/command_notifier.py) сбрасывает записи клиента в кэше ключей
+CLIENT_CREDENTIALS_CHANGED_CHANNEL = "client_credentials_changed"
+
+def create_client_with_api_key(
+    session: Session,
+    *,
+    client_in: ClientCreate,
+    issued_api_key: Optional[tuple[str, str]] = None,
+) -> tuple[Client, str]:
     """
     Создает нового клиента, генерирует для него API ключ, хеширует ключ и сохраняет в БД.
+    `issued_api_key` - заранее выпущенная пара (ключ, хеш) из `issue_api_key()`:
+    bcrypt медленный, и async-эндпоинты считают хеш в пуле потоков.
     Возвращает созданного клиента и НЕХЕШИРОВАННЫЙ API ключ.
     """
-    plain_api_key = generate_api_key()
-    hashed_api_key = hash_api_key(plain_api_key)
+    plain_api_key, hashed_api_key = issued_api_key or issue_api_key()
 
     db_client = Client(
         client_name=client_in.client_name,
@@ -20,6 +33,7 @@ def create_client_with_api_key(session: Session, *, client_in: ClientCreate) ->
         os_info=client_in.os_info,
         status="active", # При регистрации клиент сразу активен
         api_key_hash=hashed_api_key,
+        api_key_fingerprint=compute_api_key_fingerprint(plain_api_key),
         registered_at=datetime.now(timezone.utc)
     )
     session.add(db_client)
@@ -36,21 +50,146 @@ def get_client_by_name(session: Session, client_name: str) -> Optional[Client]:
     statement = select(Client).where(Client.client_name == client_name)
     return session.exec(statement).first()
 
-def get_clients(session: Session, skip: int = 0, limit: int = 100) -> List[Client]:
-    """Получает список клиентов с пагинацией."""
-    statement = select(Client).offset(skip).limit(limit)
-    return session.exec(statement).all()
+def get_clients(session: Session, skip: int = 0, limit: int = 100, cursor: Optional[Cursor] = None) -> List[Client]:
+    """
+    Получает список клиентов с пагинацией (в порядке регистрации).
+    `cursor` - (registered_at, id) последнего клиента предыдущей страницы.
+    """
+    statement = select(Client).order_by(Client.registered_at.asc(), Client.id.asc())
+    if cursor:
+        statement = statement.where(tuple_(Client.registered_at, Client.id) > tuple_(*cursor))
+    return session.exec(statement.offset(skip).limit(limit)).all()
+
+CLIENT_STATUS_ACTIVE = "active"
+# Выставляется фоновой проверкой, если heartbeat давно не приходил; следующий heartbeat возвращает "active".
+# Отличается от "inactive" - статуса, которым администратор закрывает клиенту доступ
+CLIENT_STATUS_OFFLINE = "offline"
 
-def update_client_heartbeat(session: Session, client: Client) -> Client:
-    """Обновляет время последнего heartbeat для клиента."""
-    client.last_heartbeat = datetime.now(timezone.utc)
-    client.status = "active" # Если пришел heartbeat, значит активен
-    session.add(client)
+# Строк в одном UPDATE ... FROM (VALUES ...) при сбросе буфера heartbeat
+HEARTBEAT_UPDATE_CHUNK_SIZE = 5_000
+
+def update_clients_heartbeats(session: Session, *, heartbeats: Dict[UUID, datetime]) -> int:
+    """
+    Пакетно записывает время последнего heartbeat клиентов (сброс app/services/heartbeat_buffer.py):
+    один UPDATE ... FROM (VALUES ...) на каждые HEARTBEAT_UPDATE_CHUNK_SIZE клиентов, одна транзакция.
+    Более свежее значение, записанное другим воркером, не затирается.
+    Клиент, помеченный "offline" по отсутствию heartbeat, снова становится активным.
+    Возвращает число обновленных строк.
+    """
+    items = list(heartbeats.items())
+    updated = 0
+    for start in range(0, len(items), HEARTBEAT_UPDATE_CHUNK_SIZE):
+        heartbeat_values = values(
+            column("client_id", Uuid()),
+            column("heartbeat_at", DateTime(timezone=True)),
+            name="heartbeat",
+        ).data(items[start:start + HEARTBEAT_UPDATE_CHUNK_SIZE])
+        statement = (
+            update(Client)
+            .where(
+                Client.id == heartbeat_values.c.client_id,
+                or_(Client.last_heartbeat.is_(None), Client.last_heartbeat < heartbeat_values.c.heartbeat_at),
+            )
+            .values(
+                last_heartbeat=heartbeat_values.c.heartbeat_at,
+                status=case((Client.status == CLIENT_STATUS_OFFLINE, CLIENT_STATUS_ACTIVE), else_=Client.status),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        updated += session.exec(statement).rowcount
     session.commit()
-    session.refresh(client)
-    return client
+    return updated
+
+def mark_stale_clients_offline(session: Session, *, heartbeat_before: datetime) -> int:
+    """
+    Одним UPDATE помечает "offline" активных клиентов без heartbeat с момента `heartbeat_before`
+    (клиенты, не приславшие ни одного heartbeat, - по времени регистрации).
+    Возвращает число помеченных клиентов.
+    """
+    statement = (
+        update(Client)
+        .where(
+            Client.status == CLIENT_STATUS_ACTIVE,
+            or_(
+                Client.last_heartbeat < heartbeat_before,
+                and_(Client.last_heartbeat.is_(None), Client.registered_at < heartbeat_before),
+            ),
+        )
+        .values(status=CLIENT_STATUS_OFFLINE)
+        .execution_options(synchronize_session=False)
+    )
+    marked = session.exec(statement).rowcount
+    session.commit()
+    return marked
+
+def notify_client_credentials_changed(session: Session, client_id: UUID) -> None:
+    """NOTIFY остальным воркерам; доставляется при фиксации транзакции."""
+    session.exec(select(func.pg_notify(CLIENT_CREDENTIALS_CHANGED_CHANNEL, str(client_id))))
+
+def update_client(session: Session, *, db_client: Client, client_update_data: ClientUpdate) -> Client:
+    """
+    Обновляет данные клиента. Смена статуса сбрасывает кэш проверенных ключей клиента
+    в этом воркере сразу, в остальных - по NOTIFY.
+    """
+    update_data = client_update_data.model_dump(exclude_unset=True)
+    for key, value in update_data.items():
+        setattr(db_client, key, value)
+    session.add(db_client)
+    if "status" in update_data:
+        notify_client_credentials_changed(session, db_client.id)
+    session.commit()
+    session.refresh(db_client)
+    if "status" in update_data:
+        api_key_cache.invalidate_client(db_client.id)
+    return db_client
+
+def rotate_client_api_key(
+    session: Session,
+    *,
+    db_client: Client,
+    issued_api_key: Optional[tuple[str, str]] = None,
+) -> tuple[Client, str]:
+    """
+    Выпускает клиенту новый API ключ; старый ключ перестает действовать сразу,
+    в том числе в кэше проверенных ключей (остальные воркеры сбрасывают его по NOTIFY).
+    Возвращает клиента и НЕХЕШИРОВАННЫЙ новый ключ.
+    """
+    plain_api_key, hashed_api_key = issued_api_key or issue_api_key()
+    db_client.api_key_hash = hashed_api_key
+    db_client.api_key_fingerprint = compute_api_key_fingerprint(plain_api_key)
+    session.add(db_client)
+    notify_client_credentials_changed(session, db_client.id)
+    session.commit()
+    session.refresh(db_client)
+    api_key_cache.invalidate_client(db_client.id)
+    return db_client, plain_api_key
 
 def get_client_by_hashed_api_key(session: Session, hashed_api_key: str) -> Optional[Client]:
     """Получает клиента по хешированному API ключу. Внутренняя функция."""
     statement = select(Client).where(Client.api_key_hash == hashed_api_key)
-    return session.exec(statement).first()
\ No newline at end of file
+    return session.exec(statement).first()
+
+def get_client_by_api_key_fingerprint(session: Session, api_key_fingerprint: str) -> Optional[Client]:
+    """Получает клиента по HMAC-отпечатку API ключа (индексированный поиск)."""
+    statement = select(Client).where(Client.api_key_fingerprint == api_key_fingerprint)
+    return session.exec(statement).first()
+
+def get_clients_credentials(session: Session, *, client_ids: Sequence[UUID]) -> Dict[UUID, Tuple[Optional[str], str]]:
+    """Отпечаток ключа и статус клиентов одним запросом: client_id -> (api_key_fingerprint, status). Удаленных нет в ответе."""
+    if not client_ids:
+        return {}
+    statement = select(Client.id, Client.api_key_fingerprint, Client.status).where(Client.id.in_(client_ids))
+    return {client_id: (api_key_fingerprint, client_status) for client_id, api_key_fingerprint, client_status in session.exec(statement)}
+
+def get_clients_without_api_key_fingerprint(session: Session) -> List[Client]:
+    """Клиенты, зарегистрированные до появления отпечатков ключей (ожидают миграции)."""
+    statement = select(Client).where(Client.api_key_fingerprint.is_(None))
+    return session.exec(statement).all()
+
+def set_client_api_key_fingerprint(session: Session, *, db_client: Client, api_key_fingerprint: str) -> Client:
+    """Сохраняет отпечаток ключа клиента после успешной проверки ключа (ленивая миграция)."""
+    db_client.api_key_fingerprint = api_key_fingerprint
+    session.add(db_client)
+    session.commit()
+    session.refresh(db_client)
+    return db_client
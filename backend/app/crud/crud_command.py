@@ -1,11 +1,38 @@
 # backend/app/crud/crud_command.py
-from typing import List, Optional, Any
-from uuid import UUID
-from sqlmodel import Session, select
+from typing import Dict, List, Optional, Any, Sequence
+from uuid import UUID, uuid4
+from sqlalchemy import RowMapping, String, bindparam, cast, insert, literal
+from sqlmodel import Session, func, or_, select, tuple_, update
 from datetime import datetime, timezone
 
-from app.models.command import Command, CommandCreate, CommandUpdateByClient, CommandUpdateByAdmin
+from app.models.command import (
+    Command, CommandCreate, CommandUpdateByClient, CommandUpdateByAdmin,
+    CommandStatusUpdateItem, CommandStatusUpdateResult,
+    CommandBroadcastCreate, CommandBroadcastTarget, CommandCampaignRead, CommandStatsRow,
+)
 from app.models.client import Client # Для type hinting
+from app.core.pagination import Cursor, projected_columns
+
+# Канал Postgres NOTIFY о новых командах; полезная нагрузка - id клиента (см. app/services/command_notifier.py)
+COMMAND_CREATED_CHANNEL = "command_created"
+# Из этих статусов команда клиентом больше не переводится
+FINAL_COMMAND_STATUSES = ("completed", "failed", "timeout")
+# Переходы, которые может выполнить клиент: текущий статус -> допустимые новые.
+# Команду, еще не выданную агенту ("pending_dispatch"), клиент обновить не может;
+# повтор текущего статуса разрешен, чтобы агент мог безопасно переотправить обновление
+CLIENT_STATUS_TRANSITIONS: Dict[str, tuple] = {
+    "dispatched": ("acknowledged", "in_progress", "completed", "failed"),
+    "acknowledged": ("acknowledged", "in_progress", "completed", "failed"),
+    "in_progress": ("in_progress", "completed", "failed"),
+}
+
+def client_status_transition_error(current_status: str, new_status: str) -> Optional[str]:
+    """Текст ошибки, если клиент не может перевести команду из `current_status` в `new_status`, иначе None."""
+    if current_status in FINAL_COMMAND_STATUSES:
+        return f"Command is already in a final state: {current_status}"
+    if new_status not in CLIENT_STATUS_TRANSITIONS.get(current_status, ()):
+        return f"Invalid status transition: {current_status} -> {new_status}"
+    return None
 
 def create_command(session: Session, *, command_in: CommandCreate, client_id: UUID) -> Command:
     db_command = Command.model_validate(command_in) # Используем model_validate
@@ -15,27 +42,85 @@ def create_command(session: Session, *, command_in: CommandCreate, client_id: UU
     # status по умолчанию "pending_dispatch" из модели
     
     session.add(db_command)
+    # Уведомление доставляется слушателям только при фиксации транзакции
+    session.exec(select(func.pg_notify(COMMAND_CREATED_CHANNEL, str(client_id))))
     session.commit()
     session.refresh(db_command)
     return db_command
 
+def broadcast_target_conditions(target: CommandBroadcastTarget) -> list:
+    """Условия на таблицу client для выбора адресатов рассылки."""
+    conditions = []
+    if target.client_ids is not None:
+        conditions.append(Client.id.in_(target.client_ids))
+    if target.client_status:
+        conditions.append(Client.status == target.client_status)
+    if target.os_info_contains:
+        # autoescape: % и _ в подстроке - обычные символы, а не шаблон LIKE
+        conditions.append(Client.os_info.icontains(target.os_info_contains, autoescape=True))
+    if target.client_name_like:
+        conditions.append(Client.client_name.like(target.client_name_like))
+    return conditions
+
+def create_broadcast_commands(session: Session, *, broadcast_in: CommandBroadcastCreate) -> tuple[UUID, List[UUID]]:
+    """
+    Создает команду для каждого клиента, подходящего под `broadcast_in.target`, одним
+    INSERT ... SELECT FROM client (id команд генерирует Postgres: gen_random_uuid()).
+    Всем командам присваивается общий campaign_id. Возвращает campaign_id и id клиентов-адресатов.
+    """
+    campaign_id = uuid4()
+    now = datetime.now(timezone.utc)
+    command_table = Command.__table__
+    columns = {
+        "id": func.gen_random_uuid(),
+        "client_id": Client.id,
+        "campaign_id": literal(campaign_id, command_table.c.campaign_id.type),
+        "command_type": literal(broadcast_in.command_type, command_table.c.command_type.type),
+        "payload": literal(broadcast_in.payload or {}, command_table.c.payload.type),
+        "status": literal("pending_dispatch", command_table.c.status.type),
+        "dispatch_deadline": literal(broadcast_in.dispatch_deadline, command_table.c.dispatch_deadline.type),
+        "priority": literal(broadcast_in.priority, command_table.c.priority.type),
+        "not_before": literal(broadcast_in.not_before, command_table.c.not_before.type),
+        "created_at": literal(now, command_table.c.created_at.type),
+        "updated_at": literal(now, command_table.c.updated_at.type),
+    }
+    targets = select(*columns.values()).select_from(Client).where(*broadcast_target_conditions(broadcast_in.target))
+    statement = (
+        insert(command_table)
+        .from_select(list(columns.keys()), targets)
+        .returning(command_table.c.client_id)
+    )
+    client_ids = list(session.exec(statement).scalars().all())
+    if client_ids:
+        # Одно уведомление на каждого адресата одним запросом (см. COMMAND_CREATED_CHANNEL)
+        session.exec(
+            select(func.pg_notify(COMMAND_CREATED_CHANNEL, cast(Command.client_id, String)))
+            .where(Command.campaign_id == campaign_id)
+        ).all()
+    session.commit()
+    return campaign_id, client_ids
+
+def get_campaign_status_counts(session: Session, *, campaign_id: UUID) -> Optional[CommandCampaignRead]:
+    """Прогресс рассылки одним GROUP BY status. None, если команд с таким campaign_id нет."""
+    statement = (
+        select(Command.status, func.count())
+        .where(Command.campaign_id == campaign_id)
+        .group_by(Command.status)
+    )
+    status_counts = {command_status: count for command_status, count in session.exec(statement).all()}
+    if not status_counts:
+        return None
+    return CommandCampaignRead(campaign_id=campaign_id, total=sum(status_counts.values()), status_counts=status_counts)
+
 def get_command(session: Session, command_id: UUID) -> Optional[Command]:
     return session.get(Command, command_id)
 
-def get_commands_for_client(
-    session: Session,
-    client_id: UUID,
-    status: Optional[str] = "pending_dispatch", # По умолчанию ищем команды, ожидающие отправки
-    skip: int = 0,
-    limit: int = 100
-) -> List[Command]:
-    statement = select(Command).where(Command.client_id == client_id)
-    if status:
-        statement = statement.where(Command.status == status)
-    
-    statement = statement.order_by(Command.created_at.asc()).offset(skip).limit(limit) # Сначала старые
-    commands = session.exec(statement).all()
-    return commands
+def get_command_for_update(session: Session, command_id: UUID) -> Optional[Command]:
+    """
+    Команда с блокировкой строки (SELECT ... FOR UPDATE) до конца транзакции:
+    параллельное обновление не изменит статус между проверкой перехода и записью.
+    """
+    return session.exec(select(Command).where(Command.id == command_id).with_for_update()).first()
 
 def get_all_commands(
     session: Session,
@@ -43,16 +128,73 @@ def get_all_commands(
     limit: int = 100,
     client_id: Optional[UUID] = None,
     status: Optional[str] = None,
-) -> List[Command]:
-    statement = select(Command).order_by(Command.created_at.desc()) # Сначала новые
+    cursor: Optional[Cursor] = None, # (created_at, id) последней команды предыдущей страницы
+    campaign_id: Optional[UUID] = None,
+    fields: Sequence[str] = (), # Выбираемые колонки (id и created_at - всегда); без них - все
+    payload_contains: Optional[Dict[str, Any]] = None, # JSON-объект, входящий в payload (JSONB @>)
+) -> Sequence[RowMapping]:
+    # Core-запрос без ORM-объектов: эндпоинт кодирует строки в JSON напрямую
+    statement = (
+        select(*projected_columns(Command.__table__, fields, "created_at"))
+        .order_by(Command.created_at.desc(), Command.id.desc()) # Сначала новые
+    )
 
     if client_id:
         statement = statement.where(Command.client_id == client_id)
+    if campaign_id:
+        statement = statement.where(Command.campaign_id == campaign_id)
     if status:
         statement = statement.where(Command.status == status)
+    if payload_contains is not None:
+        statement = statement.where(Command.payload.contains(payload_contains))
+    if cursor:
+        statement = statement.where(tuple_(Command.created_at, Command.id) < tuple_(*cursor))
     
-    commands = session.exec(statement.offset(skip).limit(limit)).all()
-    return commands
+    return session.execute(statement.offset(skip).limit(limit)).mappings().all()
+
+def get_command_stats(
+    session: Session,
+    *,
+    bucket: Optional[str] = None,
+    group_by: Sequence[str] = (),
+    client_id: Optional[UUID] = None,
+    command_type: Optional[str] = None,
+    campaign_id: Optional[UUID] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    payload_contains: Optional[Dict[str, Any]] = None,
+    limit: int = 1000,
+) -> List[CommandStatsRow]:
+    """
+    Число команд, сгруппированных по интервалу создания `bucket` ("minute", "hour", "day")
+    и полям `group_by` (client_id, command_type, status) - одним GROUP BY в Postgres.
+    С `bucket` строки упорядочены по времени, без него - по убыванию числа команд.
+    """
+    group_columns = []
+    if bucket:
+        group_columns.append(func.date_trunc(bucket, Command.created_at, "UTC").label("bucket"))
+    group_columns.extend(getattr(Command, dimension) for dimension in group_by)
+
+    command_count = func.count().label("count")
+    statement = select(*group_columns, command_count).select_from(Command)
+    if client_id:
+        statement = statement.where(Command.client_id == client_id)
+    if command_type:
+        statement = statement.where(Command.command_type == command_type)
+    if campaign_id:
+        statement = statement.where(Command.campaign_id == campaign_id)
+    if start_date:
+        statement = statement.where(Command.created_at >= start_date)
+    if end_date:
+        statement = statement.where(Command.created_at <= end_date)
+    if payload_contains is not None:
+        statement = statement.where(Command.payload.contains(payload_contains))
+    if group_columns:
+        statement = statement.group_by(*group_columns)
+    statement = statement.order_by(*group_columns) if bucket else statement.order_by(command_count.desc())
+
+    rows = session.execute(statement.limit(limit)).mappings().all()
+    return [CommandStatsRow(**row) for row in rows]
 
 def update_command_status_by_client(
     session: Session,
@@ -70,6 +212,102 @@ def update_command_status_by_client(
     session.refresh(db_command)
     return db_command
 
+def update_command_statuses_by_client(
+    session: Session,
+    *,
+    client_id: UUID,
+    updates: List[CommandStatusUpdateItem],
+) -> List[CommandStatusUpdateResult]:
+    """
+    Пакетное обновление статусов команд клиентом в одной транзакции.
+    Принадлежность и текущий статус всех команд проверяются одним SELECT ... FOR UPDATE,
+    допустимые изменения применяются одним UPDATE (executemany). Переход проверяется по
+    CLIENT_STATUS_TRANSITIONS. Обновления одной команды внутри пакета проверяются по очереди,
+    как последовательные PATCH, а записывается последнее допустимое из них.
+    Результат - по элементу на каждое обновление в порядке запроса.
+    """
+    command_ids = {item.command_id for item in updates}
+    current_statuses: Dict[UUID, str] = {
+        command_id: command_status
+        for command_id, command_status in session.exec(
+            select(Command.id, Command.status)
+            .where(Command.id.in_(command_ids), Command.client_id == client_id)
+            .with_for_update()
+        ).all()
+    }
+
+    results: List[CommandStatusUpdateResult] = []
+    rows: Dict[UUID, Dict[str, Any]] = {}
+    result_index: Dict[UUID, int] = {} # Команда -> индекс результата, чье обновление будет записано
+    now = datetime.now(timezone.utc)
+    for item in updates:
+        current_status = current_statuses.get(item.command_id)
+        if current_status is None: # Нет такой команды или она чужая
+            results.append(CommandStatusUpdateResult(command_id=item.command_id, updated=False, error="Command not found"))
+            continue
+        error = client_status_transition_error(current_status, item.status)
+        if error:
+            results.append(CommandStatusUpdateResult(
+                command_id=item.command_id, updated=False, status=current_status, error=error,
+            ))
+            continue
+        previous_row = rows.get(item.command_id)
+        if previous_row is not None: # Более раннее обновление той же команды в пакете не записывается
+            results[result_index[item.command_id]] = CommandStatusUpdateResult(
+                command_id=item.command_id, updated=False, status=previous_row["b_status"],
+                error="Superseded by a later update of the same command in this batch",
+            )
+        execution_result = item.execution_result
+        if execution_result is None and previous_row is not None:
+            execution_result = previous_row["b_execution_result"]
+        rows[item.command_id] = {
+            "b_id": item.command_id,
+            "b_status": item.status,
+            "b_execution_result": execution_result,
+            "b_updated_at": now,
+        }
+        current_statuses[item.command_id] = item.status
+        result_index[item.command_id] = len(results)
+        results.append(CommandStatusUpdateResult(command_id=item.command_id, updated=True, status=item.status))
+
+    if rows:
+        command_table = Command.__table__
+        session.execute(
+            command_table.update()
+            .where(command_table.c.id == bindparam("b_id"))
+            .values(
+                status=bindparam("b_status"),
+                # Как и в одиночном обновлении, пустой результат не затирает сохраненный
+                execution_result=func.coalesce(
+                    bindparam("b_execution_result", type_=command_table.c.execution_result.type),
+                    command_table.c.execution_result,
+                ),
+                updated_at=bindparam("b_updated_at"),
+            ),
+            list(rows.values()),
+        )
+    session.commit()
+    return results
+
+def time_out_overdue_commands(session: Session, *, now: datetime) -> int:
+    """
+    Одним UPDATE переводит в `timeout` команды, не выданные агенту до `dispatch_deadline`.
+    Возвращает число таких команд.
+    """
+    statement = (
+        update(Command)
+        .where(
+            Command.status == "pending_dispatch",
+            Command.dispatch_deadline.is_not(None),
+            Command.dispatch_deadline < now,
+        )
+        .values(status="timeout", updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    timed_out = session.exec(statement).rowcount
+    session.commit()
+    return timed_out
+
 def update_command_by_admin( # Если админу нужно будет что-то менять в существующей команде
     session: Session,
     *,
@@ -86,16 +324,88 @@ def update_command_by_admin( # Если админу нужно будет чт
     session.refresh(db_command)
     return db_command
 
-def mark_commands_as_dispatched(session: Session, commands: List[Command]) -> List[Command]:
-    updated_commands = []
-    for command in commands:
-        if command.status == "pending_dispatch":
-            command.status = "dispatched"
-            command.updated_at = datetime.now(timezone.utc)
-            session.add(command)
-            updated_commands.append(command)
-    if updated_commands: # Коммитим только если были изменения
-        session.commit()
-        for cmd in updated_commands: # Обновляем для получения актуальных данных
-            session.refresh(cmd)
-    return updated_commands
\ No newline at end of file
+# Порядок выдачи команд агенту; совпадает с индексом ix_command_pending_client_id_priority_deadline
+DISPATCH_ORDER = (
+    Command.priority.desc(),
+    Command.dispatch_deadline.asc().nulls_last(),
+    Command.created_at.asc(),
+)
+
+def _dispatch_sort_key(command: Dict[str, Any]) -> tuple:
+    deadline = command["dispatch_deadline"]
+    return (-command["priority"], deadline is None, deadline or command["created_at"], command["created_at"])
+
+def claim_pending_commands(session: Session, *, client_id: UUID, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Атомарно забирает до `limit` ожидающих команд клиента: одним UPDATE ... RETURNING
+    переводит их в `dispatched` и возвращает.
+    Подзапрос блокирует строки FOR UPDATE SKIP LOCKED, поэтому параллельные опросы
+    одного клиента (или повтор запроса) получают непересекающиеся наборы команд.
+    Команды выдаются по приоритету, затем по ближайшему `dispatch_deadline`, затем по времени
+    создания; отложенные (`not_before` в будущем) пропускаются, просроченные в той же
+    транзакции переводятся в `timeout` и не выдаются.
+    Команды возвращаются словарями колонок (RETURNING без ORM-объектов).
+    """
+    now = datetime.now(timezone.utc)
+    session.exec(
+        update(Command)
+        .where(
+            Command.client_id == client_id,
+            Command.status == "pending_dispatch",
+            Command.dispatch_deadline < now,
+        )
+        .values(status="timeout", updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    pending_ids = (
+        select(Command.id)
+        .where(
+            Command.client_id == client_id,
+            Command.status == "pending_dispatch",
+            or_(Command.not_before.is_(None), Command.not_before <= now),
+        )
+        .order_by(*DISPATCH_ORDER)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    statement = (
+        update(Command)
+        .where(Command.id.in_(pending_ids.scalar_subquery()))
+        .values(status="dispatched", updated_at=now)
+        .returning(*Command.__table__.columns)
+        .execution_options(synchronize_session=False)
+    )
+    claimed_commands = [dict(row) for row in session.execute(statement).mappings()]
+    session.commit()
+    # RETURNING не гарантирует порядок строк
+    claimed_commands.sort(key=_dispatch_sort_key)
+    return claimed_commands
+
+def release_dispatched_commands(session: Session, *, client_id: UUID, command_ids: Sequence[UUID]) -> int:
+    """
+    Возвращает в `pending_dispatch` забранные, но не доставленные агенту команды
+    (например, соединение оборвалось при отправке). Команды, статус которых агент
+    уже успел изменить, не трогаются. Возвращает число возвращенных команд.
+    """
+    if not command_ids:
+        return 0
+    statement = (
+        update(Command)
+        .where(Command.client_id == client_id, Command.id.in_(command_ids), Command.status == "dispatched")
+        .values(status="pending_dispatch", updated_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    released = session.exec(statement).rowcount
+    if released:
+        session.exec(select(func.pg_notify(COMMAND_CREATED_CHANNEL, str(client_id))))
+    session.commit()
+    return released
+
+def get_next_command_release_time(session: Session, *, client_id: UUID) -> Optional[datetime]:
+    """Ближайшее `not_before` среди отложенных ожидающих команд клиента (None - таких нет)."""
+    statement = select(func.min(Command.not_before)).where(
+        Command.client_id == client_id,
+        Command.status == "pending_dispatch",
+        Command.not_before > datetime.now(timezone.utc),
+    )
+    return session.exec(statement).one()
@@ -1,34 +1,182 @@
-from typing import List, Optional
-from uuid import UUID
-from sqlmodel import Session, select
-from datetime import datetime
+from collections import Counter
+from typing import List, Optional, Dict, Any, Iterator, Sequence, Tuple
+from uuid import UUID, uuid4
+from sqlalchemy import BigInteger, RowMapping, cast, delete, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, func, select, insert, tuple_
+from datetime import datetime, timezone
 
-from app.models.event import SecurityEvent, SecurityEventCreate
+from app.models.event import SecurityEvent, SecurityEventCreate, SecurityEventRollup, SecurityEventStatsRow
 from app.models.client import Client # Для type hinting
+from app.core.pagination import Cursor, projected_columns
 
 def create_event(session: Session, *, event_in: SecurityEventCreate, client: Client) -> SecurityEvent:
     """Создает новое событие безопасности, привязанное к клиенту."""
     event_data = event_in.model_dump()
     db_event = SecurityEvent(**event_data, client_id=client.id)
     session.add(db_event)
+    upsert_event_rollups(session, [db_event.model_dump()])
     session.commit()
     session.refresh(db_event)
     return db_event
 
-def create_multiple_events(session: Session, *, events_in: List[SecurityEventCreate], client: Client) -> List[SecurityEvent]:
-    """Создает несколько событий безопасности для одного клиента."""
-    db_events = []
+def prepare_event_rows(events_in: List[SecurityEventCreate], client_id: UUID) -> List[Dict[str, Any]]:
+    """
+    Готовит строки для вставки. ID и время генерируются на стороне приложения,
+    поэтому после INSERT не нужно перечитывать строки из БД.
+    """
+    now = datetime.now(timezone.utc)
+    rows = []
     for event_in_item in events_in:
-        event_data = event_in_item.model_dump()
-        db_event = SecurityEvent(**event_data, client_id=client.id)
-        session.add(db_event)
-        db_events.append(db_event)
+        row = event_in_item.model_dump()
+        row["id"] = uuid4()
+        row["client_id"] = client_id
+        if row.get("timestamp") is None:
+            row["timestamp"] = now
+        rows.append(row)
+    return rows
 
+def insert_event_rows(session: Session, rows: List[Dict[str, Any]]) -> None:
+    """
+    Вставляет готовые строки событий многострочными INSERT ... VALUES
+    (SQLAlchemy группирует executemany в пачки по insertmanyvalues_page_size строк).
+    """
+    if not rows:
+        return
+    session.execute(insert(SecurityEvent.__table__), rows)
+    upsert_event_rollups(session, rows) # В той же транзакции: сводка не расходится с событиями
     session.commit()
-    
-    for db_event in db_events: # Обновляем каждый объект после коммита, чтобы получить ID и т.д.
-        session.refresh(db_event)
-    return db_events
+
+# --- Сводные таблицы числа событий ---
+
+ROLLUP_BUCKET_SIZES = ("minute", "hour")
+RollupKey = Tuple[str, datetime, UUID, str, str]
+
+
+def truncate_timestamp(timestamp: datetime, bucket_size: str) -> datetime:
+    """Начало минуты/часа в UTC (как date_trunc(bucket_size, timestamp, 'UTC') в Postgres)."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc) # Postgres с TimeZone=UTC трактует так же
+    timestamp = timestamp.astimezone(timezone.utc).replace(second=0, microsecond=0)
+    return timestamp.replace(minute=0) if bucket_size == "hour" else timestamp
+
+
+def rollup_increments(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Прирост счетчиков сводки от пачки событий: одна строка на каждый затронутый интервал и разрез."""
+    counts: Counter[RollupKey] = Counter()
+    for row in rows:
+        for bucket_size in ROLLUP_BUCKET_SIZES:
+            counts[(
+                bucket_size, truncate_timestamp(row["timestamp"], bucket_size),
+                row["client_id"], row["event_type"], row["severity"],
+            )] += 1
+    # Одинаковый порядок блокировки строк сводки во всех транзакциях - без взаимных блокировок
+    return [
+        {
+            "bucket_size": bucket_size, "bucket_start": bucket_start, "client_id": client_id,
+            "event_type": event_type, "severity": severity, "count": count,
+        }
+        for (bucket_size, bucket_start, client_id, event_type, severity), count in sorted(counts.items())
+    ]
+
+
+def upsert_event_rollups(session: Session, rows: List[Dict[str, Any]]) -> None:
+    """Прибавляет события к сводке одним INSERT ... ON CONFLICT DO UPDATE (без commit)."""
+    increments = rollup_increments(rows)
+    if not increments:
+        return
+    rollup_table = SecurityEventRollup.__table__
+    statement = pg_insert(rollup_table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[column.name for column in rollup_table.primary_key.columns],
+        set_={"count": rollup_table.c.count + statement.excluded.count},
+    )
+    session.execute(statement, increments)
+
+
+def rebuild_event_rollups(session: Session, *, start: datetime, end: datetime) -> int:
+    """
+    Пересчитывает сводку за [start, end) из сырых событий; обе границы округляются вниз до часа.
+    Нужна для заполнения сводки по событиям, записанным до ее появления, и после ручных правок.
+    Возвращает число записанных строк сводки.
+    """
+    start = truncate_timestamp(start, "hour")
+    end = truncate_timestamp(end, "hour")
+    rollup_table = SecurityEventRollup.__table__
+    written = 0
+    for bucket_size in ROLLUP_BUCKET_SIZES:
+        session.execute(
+            delete(rollup_table).where(
+                rollup_table.c.bucket_size == bucket_size,
+                rollup_table.c.bucket_start >= start,
+                rollup_table.c.bucket_start < end,
+            )
+        )
+        bucket_start = func.date_trunc(bucket_size, SecurityEvent.timestamp, "UTC")
+        counts = (
+            select(
+                literal(bucket_size, rollup_table.c.bucket_size.type), bucket_start,
+                SecurityEvent.client_id, SecurityEvent.event_type, SecurityEvent.severity, func.count(),
+            )
+            .where(SecurityEvent.timestamp >= start, SecurityEvent.timestamp < end)
+            .group_by(bucket_start, SecurityEvent.client_id, SecurityEvent.event_type, SecurityEvent.severity)
+        )
+        result = session.execute(
+            insert(rollup_table).from_select(
+                ["bucket_size", "bucket_start", "client_id", "event_type", "severity", "count"], counts
+            )
+        )
+        written += result.rowcount
+    session.commit()
+    return written
+
+
+def delete_expired_minute_rollups(session: Session, *, before: datetime) -> int:
+    """Удаляет поминутную сводку старше `before`; часовая хранится бессрочно."""
+    rollup_table = SecurityEventRollup.__table__
+    result = session.execute(
+        delete(rollup_table).where(rollup_table.c.bucket_size == "minute", rollup_table.c.bucket_start < before)
+    )
+    session.commit()
+    return result.rowcount
+
+
+def create_multiple_events(session: Session, *, events_in: List[SecurityEventCreate], client_id: UUID) -> List[Dict[str, Any]]:
+    """
+    Создает несколько событий безопасности для одного клиента одним пакетным INSERT.
+    Возвращает вставленные строки (словари) без повторного чтения из БД.
+    """
+    rows = prepare_event_rows(events_in, client_id=client_id)
+    insert_event_rows(session, rows)
+    return rows
+
+
+def event_filters(
+    client_id: Optional[UUID] = None,
+    event_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    details_contains: Optional[Dict[str, Any]] = None,
+) -> list:
+    """
+    Условия фильтрации событий, общие для лога, выгрузки и агрегатов.
+    `details_contains` - JSON-объект, входящий в details (JSONB @>, GIN-индекс ix_securityevent_details_gin).
+    """
+    conditions = []
+    if client_id:
+        conditions.append(SecurityEvent.client_id == client_id)
+    if event_type:
+        conditions.append(SecurityEvent.event_type == event_type)
+    if severity:
+        conditions.append(SecurityEvent.severity == severity)
+    if start_date:
+        conditions.append(SecurityEvent.timestamp >= start_date)
+    if end_date:
+        conditions.append(SecurityEvent.timestamp <= end_date)
+    if details_contains is not None:
+        conditions.append(SecurityEvent.details.contains(details_contains))
+    return conditions
 
 
 def get_events(
@@ -40,20 +188,127 @@ def get_events(
     severity: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-) -> List[SecurityEvent]:
-    """Получает список событий с фильтрацией и пагинацией."""
-    statement = select(SecurityEvent).order_by(SecurityEvent.timestamp.desc())
+    cursor: Optional[Cursor] = None,
+    fields: Sequence[str] = (),
+    details_contains: Optional[Dict[str, Any]] = None,
+) -> Sequence[RowMapping]:
+    """
+    Получает список событий с фильтрацией и пагинацией.
+    Возвращает строки Core-запроса (RowMapping) без ORM-объектов и identity map:
+    эндпоинт лога кодирует их в JSON напрямую.
+    `fields` - выбираемые колонки (id и timestamp - всегда); без них - все. Не запрошенный
+    `details` не читается из БД и не декодируется.
+    `cursor` - (timestamp, id) последнего события предыдущей страницы (keyset-пагинация).
+    Условия на timestamp позволяют Postgres отсечь секции таблицы вне диапазона (partition pruning).
+    """
+    statement = (
+        select(*projected_columns(SecurityEvent.__table__, fields, "timestamp"))
+        .where(*event_filters(client_id, event_type, severity, start_date, end_date, details_contains))
+        .order_by(SecurityEvent.timestamp.desc(), SecurityEvent.id.desc())
+    )
+    if cursor:
+        # Отдельное условие на timestamp нужно для отсечения секций: по сравнению кортежей его не сделать
+        statement = statement.where(
+            SecurityEvent.timestamp <= cursor[0],
+            tuple_(SecurityEvent.timestamp, SecurityEvent.id) < tuple_(*cursor),
+        )
+
+    return session.execute(statement.offset(skip).limit(limit)).mappings().all()
 
+
+def iter_events(
+    session: Session,
+    *,
+    chunk_size: int = 5000,
+    client_id: Optional[UUID] = None,
+    event_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    details_contains: Optional[Dict[str, Any]] = None,
+) -> Iterator[Sequence[RowMapping]]:
+    """
+    Все события по фильтрам (старые сначала) порциями по chunk_size строк.
+    Строки читаются через курсор на стороне сервера (stream_results) без ORM-объектов,
+    поэтому память не зависит от размера выборки; сессия занята, пока итератор не исчерпан.
+    """
+    statement = (
+        select(*SecurityEvent.__table__.columns)
+        .where(*event_filters(client_id, event_type, severity, start_date, end_date, details_contains))
+        .order_by(SecurityEvent.timestamp, SecurityEvent.id)
+    )
+    result = session.execute(statement, execution_options={"stream_results": True, "yield_per": chunk_size})
+    yield from result.mappings().partitions()
+
+
+def rollup_filters(
+    bucket_size: str,
+    client_id: Optional[UUID] = None,
+    event_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+) -> list:
+    """Те же фильтры, что event_filters, для сводки: период - с точностью до интервала сводки."""
+    rollup_table = SecurityEventRollup.__table__
+    conditions = [rollup_table.c.bucket_size == bucket_size]
     if client_id:
-        statement = statement.where(SecurityEvent.client_id == client_id)
+        conditions.append(rollup_table.c.client_id == client_id)
     if event_type:
-        statement = statement.where(SecurityEvent.event_type == event_type)
+        conditions.append(rollup_table.c.event_type == event_type)
     if severity:
-        statement = statement.where(SecurityEvent.severity == severity)
+        conditions.append(rollup_table.c.severity == severity)
     if start_date:
-        statement = statement.where(SecurityEvent.timestamp >= start_date)
+        conditions.append(rollup_table.c.bucket_start >= truncate_timestamp(start_date, bucket_size))
     if end_date:
-        statement = statement.where(SecurityEvent.timestamp <= end_date)
+        conditions.append(rollup_table.c.bucket_start <= end_date)
+    return conditions
+
+
+def get_event_stats(
+    session: Session,
+    *,
+    bucket: Optional[str] = None,
+    group_by: Sequence[str] = (),
+    client_id: Optional[UUID] = None,
+    event_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    details_contains: Optional[Dict[str, Any]] = None,
+    exact: bool = False,
+    limit: int = 1000,
+) -> List[SecurityEventStatsRow]:
+    """
+    Число событий, сгруппированных по интервалу времени `bucket` ("minute", "hour", "day")
+    и полям `group_by` (client_id, event_type, severity) - считается в Postgres одним GROUP BY.
+    По умолчанию суммируется сводка (поминутная для bucket="minute", иначе часовая), и границы
+    периода учитываются с точностью до ее интервала; `exact=True` - подсчет по сырым событиям.
+    Сводка не хранит details, поэтому с `details_contains` подсчет всегда идет по сырым событиям.
+    С `bucket` строки упорядочены по времени, без него - по убыванию числа событий.
+    """
+    if exact or details_contains is not None:
+        source = SecurityEvent.__table__
+        time_column = source.c.timestamp
+        event_count = func.count().label("count")
+        conditions = event_filters(client_id, event_type, severity, start_date, end_date, details_contains)
+    else:
+        source = SecurityEventRollup.__table__
+        time_column = source.c.bucket_start
+        event_count = cast(func.sum(source.c.count), BigInteger).label("count")
+        bucket_size = "minute" if bucket == "minute" else "hour"
+        conditions = rollup_filters(bucket_size, client_id, event_type, severity, start_date, end_date)
+
+    group_columns = []
+    if bucket:
+        group_columns.append(func.date_trunc(bucket, time_column, "UTC").label("bucket"))
+    group_columns.extend(source.c[dimension] for dimension in group_by)
+
+    statement = select(*group_columns, event_count).select_from(source).where(*conditions)
+    if group_columns:
+        statement = statement.group_by(*group_columns)
+    statement = statement.order_by(*group_columns) if bucket else statement.order_by(event_count.desc())
 
-    events = session.exec(statement.offset(skip).limit(limit)).all()
-    return events
\ No newline at end of file
+    rows = session.execute(statement.limit(limit)).mappings().all()
+    # Сумма по пустой выборке - NULL
+    return [SecurityEventStatsRow(**{**row, "count": row["count"] or 0}) for row in rows]
@@ -1,12 +1,39 @@
 from sqlmodel import create_engine, SQLModel, Session
-from typing import Generator
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Generator, TypeVar, Union
 
 from app.core.config import settings
+from app.db.init_db import STARTUP_MIGRATION_LOCK_ID, apply_schema_migrations
+from app.db.pool import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool
+
+T = TypeVar("T")
 
 # Строка подключения к базе данных из настроек
 DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(DATABASE_URL, echo=True) 
+ENGINE_OPTIONS = {
+    "echo": settings.DB_ECHO,
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+    "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+}
+
+# Синхронный движок (psycopg2) нужен всегда: создание схемы, миграции и режим DB_ASYNC_ENABLED=False
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, **ENGINE_OPTIONS)
+
+# Асинхронный движок (asyncpg) для эндпоинтов, если включен DB_ASYNC_ENABLED
+async_engine = (
+    create_async_engine(settings.ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncAdaptedQueuePool, **ENGINE_OPTIONS)
+    if settings.DB_ASYNC_ENABLED
+    else None
+)
 
 
 def create_db_and_tables():
@@ -14,9 +41,77 @@ def create_db_and_tables():
     import app.models.event
     import app.models.command
 
-    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # Воркеры выполняют создание схемы по очереди; блокировка снимается с концом транзакции
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": STARTUP_MIGRATION_LOCK_ID})
+        SQLModel.metadata.create_all(connection)
+        apply_schema_migrations(connection)
 
 
 def get_session() -> Generator[Session, None, None]:
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+class DatabaseSession:
+    """
+    Сессия БД для async-эндпоинтов.
+    CRUD-функции написаны для синхронной Session; run() выполняет их так,
+    чтобы event loop не блокировался:
+    - DB_ASYNC_ENABLED=True: через AsyncSession.run_sync поверх asyncpg (ввод-вывод неблокирующий);
+    - DB_ASYNC_ENABLED=False: в пуле потоков поверх синхронного движка.
+    """
+
+    def __init__(self, session: Union[AsyncSession, Session]):
+        self.session = session
+
+    @property
+    def is_async(self) -> bool:
+        return isinstance(self.session, AsyncSession)
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Вызывает fn(session, *args, **kwargs)."""
+        if self.is_async:
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
+@asynccontextmanager
+async def database_session() -> AsyncIterator[DatabaseSession]:
+    # expire_on_commit=False: объекты остаются читаемыми после commit вне run()
+    if async_engine is not None:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            yield DatabaseSession(session)
+    else:
+        with Session(engine, expire_on_commit=False) as session:
+            yield DatabaseSession(session)
+
+
+async def get_database_session() -> AsyncGenerator[DatabaseSession, None]:
+    async with database_session() as db:
+        yield db
+
+
+
+async def run_in_new_session(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполняет CRUD-функцию в отдельной сессии (фоновые задачи вне запроса)."""
+    async with database_session() as db:
+        return await db.run(fn, *args, **kwargs)
+
+def is_transient_db_error(error: BaseException) -> bool:
+    """
+    Ошибка связи с БД или временная ошибка сервера (недоступность, разрыв соединения,
+    нет свободного соединения в пуле, deadlock, отмена по таймауту) - запрос имеет смысл повторить.
+    Ошибки данных (DataError, IntegrityError и т.п.) повторять бесполезно.
+    """
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError))
+    return isinstance(error, (PoolTimeoutError, OSError)) # OSError включает ConnectionError и TimeoutError
+
+
+def get_pool_stats() -> dict:
+    """Загрузка пулов соединений обоих движков (для эндпоинта метрик)."""
+    return {
+        "sync": engine.pool.stats(),
+        "async": async_engine.sync_engine.pool.stats() if async_engine is not None else None,
+    }
@@ -0,0 +1,75 @@
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlmodel import SQLModel
+
+# Ключ pg_advisory_xact_lock: воркеры, стартующие одновременно, создают таблицы и колонки по очереди
+STARTUP_MIGRATION_LOCK_ID = 7302841001
+
+# create_all() создает только отсутствующие таблицы и не трогает уже существующие,
+# поэтому новые колонки добавляются здесь: (таблица, колонка, тип). ALTER TABLE выполняется,
+# только если колонки нет, - иначе он ждал бы эксклюзивную блокировку таблицы при каждом старте.
+# Добавление колонки без перезаписи таблицы (NULL или константа по умолчанию) выполняется мгновенно.
+SCHEMA_COLUMNS = [
+    # Отпечаток API ключа для поиска клиента без перебора (заполняется лениво для старых клиентов)
+    ("client", "api_key_fingerprint", "VARCHAR(64)"),
+    # Планирование выдачи команд: приоритет и отложенный запуск
+    ("command", "priority", "INTEGER NOT NULL DEFAULT 0"),
+    ("command", "not_before", "TIMESTAMP WITH TIME ZONE"),
+    # Рассылка команд группе клиентов
+    ("command", "campaign_id", "UUID"),
+]
+
+# Колонки, переведенные из JSON в JSONB. Смена типа переписывает таблицу, поэтому выполняется
+# не при старте, а разовой миграцией (app/db/migrate.py)
+JSONB_COLUMNS = [("securityevent", "details"), ("command", "payload")]
+
+
+def column_data_type(connection: Connection, table: str, column: str):
+    return connection.execute(
+        text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": column},
+    ).scalar()
+
+
+def index_is_valid(connection: Connection, name: str):
+    """True/False - индекс есть и (не)валиден (например, после прерванного CREATE INDEX CONCURRENTLY), None - индекса нет."""
+    return connection.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+    ).scalar()
+
+
+def pending_offline_migrations(connection: Connection) -> List[str]:
+    """Что еще должна сделать разовая миграция app/db/migrate.py: JSON-колонки и недостающие индексы."""
+    pending = [
+        f"{table}.{column} JSON -> JSONB"
+        for table, column in JSONB_COLUMNS
+        if column_data_type(connection, table, column) == "json"
+    ]
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            if not index_is_valid(connection, index.name):
+                pending.append(f"index {index.name}")
+    return pending
+
+
+def apply_schema_migrations(connection: Connection) -> None:
+    """
+    Быстрая часть доводки схемы существующей БД при старте: недостающие колонки.
+    Смена типов колонок и построение индексов на существующих таблицах при старте не выполняются
+    (это блокировало бы таблицы в каждом воркере) - для них пишется предупреждение
+    с указанием запустить `python -m app.db.migrate`.
+    """
+    for table, column, column_type in SCHEMA_COLUMNS:
+        if column_data_type(connection, table, column) is None:
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+    pending = pending_offline_migrations(connection)
+    if pending:
+        print(
+            f"Database schema is behind the models ({', '.join(pending)}). "
+            "Run `python -m app.db.migrate` to convert columns and build indexes without downtime."
+        )
@@ -0,0 +1,172 @@
+"""
+Разовая миграция существующей БД: то, что нельзя делать при старте каждого воркера.
+
+- перевод JSON-колонок в JSONB (таблица переписывается под эксклюзивной блокировкой:
+  запись и чтение таблицы ждут до конца перевода, на больших таблицах - окно обслуживания);
+- построение индексов из моделей через CREATE INDEX CONCURRENTLY (без блокировки записи);
+- удаление индексов, замененных составными;
+- отчет о клиентах без отпечатка API ключа (см. AUTH_LEGACY_KEY_SCAN_ENABLED).
+
+Запуск: python -m app.db.migrate (в docker compose: docker compose exec backend python -m app.db.migrate).
+Повторный запуск безопасен: выполняется только то, что еще не сделано.
+"""
+import re
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex, Index
+from sqlmodel import SQLModel
+
+from app.db.database import engine
+from app.db.init_db import JSONB_COLUMNS, column_data_type, index_is_valid, pending_offline_migrations
+
+# Ключ pg_advisory_lock: две миграции одновременно не выполняются
+MIGRATION_LOCK_ID = 7302841002
+
+# Одиночные индексы, замененные составными (см. app/models/event.py и command.py);
+# удаляются после построения новых, чтобы запросы не остались без индекса
+OBSOLETE_INDEXES = [
+    "ix_securityevent_event_type",
+    "ix_securityevent_severity",
+    "ix_securityevent_timestamp",
+    "ix_securityevent_client_id",
+    "ix_command_status",
+    "ix_command_client_id",
+    "ix_command_pending_client_id_created_at", # Заменен ix_command_pending_client_id_priority_deadline
+]
+
+CREATE_INDEX_PATTERN = re.compile(r"^CREATE (UNIQUE )?INDEX (\S+) ON (\S+) ")
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+    ).scalar()
+    return relkind == "p"
+
+
+def list_partitions(connection: Connection, table: str) -> List[str]:
+    rows = connection.execute(
+        text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:table)"),
+        {"table": table},
+    )
+    return [row[0] for row in rows]
+
+
+def has_attached_index(connection: Connection, parent_index: str, partition: str) -> bool:
+    """Есть ли у секции индекс, уже подключенный к индексу родительской таблицы."""
+    return connection.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_inherits JOIN pg_index ON pg_index.indexrelid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:parent_index) AND pg_index.indrelid = to_regclass(:partition))"
+        ),
+        {"parent_index": parent_index, "partition": partition},
+    ).scalar()
+
+
+def create_index_ddl(index: Index, *, name: str, table: str, concurrently: bool = False, only: bool = False) -> str:
+    """DDL индекса из модели с другим именем/таблицей (для секций) и опциями CONCURRENTLY / ON ONLY."""
+    ddl = str(CreateIndex(index).compile(dialect=engine.dialect)).strip()
+    match = CREATE_INDEX_PATTERN.match(ddl)
+    if match is None:
+        raise ValueError(f"Unexpected index DDL: {ddl}")
+    unique = match.group(1) or ""
+    prefix = f"CREATE {unique}INDEX {'CONCURRENTLY ' if concurrently else ''}{name} ON {'ONLY ' if only else ''}{table} "
+    return prefix + ddl[match.end():]
+
+
+def build_index_concurrently(connection: Connection, index: Index, *, name: str, table: str) -> None:
+    """CREATE INDEX CONCURRENTLY; невалидный остаток прерванной попытки сначала удаляется."""
+    if index_is_valid(connection, name) is False:
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    if index_is_valid(connection, name) is None:
+        print(f"Building index {name} on {table}")
+        connection.execute(text(create_index_ddl(index, name=name, table=table, concurrently=True)))
+
+
+def build_partitioned_index(connection: Connection, index: Index) -> None:
+    """
+    На секционированной таблице CONCURRENTLY не поддерживается: создается индекс только
+    на родительской таблице (ON ONLY, невалидный), затем индекс каждой секции строится
+    CONCURRENTLY и подключается ATTACH PARTITION. Когда подключены все секции, индекс родителя
+    становится валидным.
+    """
+    table = index.table.name
+    if index_is_valid(connection, index.name) is None:
+        connection.execute(text(create_index_ddl(index, name=index.name, table=table, only=True)))
+    for partition in list_partitions(connection, table):
+        if has_attached_index(connection, index.name, partition):
+            continue
+        suffix = partition[len(table):] if partition.startswith(table) else f"_{partition}"
+        partition_index = f"{index.name}{suffix}"[:MAX_IDENTIFIER_LENGTH]
+        build_index_concurrently(connection, index, name=partition_index, table=partition)
+        connection.execute(text(f"ALTER INDEX {index.name} ATTACH PARTITION {partition_index}"))
+
+
+def convert_json_columns() -> None:
+    for table, column in JSONB_COLUMNS:
+        with engine.begin() as connection:
+            if column_data_type(connection, table, column) == "json":
+                print(f"Converting {table}.{column} to JSONB (table is locked until done)")
+                connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb"))
+
+
+def build_indexes(connection: Connection) -> None:
+    for table in SQLModel.metadata.sorted_tables:
+        partitioned = is_partitioned(connection, table.name)
+        for index in table.indexes:
+            if index_is_valid(connection, index.name):
+                continue
+            if partitioned:
+                build_partitioned_index(connection, index)
+            else:
+                build_index_concurrently(connection, index, name=index.name, table=table.name)
+
+
+def drop_obsolete_indexes(connection: Connection) -> None:
+    for name in OBSOLETE_INDEXES:
+        if index_is_valid(connection, name) is None:
+            continue
+        table = connection.execute(
+            text("SELECT indrelid::regclass::text FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+        ).scalar()
+        # DROP INDEX CONCURRENTLY недоступен для индексов секционированных таблиц
+        concurrently = "" if is_partitioned(connection, table) else "CONCURRENTLY "
+        print(f"Dropping obsolete index {name}")
+        connection.execute(text(f"DROP INDEX {concurrently}IF EXISTS {name}"))
+
+
+def count_legacy_api_keys(connection: Connection) -> int:
+    """Клиенты без отпечатка API ключа: отпечаток не вычислить без самого ключа, только при его предъявлении."""
+    return connection.execute(text("SELECT count(*) FROM client WHERE api_key_fingerprint IS NULL")).scalar()
+
+
+def run_migrations() -> None:
+    import app.models # noqa: F401 - регистрирует таблицы в SQLModel.metadata
+
+    # CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_ID})
+        try:
+            convert_json_columns()
+            build_indexes(connection)
+            drop_obsolete_indexes(connection)
+            pending = pending_offline_migrations(connection)
+            legacy_api_keys = count_legacy_api_keys(connection)
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_ID})
+    if pending:
+        print(f"Migration incomplete: {', '.join(pending)}")
+    else:
+        print("Database schema is up to date.")
+    if legacy_api_keys:
+        print(
+            f"{legacy_api_keys} client(s) have no API key fingerprint: keep AUTH_LEGACY_KEY_SCAN_ENABLED on until "
+            "they authenticate once, or reissue their keys (POST /admin/clients/{id}/api-key), then turn it off."
+        )
+
+
+if __name__ == "__main__":
+    run_migrations()
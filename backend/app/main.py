@@ -2,8 +2,15 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
 from app.core.config import settings
-from app.db.database import create_db_and_tables
+from app.db.database import create_db_and_tables, async_engine
 from app.api.v1.api_v1 import api_router as api_v1_router
+from app.services.event_ingest import event_ingest_queue
+from app.services.event_partitions import event_partition_maintenance
+from app.services.event_rollups import event_rollup_pruning
+from app.services.command_notifier import command_notifier
+from app.services.agent_credentials import agent_credentials_check
+from app.services.heartbeat_buffer import heartbeat_flush
+from app.services.liveness_sweeper import liveness_sweep
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -11,8 +18,29 @@ async def lifespan(app: FastAPI):
     print("Creating database and tables if they don't exist...")
     create_db_and_tables()
     print("Database and tables should be ready.")
+    # Секции событий нужны до первой записи: первый проход выполняется сразу
+    await event_partition_maintenance.run_once()
+    event_partition_maintenance.start()
+    event_rollup_pruning.start()
+    event_ingest_queue.start()
+    command_notifier.start()
+    heartbeat_flush.start()
+    liveness_sweep.start()
+    agent_credentials_check.start()
     yield
     print("Application shutdown...")
+    print("Flushing queued security events...")
+    await event_ingest_queue.stop()
+    await event_partition_maintenance.stop()
+    await event_rollup_pruning.stop()
+    await command_notifier.stop()
+    await liveness_sweep.stop()
+    await agent_credentials_check.stop()
+    await heartbeat_flush.stop()
+    print("Flushing buffered heartbeats...")
+    await heartbeat_flush.run_once()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 
 app = FastAPI(
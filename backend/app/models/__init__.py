@@ -1,9 +1,23 @@
-from .client import Client, ClientCreate, ClientRead, ClientReadWithApiKey, ClientUpdate
-from .event import SecurityEvent, SecurityEventCreate, SecurityEventRead
-from .command import Command, CommandCreate, CommandRead, CommandUpdateByClient, CommandUpdateByAdmin
+from .client import Client, ClientCreate, ClientHeartbeatRead, ClientRead, ClientReadWithApiKey, ClientUpdate
+from .event import (
+    SecurityEvent, SecurityEventCreate, SecurityEventRead, SecurityEventBatchAccepted, SecurityEventRollup,
+    SecurityEventLineError, SecurityEventStreamAccepted,
+    SecurityEventField, StatsBucket, EventStatsDimension, SecurityEventStatsRow,
+)
+from .command import (
+    Command, CommandCreate, CommandRead, CommandClientStatus, CommandUpdateByClient, CommandUpdateByAdmin,
+    CommandStatusUpdateItem, CommandStatusUpdateResult,
+    CommandBroadcastTarget, CommandBroadcastCreate, CommandCampaignRead,
+    CommandField, CommandStatsDimension, CommandStatsRow,
+)
 
 __all__ = [
-    "Client", "ClientCreate", "ClientRead", "ClientReadWithApiKey", "ClientUpdate",
-    "SecurityEvent", "SecurityEventCreate", "SecurityEventRead",
-    "Command", "CommandCreate", "CommandRead", "CommandUpdateByClient", "CommandUpdateByAdmin",
+    "Client", "ClientCreate", "ClientHeartbeatRead", "ClientRead", "ClientReadWithApiKey", "ClientUpdate",
+    "SecurityEvent", "SecurityEventCreate", "SecurityEventRead", "SecurityEventBatchAccepted", "SecurityEventRollup",
+    "SecurityEventLineError", "SecurityEventStreamAccepted",
+    "SecurityEventField", "StatsBucket", "EventStatsDimension", "SecurityEventStatsRow",
+    "Command", "CommandCreate", "CommandRead", "CommandClientStatus", "CommandUpdateByClient", "CommandUpdateByAdmin",
+    "CommandStatusUpdateItem", "CommandStatusUpdateResult",
+    "CommandBroadcastTarget", "CommandBroadcastCreate", "CommandCampaignRead",
+    "CommandField", "CommandStatsDimension", "CommandStatsRow",
 ]
\ No newline at end of file
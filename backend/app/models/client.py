@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime, timezone
 from typing import Optional, List
-from sqlmodel import Field, SQLModel, Relationship
+from sqlmodel import Field, SQLModel, Relationship, Index
 
 # Для предотвращения циклических импортов при определении связей
 from typing import TYPE_CHECKING
@@ -14,12 +14,15 @@ class ClientBase(SQLModel):
     client_name: str = Field(unique=True, index=True, max_length=255)
     ip_address: Optional[str] = Field(default=None, max_length=45) # IPv4 or IPv6
     os_info: Optional[str] = Field(default=None, max_length=255)
-    status: str = Field(default="inactive", max_length=50) # e.g., "active", "inactive", "maintenance"
+    status: str = Field(default="inactive", max_length=50) # e.g., "active", "offline" (нет heartbeat), "inactive", "maintenance"
 
 
 class Client(ClientBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, index=True, nullable=False)
     api_key_hash: str = Field(unique=True, nullable=False) # Хешированный API ключ
+    # HMAC-SHA256 отпечаток ключа для поиска клиента одним запросом.
+    # NULL у клиентов, зарегистрированных до появления колонки (заполняется при первой аутентификации)
+    api_key_fingerprint: Optional[str] = Field(default=None, unique=True, index=True, max_length=64)
     registered_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), nullable=False)
     last_heartbeat: Optional[datetime] = Field(default=None)
 
@@ -29,6 +32,10 @@ class Client(ClientBase, table=True):
     commands: List["Command"] = Relationship(back_populates="client", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
 
 
+# Список клиентов (get_clients) в порядке регистрации с keyset-пагинацией
+Index("ix_client_registered_at_id", Client.registered_at, Client.id)
+
+
 class ClientCreate(ClientBase):
     # При создании клиента API ключ генерируется отдельно и хешируется
     # client_name обязателен
@@ -42,6 +49,13 @@ class ClientRead(ClientBase):
     # Не отдаем api_key_hash наружу
 
 
+class ClientHeartbeatRead(SQLModel): # Ответ на heartbeat: строится без чтения записи клиента из БД
+    id: uuid.UUID
+    client_name: str
+    status: str
+    last_heartbeat: datetime
+
+
 class ClientReadWithApiKey(ClientRead): # Специальная схема для ответа после создания клиента
     api_key: str # Нехешированный ключ, который отдается клиенту ОДИН РАЗ
 
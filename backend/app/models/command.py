@@ -1,7 +1,8 @@
 import uuid
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any
-from sqlmodel import Field, SQLModel, Relationship, Column, JSON
+from typing import Optional, Dict, Any, List, Literal
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Field, SQLModel, Relationship, Column, Index
 
 # Для предотвращения циклических импортов
 from typing import TYPE_CHECKING
@@ -11,11 +12,13 @@ if TYPE_CHECKING:
 
 class CommandBase(SQLModel):
     command_type: str = Field(max_length=100) # e.g., "block_ip", "run_script"
-    payload: Optional[Dict[str, Any]] = Field(default_factory=dict, sa_column=Column(JSON))
-    status: str = Field(default="pending_dispatch", index=True, max_length=50) 
+    payload: Optional[Dict[str, Any]] = Field(default_factory=dict, sa_column=Column(JSONB))
+    status: str = Field(default="pending_dispatch", max_length=50) 
     # e.g., "pending_dispatch", "dispatched", "acknowledged", "in_progress", "completed", "failed", "timeout"
-    dispatch_deadline: Optional[datetime] = Field(default=None)
-    
+    dispatch_deadline: Optional[datetime] = Field(default=None) # Не выданная к этому времени команда получает "timeout"
+    priority: int = Field(default=0) # Команды с большим приоритетом выдаются раньше
+    not_before: Optional[datetime] = Field(default=None) # Отложенная команда: не выдается раньше этого времени
+
 
 
 class Command(CommandBase, table=True):
@@ -28,8 +31,45 @@ class Command(CommandBase, table=True):
     )
     execution_result: Optional[str] = Field(default=None) # Краткий результат или ошибка
 
-    client_id: uuid.UUID = Field(foreign_key="client.id", index=True, nullable=False)
+    client_id: uuid.UUID = Field(foreign_key="client.id", nullable=False)
     client: Optional["Client"] = Relationship(back_populates="commands")
+    # Команды, созданные одной рассылкой (POST /admin/commands/broadcast)
+    campaign_id: Optional[uuid.UUID] = Field(default=None)
+
+
+# Выдача команд агенту (claim_pending_commands): частичный индекс только по ожидающим командам,
+# он остается маленьким, сколько бы выполненных команд ни накопилось. Порядок колонок совпадает
+# с порядком выдачи (приоритет, ближайший срок, время создания), поэтому выборка первых N команд
+# клиента читает начало диапазона индекса без сортировки
+Index(
+    "ix_command_pending_client_id_priority_deadline",
+    Command.client_id, Command.priority.desc(), Command.dispatch_deadline.asc().nulls_last(), Command.created_at,
+    postgresql_where=Command.status == "pending_dispatch",
+)
+# Поиск просроченных ожидающих команд фоновой проверкой (time_out_overdue_commands)
+Index(
+    "ix_command_pending_dispatch_deadline",
+    Command.dispatch_deadline,
+    postgresql_where=(Command.status == "pending_dispatch") & Command.dispatch_deadline.is_not(None),
+)
+Index("ix_command_client_id_status_created_at", Command.client_id, Command.status, Command.created_at)
+# Прогресс рассылки (get_campaign_status_counts): GROUP BY status по командам одной рассылки
+Index(
+    "ix_command_campaign_id_status",
+    Command.campaign_id, Command.status,
+    postgresql_where=Command.campaign_id.is_not(None),
+)
+# Список команд в админке (get_all_commands): сортировка (created_at DESC, id DESC) с фильтрами
+Index("ix_command_created_at_id", Command.created_at.desc(), Command.id.desc())
+Index("ix_command_client_id_created_at_id", Command.client_id, Command.created_at.desc(), Command.id.desc())
+Index("ix_command_status_created_at_id", Command.status, Command.created_at.desc(), Command.id.desc())
+# Поиск по содержимому payload (payload_contains, оператор @>), например всех команд для одного IP
+Index(
+    "ix_command_payload_gin",
+    Command.payload,
+    postgresql_using="gin",
+    postgresql_ops={"payload": "jsonb_path_ops"},
+)
 
 
 class CommandCreate(CommandBase):
@@ -42,14 +82,71 @@ class CommandRead(CommandBase):
     created_at: datetime
     updated_at: datetime
     execution_result: Optional[str]
+    campaign_id: Optional[uuid.UUID] = None
+
+
+class CommandBroadcastTarget(SQLModel): # Кому рассылается команда; условия объединяются через И
+    client_ids: Optional[List[uuid.UUID]] = None
+    client_status: Optional[str] = None # Например, "active"
+    os_info_contains: Optional[str] = None # Подстрока os_info без учета регистра
+    client_name_like: Optional[str] = None # Шаблон SQL LIKE, например "web-%"
+    all_clients: bool = False # Явное согласие на рассылку всем клиентам без условий
+
+
+class CommandBroadcastCreate(SQLModel): # Одна команда для группы клиентов
+    command_type: str = Field(max_length=100)
+    payload: Optional[Dict[str, Any]] = Field(default_factory=dict)
+    dispatch_deadline: Optional[datetime] = None
+    priority: int = 0
+    not_before: Optional[datetime] = None
+    target: CommandBroadcastTarget
+
+
+class CommandCampaignRead(SQLModel): # Прогресс рассылки: число команд в каждом статусе
+    campaign_id: uuid.UUID
+    total: int
+    status_counts: Dict[str, int]
+
+
+# Статусы, которые может выставить клиент; остальные ("pending_dispatch", "dispatched", "timeout") выставляет сервер
+CommandClientStatus = Literal["acknowledged", "in_progress", "completed", "failed"]
 
 
 class CommandUpdateByClient(SQLModel): # Схема для обновления статуса клиентом
-    status: str
+    status: CommandClientStatus
     execution_result: Optional[str] = None
 
 
+class CommandStatusUpdateItem(CommandUpdateByClient): # Элемент пакетного обновления статусов (PATCH /commands)
+    command_id: uuid.UUID
+
+
+class CommandStatusUpdateResult(SQLModel): # Результат по каждому элементу пакетного обновления
+    command_id: uuid.UUID
+    updated: bool
+    status: Optional[str] = None # Статус команды после обработки элемента
+    error: Optional[str] = None
+
+
 class CommandUpdateByAdmin(SQLModel): # Схема для админа (если нужно что-то специфичное)
     status: Optional[str] = None
     payload: Optional[Dict[str, Any]] = None
-    dispatch_deadline: Optional[datetime] = None
\ No newline at end of file
+    dispatch_deadline: Optional[datetime] = None
+    priority: Optional[int] = None
+    not_before: Optional[datetime] = None
+
+# Колонки, которые можно запросить в GET /admin/commands?fields=... (id и created_at отдаются всегда)
+CommandField = Literal[
+    "id", "client_id", "campaign_id", "command_type", "payload", "status", "priority",
+    "created_at", "updated_at", "not_before", "dispatch_deadline", "execution_result",
+]
+
+CommandStatsDimension = Literal["client_id", "command_type", "status"]
+
+
+class CommandStatsRow(SQLModel): # Число команд в группе (время - по created_at); поля вне группировки - None
+    bucket: Optional[datetime] = None
+    client_id: Optional[uuid.UUID] = None
+    command_type: Optional[str] = None
+    status: Optional[str] = None
+    count: int
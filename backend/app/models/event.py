@@ -1,7 +1,9 @@
 import uuid
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any
-from sqlmodel import Field, SQLModel, Relationship, Column, JSON
+from typing import Optional, Dict, Any, List, Literal
+from pydantic import field_validator
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import Field, SQLModel, Relationship, Column, Index, BigInteger
 
 # Для предотвращения циклических импортов
 from typing import TYPE_CHECKING
@@ -10,27 +12,114 @@ if TYPE_CHECKING:
 
 
 class SecurityEventBase(SQLModel):
-    event_type: str = Field(index=True, max_length=100) # e.g., "login_failure", "sql_injection_attempt"
-    severity: str = Field(index=True, max_length=50)    # e.g., "low", "medium", "high", "critical"
+    event_type: str = Field(max_length=100) # e.g., "login_failure", "sql_injection_attempt"
+    severity: str = Field(max_length=50)    # e.g., "low", "medium", "high", "critical"
     source_ip: Optional[str] = Field(default=None, max_length=45)
-    details: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON)) # Хранение произвольных JSON данных
+    details: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSONB)) # Произвольные JSON данные (JSONB)
     db_name_target: Optional[str] = Field(default=None, max_length=255)
 
 
 class SecurityEvent(SecurityEventBase, table=True):
+    # Таблица секционирована по времени события; секции создаются и удаляются
+    # фоновой задачей (app/services/event_partitions.py). Ключ секционирования
+    # обязан входить в первичный ключ, поэтому он составной: (id, timestamp).
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True, index=True, nullable=False)
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True, nullable=False)
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), primary_key=True, nullable=False)
     
-    client_id: uuid.UUID = Field(foreign_key="client.id", index=True, nullable=False)
+    client_id: uuid.UUID = Field(foreign_key="client.id", nullable=False)
     client: Optional["Client"] = Relationship(back_populates="events")
 
 
+# Составные индексы под запросы лога (get_events): фильтр по одному полю + сортировка
+# по (timestamp DESC, id DESC), включая keyset-пагинацию. Заменяют одиночные индексы
+# на event_type, severity, timestamp и client_id.
+Index("ix_securityevent_timestamp_id", SecurityEvent.timestamp.desc(), SecurityEvent.id.desc())
+Index("ix_securityevent_client_id_timestamp_id", SecurityEvent.client_id, SecurityEvent.timestamp.desc(), SecurityEvent.id.desc())
+Index("ix_securityevent_event_type_timestamp_id", SecurityEvent.event_type, SecurityEvent.timestamp.desc(), SecurityEvent.id.desc())
+Index("ix_securityevent_severity_timestamp_id", SecurityEvent.severity, SecurityEvent.timestamp.desc(), SecurityEvent.id.desc())
+# Поиск по содержимому details (details_contains, оператор @>). jsonb_path_ops поддерживает
+# только @>, зато индекс заметно меньше и быстрее стандартного jsonb_ops
+Index(
+    "ix_securityevent_details_gin",
+    SecurityEvent.details,
+    postgresql_using="gin",
+    postgresql_ops={"details": "jsonb_path_ops"},
+)
+
+
+class SecurityEventRollup(SQLModel, table=True):
+    # Предсчитанное число событий за минуту/час в разрезе (client_id, event_type, severity).
+    # Пополняется в той же транзакции, что и вставка событий (crud_event.insert_event_rows);
+    # агрегаты для графиков читаются отсюда, а не из сырых событий.
+    bucket_size: str = Field(primary_key=True, max_length=10) # "minute" или "hour"
+    bucket_start: datetime = Field(primary_key=True) # Начало интервала (UTC)
+    client_id: uuid.UUID = Field(primary_key=True)
+    event_type: str = Field(primary_key=True, max_length=100)
+    severity: str = Field(primary_key=True, max_length=50)
+    count: int = Field(default=0, sa_column=Column(BigInteger, nullable=False))
+
+
+def _contains_nul(value: Any) -> bool:
+    if isinstance(value, str):
+        return "\x00" in value
+    if isinstance(value, dict):
+        return any(_contains_nul(key) or _contains_nul(item) for key, item in value.items())
+    if isinstance(value, list):
+        return any(_contains_nul(item) for item in value)
+    return False
+
+
 class SecurityEventCreate(SecurityEventBase):
     # client_id будет взят из аутентифицированного клиента (его API ключа)
     timestamp: Optional[datetime] = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+    @field_validator("event_type", "severity", "source_ip", "db_name_target", "details")
+    @classmethod
+    def reject_nul_characters(cls, value: Any) -> Any:
+        # Postgres не хранит символ NUL (\u0000) ни в text, ни в jsonb: такая строка
+        # отвергалась бы при каждой попытке записи
+        if _contains_nul(value):
+            raise ValueError("NUL (\\u0000) characters are not allowed")
+        return value
+
 
 class SecurityEventRead(SecurityEventBase):
     id: uuid.UUID
     timestamp: datetime
-    client_id: uuid.UUID
\ No newline at end of file
+    client_id: uuid.UUID
+
+
+class SecurityEventBatchAccepted(SQLModel): # Ответ на прием пачки событий без записи "на месте"
+    batch_id: uuid.UUID
+    accepted: int
+
+
+class SecurityEventLineError(SQLModel): # Отклоненная строка NDJSON-потока
+    line: int # Номер строки (с 1)
+    error: str
+
+
+class SecurityEventStreamAccepted(SQLModel): # Итог потокового приема NDJSON (POST /events/ndjson)
+    lines: int
+    accepted: int # Записано в БД
+    rejected: int
+    errors: List[SecurityEventLineError] # Первые EVENT_STREAM_INGEST_MAX_REPORTED_ERRORS ошибок
+
+
+# Колонки, которые можно запросить в GET /admin/events?fields=... (id и timestamp отдаются всегда)
+SecurityEventField = Literal["id", "timestamp", "client_id", "event_type", "severity", "source_ip", "db_name_target", "details"]
+
+
+# Агрегаты для графиков админки (GET /admin/stats/...)
+StatsBucket = Literal["minute", "hour", "day"] # Шаг временной шкалы (date_trunc)
+EventStatsDimension = Literal["client_id", "event_type", "severity"]
+
+
+class SecurityEventStatsRow(SQLModel): # Число событий в группе; поля вне группировки - None
+    bucket: Optional[datetime] = None
+    client_id: Optional[uuid.UUID] = None
+    event_type: Optional[str] = None
+    severity: Optional[str] = None
+    count: int
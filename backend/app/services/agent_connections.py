@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from uuid import UUID
+
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.status import WS_1008_POLICY_VIOLATION
+
+
+class AgentConnection:
+    """Открытый WebSocket агента. Отправка сериализуется: команды и ответы пишутся из разных задач."""
+
+    __slots__ = ("client_id", "key_fingerprint", "websocket", "close_code", "_send_lock")
+
+    def __init__(self, client_id: UUID, key_fingerprint: str, websocket: WebSocket):
+        self.client_id = client_id
+        self.key_fingerprint = key_fingerprint # Отпечаток ключа, с которым агент подключился
+        self.websocket = websocket
+        self.close_code: Optional[int] = None # Соединение закрыто сервером с этим кодом
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            if self.close_code is not None:
+                raise WebSocketDisconnect(self.close_code)
+            await self.websocket.send_json(message)
+
+    async def close(self, code: int, reason: str = "") -> None:
+        """Закрывает соединение со стороны сервера; прием сообщений агента завершится сам."""
+        async with self._send_lock:
+            if self.close_code is not None:
+                return
+            self.close_code = code
+            try:
+                await self.websocket.close(code=code, reason=reason)
+            except (RuntimeError, WebSocketDisconnect, OSError):
+                pass # Агент уже отключился
+
+
+class AgentConnectionRegistry:
+    """
+    Реестр постоянных соединений агентов в этом воркере.
+    На простаивающее соединение приходится объект AgentConnection и две ожидающие
+    задачи (прием сообщений и доставка команд); сессия БД берется только на время
+    обработки сообщения, поэтому число соединений не ограничено пулом БД.
+    """
+
+    def __init__(self):
+        self._connections: Dict[UUID, Set[AgentConnection]] = {}
+        self.total_connections = 0
+        self.messages_received = 0
+        self.messages_sent = 0
+        self.commands_pushed = 0
+        self.closed_by_server = 0 # Закрыты из-за отзыва ключа или блокировки клиента
+
+    def register(self, client_id: UUID, key_fingerprint: str, websocket: WebSocket) -> AgentConnection:
+        connection = AgentConnection(client_id, key_fingerprint, websocket)
+        self._connections.setdefault(client_id, set()).add(connection)
+        self.total_connections += 1
+        return connection
+
+    def unregister(self, connection: AgentConnection) -> None:
+        connections = self._connections.get(connection.client_id)
+        if connections is None:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self._connections[connection.client_id]
+
+    async def close_client(self, client_id: UUID, reason: str) -> int:
+        """
+        Закрывает все соединения клиента в этом воркере с кодом 1008 (ключ отозван, клиент
+        заблокирован). Соединения в других воркерах закроет перепроверка ключа
+        (app/services/agent_credentials.py). Возвращает число закрытых соединений.
+        """
+        connections = list(self._connections.get(client_id, ()))
+        for connection in connections:
+            await connection.close(code=WS_1008_POLICY_VIOLATION, reason=reason)
+        self.closed_by_server += len(connections)
+        return len(connections)
+
+    async def close_revoked(self, credentials: Dict[UUID, Tuple[Optional[str], str]], allowed_statuses: Sequence[str]) -> int:
+        """
+        Закрывает с кодом 1008 соединения, ключ которых сменен, или клиент которых
+        заблокирован (статус не из allowed_statuses) или удален (нет в credentials).
+        credentials - client_id -> (api_key_fingerprint, status). Возвращает число закрытых соединений.
+        """
+        revoked = []
+        for client_id, connections in self._connections.items():
+            api_key_fingerprint, client_status = credentials.get(client_id, (None, None))
+            revoked.extend(
+                connection for connection in connections
+                if connection.key_fingerprint != api_key_fingerprint or client_status not in allowed_statuses
+            )
+        for connection in revoked:
+            await connection.close(code=WS_1008_POLICY_VIOLATION, reason="API key revoked or client disabled")
+        self.closed_by_server += len(revoked)
+        return len(revoked)
+
+    def client_ids(self) -> List[UUID]:
+        return list(self._connections)
+
+    def is_connected(self, client_id: UUID) -> bool:
+        return client_id in self._connections
+
+    def stats(self) -> dict:
+        return {
+            "connected_clients": len(self._connections),
+            "connections": sum(len(connections) for connections in self._connections.values()),
+            "total_connections": self.total_connections,
+            "messages_received": self.messages_received,
+            "messages_sent": self.messages_sent,
+            "commands_pushed": self.commands_pushed,
+            "closed_by_server": self.closed_by_server,
+        }
+
+
+agent_connections = AgentConnectionRegistry()
@@ -0,0 +1,43 @@
+from app.api.deps import ALLOWED_CLIENT_STATUSES
+from app.core.config import settings
+from app.crud import crud_client
+from app.db.database import run_in_new_session
+from app.services.agent_connections import agent_connections
+from app.services.periodic import PeriodicTask
+
+
+class AgentCredentialsChecker:
+    """
+    Перепроверка ключей открытых соединений агентов: одним запросом на воркер для всех
+    подключенных клиентов раз в AGENT_WS_REAUTH_INTERVAL_SECONDS. Закрывает соединения,
+    ключ которых сменен или клиент которых заблокирован или удален. В воркере, выполнившем
+    смену ключа или статуса, соединения закрываются сразу (agent_connections.close_client),
+    перепроверка нужна для остальных воркеров.
+    """
+
+    def __init__(self):
+        self.connections_closed = 0
+
+    async def check(self) -> dict:
+        client_ids = agent_connections.client_ids()
+        if not client_ids:
+            return {"clients_checked": 0, "connections_closed": 0}
+        credentials = await run_in_new_session(crud_client.get_clients_credentials, client_ids=client_ids)
+        closed = await agent_connections.close_revoked(credentials, ALLOWED_CLIENT_STATUSES)
+        self.connections_closed += closed
+        return {"clients_checked": len(client_ids), "connections_closed": closed}
+
+    def stats(self) -> dict:
+        return {
+            "connections_closed": self.connections_closed,
+            "check": agent_credentials_check.stats(), # last_duration_ms и last_result - по последней проверке
+        }
+
+
+agent_credentials_checker = AgentCredentialsChecker()
+
+agent_credentials_check = PeriodicTask(
+    name="agent_credentials_check",
+    interval_seconds=settings.AGENT_WS_REAUTH_INTERVAL_SECONDS,
+    fn=agent_credentials_checker.check,
+)
@@ -0,0 +1,130 @@
+import asyncio
+from typing import Dict, Optional, Set
+from uuid import UUID
+
+import asyncpg
+
+from app.core.auth_cache import api_key_cache
+from app.core.config import settings
+from app.crud.crud_client import CLIENT_CREDENTIALS_CHANGED_CHANNEL
+from app.crud.crud_command import COMMAND_CREATED_CHANNEL
+
+LISTEN_RECONNECT_DELAY_SECONDS = 5.0
+
+
+class CommandNotifier:
+    """
+    Пробуждает ожидающие запросы агента (long-poll) при появлении для него новой команды.
+    Внутри процесса - asyncio.Event на каждого ожидающего; между воркерами - Postgres
+    LISTEN/NOTIFY: create_command отправляет NOTIFY с id клиента, слушатель каждого воркера
+    будит своих ожидающих.
+    То же соединение слушает смену ключа или статуса клиента (CLIENT_CREDENTIALS_CHANGED_CHANNEL)
+    и сбрасывает записи клиента в кэше ключей этого воркера.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[UUID, Set[asyncio.Event]] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+        self.listener_connected = False
+        self.notifications = 0
+        self.wakeups = 0
+        self.credential_invalidations = 0
+
+    def subscribe(self, client_id: UUID) -> asyncio.Event:
+        # Подписка оформляется до выборки команд, чтобы не потерять уведомление между ними
+        event = asyncio.Event()
+        self._waiters.setdefault(client_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, client_id: UUID, event: asyncio.Event) -> None:
+        waiters = self._waiters.get(client_id)
+        if waiters is None:
+            return
+        waiters.discard(event)
+        if not waiters:
+            del self._waiters[client_id]
+
+    def notify(self, client_id: UUID) -> None:
+        self.notifications += 1
+        for event in self._waiters.get(client_id, ()):
+            event.set()
+            self.wakeups += 1
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> bool:
+        """Ждет уведомления не дольше timeout секунд. True, если уведомление пришло."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def start(self) -> None:
+        if settings.COMMAND_NOTIFY_LISTEN_ENABLED and self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    def stats(self) -> dict:
+        return {
+            "waiting_clients": len(self._waiters),
+            "waiters": sum(len(waiters) for waiters in self._waiters.values()),
+            "notifications": self.notifications,
+            "wakeups": self.wakeups,
+            "credential_invalidations": self.credential_invalidations,
+            "listen_enabled": settings.COMMAND_NOTIFY_LISTEN_ENABLED,
+            "listener_connected": self.listener_connected,
+        }
+
+    def _on_notification(self, connection, pid, channel, payload: str) -> None:
+        try:
+            client_id = UUID(payload)
+        except ValueError:
+            print(f"Ignoring malformed {channel} notification: {payload!r}")
+            return
+        self.notify(client_id)
+
+    def _on_credentials_changed(self, connection, pid, channel, payload: str) -> None:
+        try:
+            client_id = UUID(payload)
+        except ValueError:
+            print(f"Ignoring malformed {channel} notification: {payload!r}")
+            return
+        api_key_cache.invalidate_client(client_id)
+        self.credential_invalidations += 1
+
+    async def _listen(self) -> None:
+        # Отдельное соединение вне пула: LISTEN действует, пока соединение открыто
+        while True:
+            try:
+                connection = await asyncpg.connect(
+                    user=settings.POSTGRES_USER,
+                    password=settings.POSTGRES_PASSWORD,
+                    host=settings.POSTGRES_SERVER,
+                    database=settings.POSTGRES_DB,
+                )
+                try:
+                    await connection.add_listener(COMMAND_CREATED_CHANNEL, self._on_notification)
+                    await connection.add_listener(CLIENT_CREDENTIALS_CHANGED_CHANNEL, self._on_credentials_changed)
+                    # Уведомления о смене ключей до подписки (или за время разрыва) потеряны
+                    api_key_cache.clear()
+                    self.listener_connected = True
+                    while not connection.is_closed():
+                        await asyncio.sleep(LISTEN_RECONNECT_DELAY_SECONDS)
+                finally:
+                    self.listener_connected = False
+                    await connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Command notification listener error: {e}")
+            await asyncio.sleep(LISTEN_RECONNECT_DELAY_SECONDS)
+
+
+command_notifier = CommandNotifier()
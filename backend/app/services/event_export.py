@@ -0,0 +1,151 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Sequence
+from uuid import UUID
+
+from sqlalchemy import RowMapping
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.crud import crud_event
+from app.db.database import engine
+
+try: # Parquet - только если установлен pyarrow (pip install pyarrow)
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Выгрузка событий потоком: строки читаются курсором на стороне сервера порциями
+# по EVENT_EXPORT_CHUNK_SIZE, каждая порция сразу кодируется и отдается клиенту,
+# так что память процесса не зависит от размера выгрузки.
+EXPORT_COLUMNS = ["id", "timestamp", "client_id", "event_type", "severity", "source_ip", "db_name_target", "details"]
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def parquet_available() -> bool:
+    return pyarrow is not None
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _ndjson_chunks(chunks: Iterator[Sequence[RowMapping]]) -> Iterator[bytes]:
+    for rows in chunks:
+        lines = [json.dumps({column: row[column] for column in EXPORT_COLUMNS}, default=_json_default) for row in rows]
+        yield ("\n".join(lines) + "\n").encode()
+
+
+def _csv_value(row: RowMapping, column: str) -> Any:
+    value = row[column]
+    if value is None:
+        return ""
+    if column == "details":
+        return json.dumps(value) # JSON-объект в одной ячейке
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_chunks(chunks: Iterator[Sequence[RowMapping]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        for row in rows:
+            writer.writerow([_csv_value(row, column) for column in EXPORT_COLUMNS])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _DrainableSink:
+    """Файл для ParquetWriter, из которого записанные байты забираются по мере записи."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position # Смещения в метаданных Parquet считаются от начала всего файла
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _parquet_schema():
+    return pyarrow.schema([
+        ("id", pyarrow.string()),
+        ("timestamp", pyarrow.timestamp("us", tz="UTC")),
+        ("client_id", pyarrow.string()),
+        ("event_type", pyarrow.string()),
+        ("severity", pyarrow.string()),
+        ("source_ip", pyarrow.string()),
+        ("db_name_target", pyarrow.string()),
+        ("details", pyarrow.string()), # JSON-строка
+    ])
+
+
+def _parquet_chunks(chunks: Iterator[Sequence[RowMapping]]) -> Iterator[bytes]:
+    schema = _parquet_schema()
+    sink = _DrainableSink()
+    writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode="w"), schema)
+    try:
+        for rows in chunks:
+            columns: Dict[str, list] = {
+                "id": [str(row["id"]) for row in rows],
+                "timestamp": [row["timestamp"] for row in rows],
+                "client_id": [str(row["client_id"]) for row in rows],
+                "event_type": [row["event_type"] for row in rows],
+                "severity": [row["severity"] for row in rows],
+                "source_ip": [row["source_ip"] for row in rows],
+                "db_name_target": [row["db_name_target"] for row in rows],
+                "details": [json.dumps(row["details"]) if row["details"] is not None else None for row in rows],
+            }
+            writer.write_table(pyarrow.table(columns, schema=schema)) # Одна порция - одна группа строк
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain() # Метаданные файла (footer)
+
+
+ENCODERS = {"ndjson": _ndjson_chunks, "csv": _csv_chunks, "parquet": _parquet_chunks}
+
+
+def export_events(export_format: str, **filters: Any) -> Iterator[bytes]:
+    """
+    Кодирует события по фильтрам crud_event.get_events в формат выгрузки порция за порцией.
+    Синхронный генератор: StreamingResponse выполняет его в пуле потоков, соединение БД
+    занято до конца выгрузки (или до разрыва соединения клиентом).
+    """
+    with Session(engine) as session:
+        chunks = crud_event.iter_events(session, chunk_size=settings.EVENT_EXPORT_CHUNK_SIZE, **filters)
+        yield from ENCODERS[export_format](chunks)
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional
+
+from app.core.config import settings
+from app.crud import crud_event
+from app.db.database import is_transient_db_error, run_in_new_session
+
+
+class IngestQueueFull(Exception):
+    """Очередь приема событий заполнена (или закрыта) - клиенту нужно повторить позже."""
+
+    def __init__(self, retry_after_seconds: int, shutting_down: bool = False):
+        super().__init__("Event ingest queue is full" if not shutting_down else "Event ingest queue is shutting down")
+        self.retry_after_seconds = retry_after_seconds
+        self.shutting_down = shutting_down
+
+
+@dataclass
+class _IngestBatch:
+    """Строки одного запроса агента. Пачки не склеиваются, чтобы при ошибке записи искать плохие строки внутри них."""
+    enqueued_at: float
+    rows: List[Dict[str, Any]]
+    attempts: int = 0 # Неудачных попыток записи из-за недоступности БД
+
+
+class EventIngestQueue:
+    """
+    Write-behind очередь событий безопасности.
+    Запросы агентов только кладут подготовленные строки в ограниченную очередь,
+    а фоновый воркер объединяет пачки многих запросов и пишет их большими INSERT
+    по достижении flush_size событий или через flush_interval секунд после первой пачки.
+
+    Ошибки записи:
+    - БД недоступна (is_transient_db_error): пачки возвращаются в начало очереди и пишутся снова
+      с растущей паузой, но не больше max_flush_attempts раз;
+    - ошибка данных (строку Postgres не примет никогда): пачки делятся пополам, пока
+      плохие строки не будут найдены; они откладываются (dead letter), остальные записываются.
+    Отложенные и отброшенные строки дописываются в dead_letter_file (NDJSON), если он задан.
+    """
+
+    def __init__(
+        self,
+        max_pending_events: int,
+        flush_size: int,
+        flush_interval_seconds: float,
+        max_flush_attempts: int = 20,
+        max_retry_delay_seconds: float = 30,
+        dead_letter_file: str = "",
+    ):
+        self.max_pending_events = max_pending_events
+        self.flush_size = flush_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_flush_attempts = max_flush_attempts
+        self.max_retry_delay_seconds = max_retry_delay_seconds
+        self.dead_letter_file = dead_letter_file
+        self._batches: Deque[_IngestBatch] = deque()
+        self._pending_events = 0 # В очереди + пишутся сейчас
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+        self.accepted_events = 0
+        self.rejected_events = 0
+        self.flushed_events = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.invalid_events = 0 # Отвергнуты БД (ошибка данных)
+        self.dropped_events = 0 # Не записаны: БД недоступна дольше max_flush_attempts или при остановке
+
+    @property
+    def retry_after_seconds(self) -> int:
+        return max(1, math.ceil(self.flush_interval_seconds))
+
+    def submit(self, rows: List[Dict[str, Any]]) -> None:
+        """Ставит строки событий в очередь. Бросает IngestQueueFull, если места нет."""
+        if self._closed:
+            raise IngestQueueFull(self.retry_after_seconds, shutting_down=True)
+        if self._pending_events + len(rows) > self.max_pending_events:
+            self.rejected_events += len(rows)
+            raise IngestQueueFull(self.retry_after_seconds)
+        self._batches.append(_IngestBatch(asyncio.get_running_loop().time(), rows))
+        self._pending_events += len(rows)
+        self.accepted_events += len(rows)
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._closed = False
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Перестает принимать события и дописывает все, что уже в очереди."""
+        self._closed = True
+        self._wakeup.set()
+        if self._worker is not None:
+            await self._worker
+            self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "pending_events": self._pending_events,
+            "queued_batches": len(self._batches),
+            "max_pending_events": self.max_pending_events,
+            "flush_size": self.flush_size,
+            "flush_interval_seconds": self.flush_interval_seconds,
+            "accepted_events": self.accepted_events,
+            "rejected_events": self.rejected_events,
+            "flushed_events": self.flushed_events,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "invalid_events": self.invalid_events,
+            "dropped_events": self.dropped_events,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await self._wait_for_flush()
+            if not self._batches: # Очередь закрыта и пуста
+                return
+            await self._flush(self._take_batches())
+
+    async def _wait_for_flush(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not self._closed:
+            if self._pending_events >= self.flush_size:
+                return
+            timeout = None
+            if self._batches:
+                first_enqueued_at = self._batches[0].enqueued_at
+                timeout = first_enqueued_at + self.flush_interval_seconds - loop.time()
+                if timeout <= 0:
+                    return
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _take_batches(self) -> List[_IngestBatch]:
+        batches: List[_IngestBatch] = []
+        taken_rows = 0
+        while self._batches and taken_rows < self.flush_size:
+            batch = self._batches.popleft()
+            batches.append(batch)
+            taken_rows += len(batch.rows)
+        return batches
+
+    async def _flush(self, batches: List[_IngestBatch]) -> None:
+        """
+        Пишет пачки одним INSERT. При ошибке данных делит их пополам (сначала по пачкам,
+        затем по строкам одной пачки), пока не останутся отдельные плохие строки.
+        """
+        parts = [batches]
+        while parts:
+            part = parts.pop()
+            rows = [row for batch in part for row in batch.rows]
+            try:
+                await run_in_new_session(crud_event.insert_event_rows, rows)
+            except Exception as e:
+                self.failed_flushes += 1
+                if is_transient_db_error(e):
+                    # Все, что еще не записано, - обратно в очередь (в исходном порядке)
+                    await self._retry_later(part + [batch for pending_part in reversed(parts) for batch in pending_part], e)
+                    return
+                if len(rows) == 1:
+                    self.invalid_events += 1
+                    self._dead_letter(rows, f"rejected by database: {_describe(e)}")
+                    continue
+                parts.extend(reversed(_split(part)))
+                continue
+            self._pending_events -= len(rows)
+            self.flushed_events += len(rows)
+            self.flushes += 1
+
+    async def _retry_later(self, batches: List[_IngestBatch], error: Exception) -> None:
+        if self._closed:
+            # При остановке не зацикливаемся на недоступной БД
+            rows = [row for batch in batches for row in batch.rows]
+            self.dropped_events += len(rows)
+            self._dead_letter(rows, f"dropped during shutdown: {_describe(error)}")
+            return
+        retried: List[_IngestBatch] = []
+        for batch in batches:
+            batch.attempts += 1
+            if batch.attempts >= self.max_flush_attempts:
+                self.dropped_events += len(batch.rows)
+                self._dead_letter(batch.rows, f"dropped after {batch.attempts} attempts: {_describe(error)}")
+            else:
+                retried.append(batch)
+        if not retried:
+            return
+        attempts = max(batch.attempts for batch in retried)
+        print(f"Error flushing {sum(len(batch.rows) for batch in retried)} events (attempt {attempts}), will retry: {_describe(error)}")
+        # Возвращаем пачки в начало очереди; пока БД недоступна, очередь
+        # заполняется и агенты получают отказ с Retry-After
+        self._batches.extendleft(reversed(retried))
+        await asyncio.sleep(min(self.max_retry_delay_seconds, self.flush_interval_seconds * 2 ** (attempts - 1)))
+
+    def _dead_letter(self, rows: List[Dict[str, Any]], reason: str) -> None:
+        """Убирает строки из очереди насовсем: в лог и, если задан, в файл dead_letter_file."""
+        self._pending_events -= len(rows)
+        print(f"Event ingest: {len(rows)} events not written, {reason}")
+        if not self.dead_letter_file:
+            return
+        try:
+            with open(self.dead_letter_file, "a", encoding="utf-8") as dead_letter:
+                for row in rows:
+                    dead_letter.write(json.dumps({"reason": reason, "event": row}, default=str) + "\n")
+        except OSError as e:
+            print(f"Error writing event ingest dead letter file {self.dead_letter_file}: {e}")
+
+
+def _describe(error: Exception) -> str:
+    """Первая строка ошибки (без SQL и параметров, которые SQLAlchemy добавляет в текст)."""
+    lines = str(error).splitlines()
+    return f"{type(error).__name__}: {lines[0] if lines else ''}"
+
+
+def _split(batches: List[_IngestBatch]) -> List[List[_IngestBatch]]:
+    """Делит часть очереди пополам: по пачкам, а единственную пачку - по строкам."""
+    if len(batches) > 1:
+        middle = len(batches) // 2
+        return [batches[:middle], batches[middle:]]
+    batch = batches[0]
+    middle = len(batch.rows) // 2
+    return [
+        [_IngestBatch(batch.enqueued_at, batch.rows[:middle], batch.attempts)],
+        [_IngestBatch(batch.enqueued_at, batch.rows[middle:], batch.attempts)],
+    ]
+
+
+event_ingest_queue = EventIngestQueue(
+    max_pending_events=settings.EVENT_INGEST_QUEUE_MAX_EVENTS,
+    flush_size=settings.EVENT_INGEST_FLUSH_SIZE,
+    flush_interval_seconds=settings.EVENT_INGEST_FLUSH_INTERVAL_SECONDS,
+    max_flush_attempts=settings.EVENT_INGEST_MAX_FLUSH_ATTEMPTS,
+    max_retry_delay_seconds=settings.EVENT_INGEST_MAX_RETRY_DELAY_SECONDS,
+    dead_letter_file=settings.EVENT_INGEST_DEAD_LETTER_FILE,
+)
@@ -0,0 +1,182 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db.database import engine
+from app.services.periodic import PeriodicTask
+
+# Таблица securityevent секционирована по RANGE (timestamp): секция на каждые
+# EVENT_PARTITION_INTERVAL_DAYS дней с именем securityevent_pYYYYMMDD (дата начала диапазона).
+# События вне созданных секций (старые данные агентов, сбитые часы) попадают в securityevent_default;
+# при создании секции подходящие строки переносятся в нее из секции по умолчанию,
+# а строки старше срока хранения удаляются из секции по умолчанию вместе с устаревшими секциями.
+EVENT_TABLE = "securityevent"
+PARTITION_PREFIX = f"{EVENT_TABLE}_p"
+DEFAULT_PARTITION = f"{EVENT_TABLE}_default"
+EPOCH = date(1970, 1, 1)
+
+
+def partition_start(day: date, interval_days: int) -> date:
+    """Начало диапазона секции, в которую попадает день (выравнивание от эпохи)."""
+    return day - timedelta(days=(day - EPOCH).days % interval_days)
+
+
+def partition_name(start: date) -> str:
+    return f"{PARTITION_PREFIX}{start:%Y%m%d}"
+
+
+def is_event_table_partitioned(connection: Connection) -> bool:
+    relkind = connection.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"), {"table": EVENT_TABLE}
+    ).scalar()
+    return relkind == "p"
+
+
+def list_event_partitions(connection: Connection) -> List[str]:
+    rows = connection.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": EVENT_TABLE},
+    )
+    return [row[0] for row in rows]
+
+
+def parse_partition_start(name: str) -> Optional[date]:
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def create_event_partition(connection: Connection, name: str, start: date, end: date) -> Optional[int]:
+    """
+    Создает секцию [start, end). Postgres не дает создать секцию, если в секции по умолчанию
+    уже есть строки из ее диапазона, поэтому секция создается отдельной таблицей, строки
+    переносятся в нее из секции по умолчанию и таблица подключается ATTACH PARTITION.
+    Блокировка секции по умолчанию не дает новым строкам диапазона попасть в нее до ATTACH
+    и упорядочивает создание секций несколькими воркерами.
+    Возвращает число перенесенных строк или None, если секцию уже создал другой воркер.
+    """
+    bounds = {"start": f"{start.isoformat()} 00:00+00", "end": f"{end.isoformat()} 00:00+00"}
+    connection.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE"))
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return None
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {EVENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE timestamp >= CAST(:start AS timestamptz) AND timestamp < CAST(:end AS timestamptz) RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        bounds,
+    ).rowcount
+    # Индексы и внешние ключи родительской таблицы создаются на секции при подключении
+    connection.execute(text(
+        f"ALTER TABLE {EVENT_TABLE} ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"
+    ))
+    return moved
+
+
+def ensure_event_partitions(today: date, interval_days: int, premake_days: int) -> List[str]:
+    """Создает секцию по умолчанию и секции от текущей до today + premake_days. Возвращает созданные."""
+    created = []
+    with engine.begin() as connection:
+        existing = set(list_event_partitions(connection))
+        if DEFAULT_PARTITION not in existing:
+            connection.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {EVENT_TABLE} DEFAULT"))
+            created.append(DEFAULT_PARTITION)
+
+    start = partition_start(today, interval_days)
+    last_start = partition_start(today + timedelta(days=premake_days), interval_days)
+    while start <= last_start:
+        name = partition_name(start)
+        if name not in existing:
+            end = start + timedelta(days=interval_days)
+            try:
+                # Каждая секция в своей транзакции: ошибка одной не откатывает остальные
+                with engine.begin() as connection:
+                    moved = create_event_partition(connection, name, start, end)
+                if moved is not None:
+                    created.append(name)
+                if moved:
+                    print(f"Moved {moved} events from {DEFAULT_PARTITION} to {name}")
+            except Exception as e:
+                print(f"Error creating event partition {name}: {e}")
+        start += timedelta(days=interval_days)
+    return created
+
+
+def drop_expired_event_partitions(today: date, interval_days: int, retention_days: int) -> List[str]:
+    """Удаляет секции, целиком старше срока хранения (DROP TABLE вместо DELETE). Возвращает удаленные."""
+    if retention_days <= 0:
+        return []
+    cutoff = today - timedelta(days=retention_days)
+    with engine.connect() as connection:
+        partitions = list_event_partitions(connection)
+    dropped = []
+    for name in sorted(partitions):
+        start = parse_partition_start(name)
+        if start is None or start + timedelta(days=interval_days) > cutoff:
+            continue
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        dropped.append(name)
+    return dropped
+
+
+def prune_default_partition(today: date, retention_days: int) -> int:
+    """Удаляет из секции по умолчанию строки старше срока хранения. Возвращает число удаленных строк."""
+    if retention_days <= 0:
+        return 0
+    cutoff = today - timedelta(days=retention_days)
+    with engine.begin() as connection:
+        if DEFAULT_PARTITION not in list_event_partitions(connection):
+            return 0
+        return connection.execute(
+            text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < CAST(:cutoff AS timestamptz)"),
+            {"cutoff": f"{cutoff.isoformat()} 00:00+00"},
+        ).rowcount
+
+
+def run_event_partition_maintenance() -> dict:
+    """Создает будущие секции и удаляет устаревшие согласно настройкам."""
+    with engine.connect() as connection:
+        if not is_event_table_partitioned(connection):
+            print(
+                f"Table {EVENT_TABLE} is not partitioned (created by an older version); "
+                "partition maintenance skipped. See README for the migration steps."
+            )
+            return {"partitioned": False}
+    today = datetime.now(timezone.utc).date()
+    created = ensure_event_partitions(
+        today, settings.EVENT_PARTITION_INTERVAL_DAYS, settings.EVENT_PARTITION_PREMAKE_DAYS
+    )
+    dropped = drop_expired_event_partitions(
+        today, settings.EVENT_PARTITION_INTERVAL_DAYS, settings.EVENT_RETENTION_DAYS
+    )
+    default_pruned = prune_default_partition(today, settings.EVENT_RETENTION_DAYS)
+    if created or dropped or default_pruned:
+        print(f"Event partitions created: {created}; dropped: {dropped}; expired rows deleted from default: {default_pruned}")
+    return {"partitioned": True, "created": created, "dropped": dropped, "default_pruned": default_pruned}
+
+
+async def _maintain_event_partitions() -> dict:
+    return await run_in_threadpool(run_event_partition_maintenance)
+
+
+event_partition_maintenance = PeriodicTask(
+    name="event_partition_maintenance",
+    interval_seconds=settings.EVENT_PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+    fn=_maintain_event_partitions,
+)
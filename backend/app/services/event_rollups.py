@@ -0,0 +1,61 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.crud import crud_event
+from app.db.database import engine, run_in_new_session
+from app.services.periodic import PeriodicTask
+
+# Сводка числа событий (securityeventrollup) пополняется при каждой вставке событий.
+# Здесь - удаление устаревшей поминутной сводки и пересчет сводки из сырых событий:
+#
+#   python -m app.services.event_rollups --start 2025-01-01T00:00:00+00:00 [--end ...]
+#
+# Пересчет нужен один раз после обновления (для событий, записанных до появления сводки)
+# и после ручного удаления/загрузки событий. Период обрабатывается по суткам, каждые сутки -
+# отдельная транзакция.
+REBUILD_STEP = timedelta(days=1)
+
+
+async def prune_minute_rollups() -> int:
+    before = datetime.now(timezone.utc) - timedelta(days=settings.EVENT_ROLLUP_MINUTE_RETENTION_DAYS)
+    return await run_in_new_session(crud_event.delete_expired_minute_rollups, before=before)
+
+
+event_rollup_pruning = PeriodicTask(
+    name="event_rollup_pruning",
+    interval_seconds=settings.EVENT_ROLLUP_PRUNE_INTERVAL_SECONDS,
+    fn=prune_minute_rollups,
+)
+
+
+def rebuild_event_rollups(start: datetime, end: Optional[datetime] = None) -> int:
+    """Пересчитывает сводку за [start, end) по суткам. По умолчанию end - начало текущего часа."""
+    end = end or datetime.now(timezone.utc)
+    written = 0
+    step_start = start
+    while step_start < end:
+        step_end = min(step_start + REBUILD_STEP, end)
+        with Session(engine) as session:
+            step_written = crud_event.rebuild_event_rollups(session, start=step_start, end=step_end)
+        written += step_written
+        print(f"Event rollups rebuilt for {step_start.isoformat()} - {step_end.isoformat()}: {step_written} rows")
+        step_start = step_end
+    return written
+
+
+def _parse_timestamp(value: str) -> datetime:
+    timestamp = datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo is not None else timestamp.replace(tzinfo=timezone.utc)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild event rollups from raw security events.")
+    parser.add_argument("--start", required=True, type=_parse_timestamp, help="Period start (ISO format, UTC if no offset)")
+    parser.add_argument("--end", type=_parse_timestamp, default=None, help="Period end (ISO format); defaults to now")
+    args = parser.parse_args()
+    total = rebuild_event_rollups(args.start, args.end)
+    print(f"Event rollups rebuilt: {total} rows")
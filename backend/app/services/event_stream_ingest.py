@@ -0,0 +1,184 @@
+import zlib
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from uuid import UUID
+
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.crud import crud_event
+from app.models.event import SecurityEventCreate, SecurityEventLineError, SecurityEventStreamAccepted
+
+try: # zstd - только если установлен zstandard (pip install zstandard)
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Потоковый прием событий (POST /events/ndjson): тело - NDJSON (одно событие SecurityEventCreate
+# на строку), по желанию сжатое gzip или zstd. Тело распаковывается, режется на строки
+# и проверяется по мере поступления; проверенные события пишутся в БД порциями по
+# EVENT_STREAM_INGEST_CHUNK_SIZE, не дожидаясь конца запроса.
+SUPPORTED_ENCODINGS = ("identity", "gzip", "zstd")
+DECOMPRESS_OUTPUT_LIMIT = 1024 * 1024 # Распакованных байт за один шаг (защита от "zip-бомб")
+# У decompressobj zstandard нет ограничения размера вывода, поэтому ограничивается вход шага:
+# блок zstd из 4 байт (RLE) распаковывается максимум в 128 КиБ, т.е. байт входа дает не больше 32 КиБ
+ZSTD_MAX_EXPANSION = 32 * 1024
+ZSTD_INPUT_STEP = DECOMPRESS_OUTPUT_LIMIT // ZSTD_MAX_EXPANSION
+
+
+class StreamDecodeError(Exception):
+    """Тело запроса не удалось распаковать. accepted - сколько событий до ошибки уже записано."""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.accepted = 0
+
+
+def encoding_available(encoding: str) -> bool:
+    return encoding in ("identity", "gzip") or (encoding == "zstd" and zstandard is not None)
+
+
+async def _gunzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    member_started = False
+    async for chunk in chunks:
+        data = chunk
+        while data:
+            member_started = True
+            try:
+                output = decompressor.decompress(data, DECOMPRESS_OUTPUT_LIMIT)
+            except zlib.error as e:
+                raise StreamDecodeError(f"Invalid gzip stream: {e}")
+            if output:
+                yield output
+            if decompressor.eof:
+                # Следующий gzip-член (склеенные файлы .gz)
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+                member_started = False
+            else:
+                data = decompressor.unconsumed_tail
+    if member_started:
+        raise StreamDecodeError("Truncated gzip stream")
+
+
+async def _unzstd(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    frame_started = False
+    async for chunk in chunks:
+        data = memoryview(chunk) # Шаги - срезы без копирования
+        while data:
+            frame_started = True
+            try:
+                output = decompressor.decompress(data[:ZSTD_INPUT_STEP])
+            except zstandard.ZstdError as e:
+                raise StreamDecodeError(f"Invalid zstd stream: {e}")
+            if output:
+                yield output
+            if decompressor.eof:
+                # Следующий zstd-кадр: остаток шага, не нужный этому кадру, и остаток куска
+                data = memoryview(decompressor.unused_data + data[ZSTD_INPUT_STEP:])
+                decompressor = zstandard.ZstdDecompressor().decompressobj()
+                frame_started = False
+            else:
+                data = data[ZSTD_INPUT_STEP:]
+    if frame_started:
+        raise StreamDecodeError("Truncated zstd stream")
+
+
+def decompress(chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    if encoding == "gzip":
+        return _gunzip(chunks)
+    if encoding == "zstd":
+        return _unzstd(chunks)
+    return chunks
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Строки потока с номерами (с 1). Вместо строки длиннее max_line_bytes отдается None:
+    она пропускается целиком, не накапливаясь в памяти.
+    """
+    line_number = 0
+    buffer = bytearray()
+    skipping = False # Текущая строка слишком длинная
+    async for chunk in chunks:
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            if newline == -1:
+                if not skipping:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        buffer.clear()
+                        skipping = True
+                break
+            line_number += 1
+            if skipping:
+                skipping = False
+                yield line_number, None
+            else:
+                buffer += chunk[start:newline]
+                yield line_number, (bytes(buffer) if len(buffer) <= max_line_bytes else None)
+                buffer.clear()
+            start = newline + 1
+    if skipping:
+        yield line_number + 1, None
+    elif buffer.strip():
+        yield line_number + 1, bytes(buffer)
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, item['loc'])) or 'line'}: {item['msg']}" for item in error.errors()
+    )
+
+
+async def ingest_ndjson_stream(
+    chunks: AsyncIterator[bytes],
+    *,
+    encoding: str,
+    client_id: UUID,
+    write_rows: Callable[[List[dict]], Awaitable[None]],
+) -> SecurityEventStreamAccepted:
+    """
+    Распаковывает, разбирает и проверяет поток построчно; каждые EVENT_STREAM_INGEST_CHUNK_SIZE
+    проверенных событий передаются в write_rows. Ошибочные строки пропускаются и попадают
+    в отчет (первые EVENT_STREAM_INGEST_MAX_REPORTED_ERRORS). Бросает StreamDecodeError,
+    если поток не распаковывается; уже записанные порции при этом остаются в БД.
+    """
+    result = SecurityEventStreamAccepted(lines=0, accepted=0, rejected=0, errors=[])
+    pending: List[SecurityEventCreate] = []
+
+    async def flush() -> None:
+        if pending:
+            await write_rows(crud_event.prepare_event_rows(pending, client_id=client_id))
+            result.accepted += len(pending)
+            pending.clear()
+
+    def reject(line_number: int, error: str) -> None:
+        result.rejected += 1
+        if len(result.errors) < settings.EVENT_STREAM_INGEST_MAX_REPORTED_ERRORS:
+            result.errors.append(SecurityEventLineError(line=line_number, error=error))
+
+    try:
+        async for line_number, line in iter_lines(decompress(chunks, encoding), settings.EVENT_STREAM_MAX_LINE_BYTES):
+            result.lines = line_number
+            if line is None:
+                reject(line_number, f"Line exceeds {settings.EVENT_STREAM_MAX_LINE_BYTES} bytes")
+                continue
+            if not line.strip():
+                continue # Пустые строки допускаются
+            try:
+                pending.append(SecurityEventCreate.model_validate_json(line))
+            except ValidationError as e:
+                reject(line_number, _format_validation_error(e))
+                continue
+            if len(pending) >= settings.EVENT_STREAM_INGEST_CHUNK_SIZE:
+                await flush()
+    except StreamDecodeError as e:
+        # Строки до поврежденного места целые: сохраняем их и сообщаем, сколько записано
+        await flush()
+        e.accepted = result.accepted
+        raise
+    await flush()
+    return result
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from uuid import UUID
+
+from app.core.config import settings
+from app.crud import crud_client
+from app.db.database import run_in_new_session
+from app.models.client import ClientRead
+from app.services.periodic import PeriodicTask
+
+
+class HeartbeatBuffer:
+    """
+    Карта последних heartbeat клиентов в памяти процесса.
+    Heartbeat агента - только запись в словарь; фоновая задача периодически переносит
+    накопленные значения в client.last_heartbeat пакетными UPDATE, так что на клиента
+    приходится не больше одной записи строки за интервал сброса.
+    Несброшенные значения видны в админке через overlay().
+    """
+
+    def __init__(self):
+        self._pending: Dict[UUID, datetime] = {}
+        self._flushing: Dict[UUID, datetime] = {} # Пишутся в БД прямо сейчас
+        # flush вызывают и периодическая задача, и проверка живости: сброс идет строго по одному
+        self._flush_lock = asyncio.Lock()
+        self.recorded = 0
+        self.flushed_clients = 0
+        self.failed_flushes = 0
+
+    def record(self, client_id: UUID) -> datetime:
+        heartbeat_at = datetime.now(timezone.utc)
+        self._pending[client_id] = heartbeat_at
+        self.recorded += 1
+        return heartbeat_at
+
+    def latest(self, client_id: UUID) -> Optional[datetime]:
+        return self._pending.get(client_id) or self._flushing.get(client_id)
+
+    def overlay(self, client: ClientRead) -> ClientRead:
+        """Подставляет еще не записанный в БД heartbeat клиента."""
+        heartbeat_at = self.latest(client.id)
+        if heartbeat_at is None or (client.last_heartbeat is not None and client.last_heartbeat >= heartbeat_at):
+            return client
+        return client.model_copy(update={"last_heartbeat": heartbeat_at, "status": self.overlay_status(client.status)})
+
+    @staticmethod
+    def overlay_status(client_status: str) -> str:
+        """Статус клиента после сброса его записанного в буфер heartbeat."""
+        if client_status == crud_client.CLIENT_STATUS_OFFLINE: # Сброс буфера вернет клиента в "active"
+            return crud_client.CLIENT_STATUS_ACTIVE
+        return client_status
+
+    async def flush(self) -> int:
+        """
+        Записывает накопленные heartbeat в БД. Возвращает число обновленных клиентов.
+        Параллельный вызов дожидается текущего сброса и затем пишет то, что пришло за это время.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+            try:
+                updated = await run_in_new_session(crud_client.update_clients_heartbeats, heartbeats=batch)
+            except asyncio.CancelledError:
+                # Задачу остановили посреди записи (stop() при завершении): пачку запишет следующий сброс
+                self._restore(batch)
+                raise
+            except Exception:
+                self.failed_flushes += 1
+                self._restore(batch)
+                raise
+            finally:
+                self._flushing = {}
+            self.flushed_clients += updated
+            return updated
+
+    def _restore(self, batch: Dict[UUID, datetime]) -> None:
+        """Возвращает несброшенные значения в буфер, не затирая пришедшие за время записи."""
+        for client_id, heartbeat_at in batch.items():
+            self._pending.setdefault(client_id, heartbeat_at)
+
+    def stats(self) -> dict:
+        return {
+            "pending_clients": len(self._pending),
+            "recorded_heartbeats": self.recorded,
+            "flushed_clients": self.flushed_clients,
+            "failed_flushes": self.failed_flushes,
+            "flush": heartbeat_flush.stats(),
+        }
+
+
+heartbeat_buffer = HeartbeatBuffer()
+
+heartbeat_flush = PeriodicTask(
+    name="heartbeat_flush",
+    interval_seconds=settings.HEARTBEAT_FLUSH_INTERVAL_SECONDS,
+    fn=heartbeat_buffer.flush,
+)
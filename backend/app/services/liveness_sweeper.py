@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import settings
+from app.crud import crud_client, crud_command
+from app.db.database import run_in_new_session
+from app.services.heartbeat_buffer import heartbeat_buffer
+from app.services.periodic import PeriodicTask
+
+
+class LivenessSweeper:
+    """
+    Периодическая проверка живости: клиенты без heartbeat дольше CLIENT_INACTIVE_AFTER_SECONDS
+    помечаются "offline", невыданные команды с истекшим dispatch_deadline - "timeout".
+    Каждое правило - один UPDATE по множеству строк.
+    """
+
+    def __init__(self):
+        self.clients_marked_offline = 0
+        self.commands_timed_out = 0
+
+    async def sweep(self) -> dict:
+        # Сначала сбрасываем буфер heartbeat, иначе живой клиент может оказаться "offline".
+        # Ошибка сброса прерывает проход целиком
+        await heartbeat_buffer.flush()
+        now = datetime.now(timezone.utc)
+        marked = await run_in_new_session(
+            crud_client.mark_stale_clients_offline,
+            heartbeat_before=now - timedelta(seconds=settings.CLIENT_INACTIVE_AFTER_SECONDS),
+        )
+        timed_out = await run_in_new_session(crud_command.time_out_overdue_commands, now=now)
+        self.clients_marked_offline += marked
+        self.commands_timed_out += timed_out
+        return {"clients_marked_offline": marked, "commands_timed_out": timed_out}
+
+    def stats(self) -> dict:
+        return {
+            "offline_after_seconds": settings.CLIENT_INACTIVE_AFTER_SECONDS,
+            "clients_marked_offline": self.clients_marked_offline,
+            "commands_timed_out": self.commands_timed_out,
+            "sweep": liveness_sweep.stats(), # last_duration_ms и last_result - по последнему проходу
+        }
+
+
+liveness_sweeper = LivenessSweeper()
+
+liveness_sweep = PeriodicTask(
+    name="liveness_sweep",
+    interval_seconds=settings.LIVENESS_SWEEP_INTERVAL_SECONDS,
+    fn=liveness_sweeper.sweep,
+)
@@ -0,0 +1,56 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+
+class PeriodicTask:
+    """Фоновая задача, запускаемая раз в interval_seconds из lifespan приложения."""
+
+    def __init__(self, name: str, interval_seconds: float, fn: Callable[[], Awaitable[Any]]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.fn = fn
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_duration_seconds: Optional[float] = None
+        self.last_result: Any = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> Any:
+        started = time.perf_counter()
+        try:
+            self.last_result = await self.fn()
+        except Exception as e:
+            self.failures += 1
+            print(f"Periodic task '{self.name}' failed: {e}")
+        finally:
+            self.runs += 1
+            self.last_duration_seconds = time.perf_counter() - started
+        return self.last_result
+
+    def stats(self) -> dict:
+        return {
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_duration_ms": self.last_duration_seconds * 1000 if self.last_duration_seconds is not None else None,
+            "last_result": self.last_result,
+        }
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.run_once()
@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import os
+import secrets
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # backend/ - для импорта app
+
+import bcrypt
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlmodel import Session, delete, update
+
+from app.api.deps import authenticate_api_key, get_current_client
+from app.core.auth_cache import api_key_cache, legacy_key_scan_limiter, rejected_key_cache
+from app.core.config import settings
+from app.core.security import compute_api_key_fingerprint, generate_api_key
+from app.crud import crud_client
+from app.db.database import DatabaseSession, create_db_and_tables, engine
+from app.models.client import Client, ClientCreate
+
+# Бенчмарк аутентификации агента по X-API-Key (get_current_client) в зависимости от числа
+# клиентов в БД: 10, 100, 1000, 10000, 100000. Работает напрямую с БД из настроек бэкенда (POSTGRES_*):
+#
+#   cd backend && python scripts/bench_auth.py [--clients 10 100 1000 10000 100000] [--repeat 20] [--legacy-max-clients 100]
+#
+# Пути (медиана, мс на запрос):
+#   cached       - ключ в кэше api_key_cache: ни БД, ни bcrypt;
+#   fingerprint  - холодный кэш: поиск по отпечатку ключа (индекс) и одна проверка bcrypt;
+#   rejected     - неизвестный ключ при AUTH_LEGACY_KEY_SCAN_ENABLED=False: один поиск по отпечатку;
+#   rejected_hit - повтор того же неизвестного ключа: отказ из rejected_key_cache;
+#   legacy_scan  - неизвестный ключ, когда ни у одного клиента нет отпечатка: перебор bcrypt по всем
+#                  (прежнее поведение без лимита). Один bcrypt на клиента, поэтому замеряется только
+#                  до --legacy-max-clients клиентов; дальше время растет линейно.
+# Клиенты добавляются пачками до очередного размера и удаляются после замера. Ключ настоящий только
+# у одного клиента; у остальных хеш фиктивный, но с настоящей солью и стоимостью bcrypt,
+# так что проверка ключа против него стоит столько же, сколько против настоящего.
+
+INSERT_CHUNK_SIZE = 5_000
+BCRYPT_ALPHABET = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+
+def filler_api_key_hash() -> str:
+    """Уникальный bcrypt-хеш без выпуска ключа: соль из gensalt() и случайный дайджест (31 символ)."""
+    return bcrypt.gensalt().decode() + "".join(secrets.choice(BCRYPT_ALPHABET) for _ in range(31))
+
+
+def add_clients(name_prefix: str, start: int, stop: int) -> None:
+    now = datetime.now(timezone.utc)
+    for chunk_start in range(start, stop, INSERT_CHUNK_SIZE):
+        rows = [
+            {
+                "id": uuid.uuid4(),
+                "client_name": f"{name_prefix}{index}",
+                "os_info": "bench-auth",
+                "status": crud_client.CLIENT_STATUS_ACTIVE,
+                "api_key_hash": filler_api_key_hash(),
+                "api_key_fingerprint": compute_api_key_fingerprint(generate_api_key()),
+                "registered_at": now,
+            }
+            for index in range(chunk_start, min(stop, chunk_start + INSERT_CHUNK_SIZE))
+        ]
+        with Session(engine) as session:
+            session.execute(insert(Client), rows)
+            session.commit()
+
+
+async def authenticate(api_key: str) -> Optional[int]:
+    """Один запрос агента: None - ключ принят, иначе код ответа."""
+    with Session(engine, expire_on_commit=False) as session:
+        try:
+            await get_current_client(DatabaseSession(session), api_key)
+        except HTTPException as e:
+            return e.status_code
+    return None
+
+
+async def legacy_scan(name_prefix: str, api_key: str) -> float:
+    """Перебор при пустых отпечатках у всех клиентов бенчмарка; отпечатки стираются в откатываемой транзакции."""
+    with Session(engine) as session:
+        session.exec(update(Client).where(Client.client_name.startswith(name_prefix)).values(api_key_fingerprint=None))
+        try:
+            started = time.perf_counter()
+            client = await authenticate_api_key(DatabaseSession(session), api_key, compute_api_key_fingerprint(api_key))
+            elapsed = time.perf_counter() - started
+        finally:
+            session.rollback()
+    assert client is None
+    return elapsed
+
+
+async def timed(call: Callable[[], Awaitable[Optional[int]]], prepare: Callable[[], None], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        prepare()
+        started = time.perf_counter()
+        await call()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+async def bench(name_prefix: str, api_key: str, clients: int, repeat: int, legacy_max_clients: int) -> Dict[str, Optional[float]]:
+    unknown_key = generate_api_key()
+    settings.AUTH_LEGACY_KEY_SCAN_ENABLED = False
+    await authenticate(api_key) # Прогрев: соединение пула и кэш ключа
+    result: Dict[str, Optional[float]] = {
+        "cached": await timed(lambda: authenticate(api_key), lambda: None, repeat),
+        "fingerprint": await timed(lambda: authenticate(api_key), api_key_cache.clear, repeat),
+        "rejected": await timed(lambda: authenticate(unknown_key), rejected_key_cache.clear, repeat),
+        "rejected_hit": await timed(lambda: authenticate(unknown_key), lambda: None, repeat),
+        "legacy_scan": None,
+    }
+    if clients <= legacy_max_clients:
+        settings.AUTH_LEGACY_KEY_SCAN_ENABLED = True
+        result["legacy_scan"] = await legacy_scan(name_prefix, unknown_key)
+    return result
+
+
+async def run(sizes: List[int], repeat: int, legacy_max_clients: int) -> None:
+    name_prefix = f"bench-auth-{uuid.uuid4().hex[:8]}-"
+    with Session(engine) as session:
+        _, api_key = crud_client.create_client_with_api_key(session, client_in=ClientCreate(client_name=f"{name_prefix}key"))
+    legacy_key_scan_limiter.max_per_minute = sys.maxsize # Лимит переборов замеру не нужен
+    columns = ["cached", "fingerprint", "rejected", "rejected_hit", "legacy_scan"]
+    try:
+        print(f"{'clients':>8} " + " ".join(f"{column:>12}" for column in columns) + "   (ms)")
+        existing = 1
+        for size in sorted(sizes):
+            add_clients(name_prefix, existing, size)
+            existing = max(existing, size)
+            result = await bench(name_prefix, api_key, existing, repeat, legacy_max_clients)
+            print(f"{existing:>8} " + " ".join(
+                f"{result[column] * 1000:>12.2f}" if result[column] is not None else f"{'-':>12}" for column in columns
+            ))
+    finally:
+        with Session(engine) as session:
+            session.exec(delete(Client).where(Client.client_name.startswith(name_prefix)))
+            session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark agent API key authentication against the number of clients.")
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000], help="Client counts")
+    parser.add_argument("--repeat", type=int, default=20, help="Requests per path and client count (the median is reported)")
+    parser.add_argument(
+        "--legacy-max-clients", type=int, default=100,
+        help="Measure the legacy bcrypt scan only up to this many clients (one bcrypt check per client)",
+    )
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    asyncio.run(run(args.clients, args.repeat, args.legacy_max_clients))
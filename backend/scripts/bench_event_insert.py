@@ -0,0 +1,110 @@
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # backend/ - для импорта app
+
+from sqlmodel import Session, delete
+
+from app.crud import crud_client, crud_event
+from app.db.database import create_db_and_tables, engine
+from app.models.client import Client, ClientCreate
+from app.models.event import SecurityEvent, SecurityEventCreate, SecurityEventRollup
+from app.services.event_partitions import ensure_event_partitions
+
+# Бенчмарк записи пачки событий одного агента (путь POST /events): событий в секунду
+# для размеров пачки 1, 100, 1000, 10000. Работает напрямую с БД из настроек бэкенда (POSTGRES_*):
+#
+#   cd backend && python scripts/bench_event_insert.py [--sizes 1 100 1000 10000] [--events 10000] [--method both]
+#
+# bulk - текущий путь crud_event.create_multiple_events (многострочный INSERT, id генерирует приложение);
+# orm  - прежний путь для сравнения: объект на событие, commit и refresh каждой строки.
+# Каждая пачка - отдельная транзакция с commit, как у эндпоинта. События пишутся от временного
+# клиента и удаляются вместе с ним (и его строками сводки) после замера.
+
+
+def insert_orm(session: Session, *, events_in: List[SecurityEventCreate], client: Client) -> List[SecurityEvent]:
+    """Прежняя реализация crud_event.create_multiple_events."""
+    db_events = []
+    for event_in_item in events_in:
+        db_event = SecurityEvent(**event_in_item.model_dump(), client_id=client.id)
+        session.add(db_event)
+        db_events.append(db_event)
+    session.commit()
+    for db_event in db_events:
+        session.refresh(db_event)
+    return db_events
+
+
+def insert_bulk(session: Session, *, events_in: List[SecurityEventCreate], client: Client) -> List[dict]:
+    return crud_event.create_multiple_events(session, events_in=events_in, client_id=client.id)
+
+
+METHODS = {"bulk": insert_bulk, "orm": insert_orm}
+
+
+def make_events(count: int) -> List[SecurityEventCreate]:
+    now = datetime.now(timezone.utc)
+    return [
+        SecurityEventCreate(
+            timestamp=now,
+            event_type="login_failure",
+            severity="high",
+            source_ip=f"10.0.{index // 250 % 256}.{index % 250 + 1}",
+            db_name_target="orders",
+            details={"user": f"user{index % 1000}", "attempt": index % 10},
+        )
+        for index in range(count)
+    ]
+
+
+def bench(insert: Callable, client: Client, batch_size: int, total_events: int) -> dict:
+    batches = max(1, total_events // batch_size)
+    events_in = make_events(batch_size) # Валидация входа в замер не входит: эндпоинт получает готовые модели
+    elapsed = 0.0
+    for _ in range(batches):
+        with Session(engine) as session:
+            started = time.perf_counter()
+            insert(session, events_in=events_in, client=client)
+            elapsed += time.perf_counter() - started
+    events = batches * batch_size
+    return {"batches": batches, "events": events, "seconds": elapsed, "events_per_second": events / elapsed}
+
+
+def cleanup(client_id: uuid.UUID) -> None:
+    with Session(engine) as session:
+        session.exec(delete(SecurityEvent).where(SecurityEvent.client_id == client_id))
+        session.exec(delete(SecurityEventRollup).where(SecurityEventRollup.client_id == client_id))
+        session.exec(delete(Client).where(Client.id == client_id))
+        session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark security event batch inserts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 1000, 10000], help="Batch sizes")
+    parser.add_argument("--events", type=int, default=10000, help="Events to insert per batch size (at least one batch)")
+    parser.add_argument("--method", choices=["bulk", "orm", "both"], default="both", help="Insert path to measure")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    ensure_event_partitions(datetime.now(timezone.utc).date(), interval_days=1, premake_days=1)
+    with Session(engine) as session:
+        client, _ = crud_client.create_client_with_api_key(
+            session, client_in=ClientCreate(client_name=f"bench-insert-{uuid.uuid4().hex[:8]}")
+        )
+    methods = ["bulk", "orm"] if args.method == "both" else [args.method]
+    try:
+        print(f"{'method':<6} {'batch':>6} {'batches':>8} {'events':>8} {'seconds':>9} {'events/s':>10}")
+        for method in methods:
+            for batch_size in args.sizes:
+                result = bench(METHODS[method], client, batch_size, args.events)
+                print(
+                    f"{method:<6} {batch_size:>6} {result['batches']:>8} {result['events']:>8} "
+                    f"{result['seconds']:>9.3f} {result['events_per_second']:>10.0f}"
+                )
+    finally:
+        cleanup(client.id)
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # backend/ - для импорта app
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.core.responses import FastJSONResponse
+from app.models.command import Command, CommandRead
+from app.models.event import SecurityEvent, SecurityEventRead
+
+# Микробенчмарк кодирования страницы списка (по умолчанию 200 строк) для GET /admin/events
+# и GET /commands. Сравниваются:
+#   response_model - прежний путь: ORM-объекты проверяются в response_model, переводятся
+#                    в JSON-совместимые объекты и кодируются JSONResponse (stdlib json);
+#   dump_json      - то же, но кодирование dump_json (pydantic-core), как у FastAPI без response_class;
+#   orjson         - текущий путь: строки Core-запроса (словари) сразу кодируются FastJSONResponse.
+# БД не нужна (настройки бэкенда все равно читаются при импорте app):
+#
+#   cd backend && python scripts/bench_json_responses.py [--rows 200] [--number 200]
+
+
+def event_rows(count: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": uuid.uuid4(), "client_id": uuid.uuid4(), "timestamp": now,
+            "event_type": "login_failure", "severity": "high", "source_ip": "10.0.0.1", "db_name_target": "orders",
+            "details": {"user": f"user{index}", "attempt": index % 10, "tags": ["auth", "ssh"]},
+        }
+        for index in range(count)
+    ]
+
+
+def command_rows(count: int) -> list:
+    now = datetime.now(timezone.utc)
+    return [
+        {
+            "id": uuid.uuid4(), "client_id": uuid.uuid4(), "campaign_id": None,
+            "command_type": "block_ip", "payload": {"ip": f"10.0.0.{index % 250 + 1}"},
+            "status": "dispatched", "priority": 0, "dispatch_deadline": None, "not_before": None,
+            "created_at": now, "updated_at": now, "execution_result": None,
+        }
+        for index in range(count)
+    ]
+
+
+def variants(orm_model, read_model, rows: list) -> dict:
+    objects = [orm_model(**row) for row in rows]
+    adapter = TypeAdapter(list[read_model])
+    return {
+        "response_model": lambda: JSONResponse(
+            adapter.dump_python(adapter.validate_python(objects, from_attributes=True), mode="json")
+        ).body,
+        "dump_json": lambda: adapter.dump_json(adapter.validate_python(objects, from_attributes=True)),
+        "orjson": lambda: FastJSONResponse(rows).body,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark JSON encoding of list endpoint pages.")
+    parser.add_argument("--rows", type=int, default=200, help="Rows per page")
+    parser.add_argument("--number", type=int, default=200, help="Encodings per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs (the best one is reported)")
+    args = parser.parse_args()
+
+    pages = {
+        "events": variants(SecurityEvent, SecurityEventRead, event_rows(args.rows)),
+        "commands": variants(Command, CommandRead, command_rows(args.rows)),
+    }
+    print(f"{'page':<9} {'path':<15} {'ms/page':>8} {'speedup':>8}")
+    for page, encoders in pages.items():
+        timings = {
+            name: min(timeit.repeat(encode, number=args.number, repeat=args.repeat)) / args.number
+            for name, encode in encoders.items()
+        }
+        for name, seconds in timings.items():
+            print(f"{page:<9} {name:<15} {seconds * 1000:>8.3f} {timings['response_model'] / seconds:>7.1f}x")
@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import httpx
+
+# Нагрузочный тест горячего пути агентов: аутентификация по X-API-Key и прием событий.
+# Запускается против работающего бэкенда (нужен httpx: pip install httpx):
+#
+#   python scripts/load_test.py --base-url http://localhost:8000/api/v1 --clients 100 --concurrency 500 --duration 60
+#
+# Сравнение синхронного и асинхронного слоя БД: прогнать тест дважды на одной БД, перезапуская
+# бэкенд с DB_ASYNC_ENABLED=false и DB_ASYNC_ENABLED=true, с разными --label и общим --output
+# (результаты дописываются строками JSON), затем сравнить requests_per_second и задержки.
+#
+# Сценарии (--scenario):
+#   heartbeat   - POST /clients/heartbeat (аутентификация + обновление клиента)
+#   events      - POST /events (синхронная вставка пачки, ответ - вставленные события)
+#   batch       - POST /events/batch (пачка в очередь записи, ответ 202)
+#   mix         - heartbeat и batch в пропорции 1:4, как у агента по умолчанию
+# Каждый запрос случайного зарегистрированного клиента: в горячем пути участвует кэш ключей.
+
+SCENARIOS = {
+    "heartbeat": ["heartbeat"],
+    "events": ["events"],
+    "batch": ["batch"],
+    "mix": ["heartbeat", "batch", "batch", "batch", "batch"],
+}
+EVENT_TYPES = ["login_failure", "sql_injection_attempt", "privilege_escalation", "port_scan"]
+SEVERITIES = ["low", "medium", "high", "critical"]
+
+
+def make_events(count: int) -> List[dict]:
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "event_type": random.choice(EVENT_TYPES),
+            "severity": random.choice(SEVERITIES),
+            "source_ip": f"10.0.{random.randint(0, 255)}.{random.randint(1, 254)}",
+            "db_name_target": "orders",
+            "details": {"user": f"user{random.randint(1, 1000)}", "attempt": random.randint(1, 10)},
+            "timestamp": now,
+        }
+        for _ in range(count)
+    ]
+
+
+async def register_clients(http: httpx.AsyncClient, count: int) -> List[str]:
+    """Регистрирует клиентов для теста и возвращает их API ключи."""
+    run_id = uuid.uuid4().hex[:8]
+    api_keys = []
+    for index in range(count):
+        response = await http.post("/admin/clients", json={"client_name": f"load-test-{run_id}-{index}", "os_info": "load-test"})
+        response.raise_for_status()
+        api_keys.append(response.json()["api_key"])
+    return api_keys
+
+
+async def send_request(http: httpx.AsyncClient, operation: str, api_key: str, events_per_request: int) -> httpx.Response:
+    headers = {"X-API-Key": api_key}
+    if operation == "heartbeat":
+        return await http.post("/clients/heartbeat", headers=headers)
+    if operation == "events":
+        return await http.post("/events", headers=headers, json=make_events(events_per_request))
+    return await http.post("/events/batch", headers=headers, json=make_events(events_per_request))
+
+
+async def worker(
+    http: httpx.AsyncClient,
+    api_keys: List[str],
+    operations: List[str],
+    deadline: float,
+    events_per_request: int,
+    latencies: Dict[str, List[float]],
+    statuses: Dict[str, Counter],
+) -> None:
+    while time.perf_counter() < deadline:
+        operation = random.choice(operations)
+        started = time.perf_counter()
+        try:
+            response = await send_request(http, operation, random.choice(api_keys), events_per_request)
+            outcome = str(response.status_code)
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        latencies[operation].append(time.perf_counter() - started)
+        statuses[operation][outcome] += 1
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(latencies: Dict[str, List[float]], statuses: Dict[str, Counter], elapsed: float, events_per_request: int) -> dict:
+    operations = {}
+    for operation, values in latencies.items():
+        ok = sum(count for outcome, count in statuses[operation].items() if outcome.startswith("2"))
+        operations[operation] = {
+            "requests": len(values),
+            "requests_per_second": round(len(values) / elapsed, 1),
+            "ok": ok,
+            "statuses": dict(statuses[operation]),
+            "latency_ms": {
+                "mean": round(statistics.fmean(values) * 1000, 2),
+                "p50": round(percentile(values, 0.50) * 1000, 2),
+                "p95": round(percentile(values, 0.95) * 1000, 2),
+                "p99": round(percentile(values, 0.99) * 1000, 2),
+            },
+        }
+        if operation != "heartbeat":
+            operations[operation]["events_per_second"] = round(ok * events_per_request / elapsed, 1)
+    total = sum(len(values) for values in latencies.values())
+    return {"elapsed_seconds": round(elapsed, 2), "requests_per_second": round(total / elapsed, 1), "operations": operations}
+
+
+async def run(args: argparse.Namespace) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as http:
+        api_keys = await register_clients(http, args.clients)
+        operations = SCENARIOS[args.scenario]
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        statuses: Dict[str, Counter] = defaultdict(Counter)
+
+        # Прогрев: первый запрос каждого клиента проверяет ключ через bcrypt и кладет его в кэш
+        await asyncio.gather(*(send_request(http, "heartbeat", api_key, 0) for api_key in api_keys))
+
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            worker(http, api_keys, operations, deadline, args.events_per_request, latencies, statuses)
+            for _ in range(args.concurrency)
+        ))
+        result = summarize(latencies, statuses, time.perf_counter() - started, args.events_per_request)
+
+        # Состояние сервера после прогона: пул соединений БД, кэш ключей, очередь записи событий
+        server_metrics = {}
+        for name in ("db-pool", "auth-cache", "event-ingest"):
+            response = await http.get(f"/admin/metrics/{name}")
+            if response.status_code == 200:
+                server_metrics[name] = response.json()
+        result["server_metrics"] = server_metrics
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for agent authentication and event ingest.")
+    parser.add_argument("--base-url", default="http://localhost:8000/api/v1", help="Backend API base URL")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mix", help="Request mix")
+    parser.add_argument("--clients", type=int, default=50, help="Number of agents to register for the test")
+    parser.add_argument("--concurrency", type=int, default=200, help="Concurrent in-flight requests")
+    parser.add_argument("--duration", type=float, default=30, help="Test duration in seconds")
+    parser.add_argument("--events-per-request", type=int, default=20, help="Events per POST /events(/batch)")
+    parser.add_argument("--timeout", type=float, default=30, help="Request timeout in seconds")
+    parser.add_argument("--label", default="", help="Run label stored with the result, e.g. async or sync")
+    parser.add_argument("--output", default="", help="Append the result as a JSON line to this file")
+    args = parser.parse_args()
+
+    result = {"label": args.label, "scenario": args.scenario, "clients": args.clients, "concurrency": args.concurrency}
+    result.update(asyncio.run(run(args)))
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as output:
+            output.write(json.dumps(result) + "\n")
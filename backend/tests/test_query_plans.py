@@ -0,0 +1,294 @@
+# backend/tests/test_query_plans.py
+# Регрессионный тест индексов (app/models/event.py, command.py, client.py): запросы лога событий,
+# списка команд, выдачи команд агенту и поиска клиента по отпечатку ключа должны читать индексы,
+# а не всю таблицу. Планы строятся на данных реалистичного объема (клиенты, события, команды
+# с типичным распределением статусов) после ANALYZE, без подсказок планировщику.
+# Нужна реальная БД Postgres (POSTGRES_SERVER, POSTGRES_USER, POSTGRES_PASSWORD, POSTGRES_DB);
+# без них тест пропускается. Тест создает схему и секции; данные пишутся в транзакции,
+# которая откатывается в конце модуля.
+#   cd backend && POSTGRES_SERVER=localhost ... python -m pytest tests
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+POSTGRES_ENV = ("POSTGRES_SERVER", "POSTGRES_USER", "POSTGRES_PASSWORD", "POSTGRES_DB")
+
+pytestmark = pytest.mark.skipif(
+    not all(os.environ.get(name) for name in POSTGRES_ENV),
+    reason="Postgres is not configured (POSTGRES_* environment variables)",
+)
+
+SEED_CLIENTS = 10_000
+SEED_EVENTS = 300_000 # Событий приходится на SEED_EVENT_CLIENTS самых активных клиентов
+SEED_EVENT_CLIENTS = 1_000
+SEED_COMMANDS = 200_000 # Из них ожидают выдачи около 2%, остальные завершены или в работе
+EXPLAINED_STATEMENTS = ("SELECT", "WITH", "UPDATE", "INSERT", "DELETE")
+
+SEED_SQL = [
+    """
+    INSERT INTO client (id, client_name, os_info, status, api_key_hash, api_key_fingerprint, registered_at)
+    SELECT gen_random_uuid(), 'plan-test-' || g, 'Linux', CASE WHEN g % 20 = 0 THEN 'offline' ELSE 'active' END,
+           'plan-test-hash-' || g, encode(sha256(('plan-test-' || g)::bytea), 'hex'),
+           now() - g * interval '1 minute'
+    FROM generate_series(1, :clients) AS g
+    """,
+    """
+    INSERT INTO securityevent (id, timestamp, client_id, event_type, severity, source_ip, db_name_target, details)
+    SELECT gen_random_uuid(), now() - (g % 86400) * interval '1 second', ids[1 + g % :event_clients],
+           (ARRAY['login_failure', 'login_success', 'sql_injection_attempt', 'privilege_escalation',
+                  'port_scan', 'config_change', 'data_export', 'brute_force'])[1 + g % 8],
+           (ARRAY['low', 'low', 'low', 'medium', 'medium', 'high', 'critical'])[1 + g % 7],
+           '10.0.' || (g % 256) || '.' || (g % 250 + 1), 'orders',
+           jsonb_build_object('user', 'user' || (g % 5000), 'attempt', g % 10)
+    FROM generate_series(1, :events) AS g,
+         (SELECT array_agg(id ORDER BY client_name) AS ids FROM client WHERE client_name LIKE 'plan-test-%') AS clients
+    """,
+    """
+    INSERT INTO command (id, client_id, command_type, payload, status, priority, dispatch_deadline, not_before,
+                         created_at, updated_at)
+    SELECT gen_random_uuid(), ids[1 + g % array_length(ids, 1)],
+           (ARRAY['block_ip', 'run_script', 'collect_logs'])[1 + g % 3],
+           jsonb_build_object('ip', '10.0.' || (g % 256) || '.' || (g % 250 + 1)),
+           CASE WHEN g % 50 = 0 THEN 'pending_dispatch'
+                WHEN g % 50 = 1 THEN 'dispatched'
+                WHEN g % 50 = 2 THEN 'in_progress'
+                WHEN g % 50 IN (3, 4) THEN 'failed'
+                ELSE 'completed' END,
+           g % 3,
+           CASE WHEN g % 4 = 0 THEN now() + interval '1 hour' END,
+           CASE WHEN g % 10 = 0 THEN now() + interval '10 minutes' END,
+           now() - g * interval '10 seconds', now() - g * interval '10 seconds'
+    FROM generate_series(1, :commands) AS g,
+         (SELECT array_agg(id ORDER BY client_name) AS ids FROM client WHERE client_name LIKE 'plan-test-%') AS clients
+    """,
+    "ANALYZE client",
+    "ANALYZE securityevent",
+    "ANALYZE command",
+]
+
+
+@pytest.fixture(scope="module")
+def seeded_connection():
+    """
+    Соединение с открытой транзакцией, в которой лежат тестовые данные и собрана их статистика
+    (ANALYZE транзакционен). После тестов модуля транзакция откатывается.
+    """
+    from sqlalchemy import text
+
+    from app.db.database import create_db_and_tables, engine
+    from app.services.event_partitions import ensure_event_partitions
+
+    create_db_and_tables()
+    ensure_event_partitions(datetime.now(timezone.utc).date(), interval_days=1, premake_days=1)
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            for statement in SEED_SQL:
+                connection.execute(
+                    text(statement),
+                    {"clients": SEED_CLIENTS, "event_clients": SEED_EVENT_CLIENTS, "events": SEED_EVENTS, "commands": SEED_COMMANDS},
+                )
+            yield connection
+        finally:
+            transaction.rollback()
+
+
+@pytest.fixture(scope="module")
+def seeded_client_ids(seeded_connection):
+    """Самый активный клиент (есть события и команды) и клиент, у которого больше всего ожидающих команд."""
+    from sqlalchemy import text
+
+    active_client_id = seeded_connection.execute(
+        text("SELECT id FROM client WHERE client_name = 'plan-test-1'")
+    ).scalar_one()
+    pending_client_id = seeded_connection.execute(
+        text(
+            "SELECT client_id FROM command WHERE status = 'pending_dispatch' "
+            "GROUP BY client_id ORDER BY count(*) DESC LIMIT 1"
+        )
+    ).scalar_one()
+    return active_client_id, pending_client_id
+
+
+@contextmanager
+def explained_session(connection):
+    """
+    Сессия, в которой перед каждым запросом выполняется его EXPLAIN (FORMAT JSON): CRUD-функция
+    строит запросы сама, их планы собираются в список, а сами запросы выполняются как обычно
+    (изменения данных откатываются вместе с транзакцией модуля). commit() CRUD-функции
+    завершает только точку сохранения.
+    """
+    from sqlalchemy import event
+    from sqlmodel import Session
+
+    plans = []
+
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            plans.append(cursor.fetchone()[0][0]["Plan"])
+
+    event.listen(connection, "before_cursor_execute", explain)
+    try:
+        with Session(bind=connection, join_transaction_mode="create_savepoint") as session:
+            yield session, plans
+    finally:
+        event.remove(connection, "before_cursor_execute", explain)
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def assert_index_plan(plan, index_suffixes, *, ordered: bool = True):
+    """
+    План читает таблицу только индексом, имя которого содержит один из index_suffixes.
+    ordered - порядок строк дает сам индекс (нет узла Sort).
+    """
+    if isinstance(index_suffixes, str):
+        index_suffixes = (index_suffixes,)
+    nodes = list(plan_nodes(plan))
+    node_types = [node["Node Type"] for node in nodes]
+    index_names = [node["Index Name"] for node in nodes if "Index Name" in node]
+    assert "Seq Scan" not in node_types, node_types
+    if ordered:
+        assert "Sort" not in node_types, node_types
+    # На секциях индексы называются по-разному (создан Postgres или app/db/migrate.py), но содержат
+    # колонки индекса из модели
+    assert index_names and all(any(suffix in name for suffix in index_suffixes) for name in index_names), index_names
+    return node_types
+
+
+@pytest.mark.parametrize(
+    "filters, index_suffix",
+    [
+        ({}, "timestamp_id"),
+        ({"client_id": True}, "client_id_timestamp_id"),
+        ({"event_type": "privilege_escalation"}, "event_type_timestamp_id"),
+        ({"severity": "critical"}, "severity_timestamp_id"),
+    ],
+)
+def test_get_events_uses_composite_index(seeded_connection, seeded_client_ids, filters, index_suffix):
+    from app.crud import crud_event
+
+    if filters.get("client_id"):
+        filters = {**filters, "client_id": seeded_client_ids[0]}
+    with explained_session(seeded_connection) as (session, plans):
+        crud_event.get_events(session, limit=50, **filters)
+    assert_index_plan(plans[0], index_suffix)
+
+
+def test_get_events_keyset_page_uses_composite_index(seeded_connection, seeded_client_ids):
+    from app.crud import crud_event
+
+    cursor = (datetime.now(timezone.utc) - timedelta(hours=1), uuid.uuid4())
+    with explained_session(seeded_connection) as (session, plans):
+        crud_event.get_events(session, limit=50, client_id=seeded_client_ids[0], cursor=cursor)
+    assert_index_plan(plans[0], "client_id_timestamp_id")
+
+
+def test_get_events_client_and_time_range_uses_composite_index(seeded_connection, seeded_client_ids):
+    from app.crud import crud_event
+
+    now = datetime.now(timezone.utc)
+    with explained_session(seeded_connection) as (session, plans):
+        crud_event.get_events(
+            session, limit=50, client_id=seeded_client_ids[0], start_date=now - timedelta(hours=6), end_date=now
+        )
+    assert_index_plan(plans[0], "client_id_timestamp_id")
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"client_id": True, "event_type": "login_failure"},
+        {"client_id": True, "severity": "high"},
+        {"event_type": "port_scan", "severity": "critical"},
+        {"client_id": True, "event_type": "brute_force", "severity": "low"},
+    ],
+)
+def test_get_events_combined_filters_use_index(seeded_connection, seeded_client_ids, filters):
+    """Под сочетание фильтров отдельного индекса нет: достаточно одного из составных, без Seq Scan."""
+    from app.crud import crud_event
+
+    if filters.get("client_id"):
+        filters = {**filters, "client_id": seeded_client_ids[0]}
+    with explained_session(seeded_connection) as (session, plans):
+        crud_event.get_events(session, limit=50, **filters)
+    assert_index_plan(
+        plans[0],
+        ("client_id_timestamp_id", "event_type_timestamp_id", "severity_timestamp_id"),
+        ordered=False,
+    )
+
+
+@pytest.mark.parametrize(
+    "filters, index_name",
+    [
+        ({}, "ix_command_created_at_id"),
+        ({"client_id": True}, "ix_command_client_id_created_at_id"),
+        ({"status": "pending_dispatch"}, "ix_command_status_created_at_id"),
+    ],
+)
+def test_get_all_commands_uses_composite_index(seeded_connection, seeded_client_ids, filters, index_name):
+    from app.crud import crud_command
+
+    if filters.get("client_id"):
+        filters = {**filters, "client_id": seeded_client_ids[0]}
+    with explained_session(seeded_connection) as (session, plans):
+        crud_command.get_all_commands(session, limit=50, **filters)
+    assert_index_plan(plans[0], index_name)
+
+
+def test_get_all_commands_client_and_status_use_index(seeded_connection, seeded_client_ids):
+    from app.crud import crud_command
+
+    with explained_session(seeded_connection) as (session, plans):
+        crud_command.get_all_commands(session, limit=50, client_id=seeded_client_ids[0], status="completed")
+    assert_index_plan(
+        plans[0],
+        ("ix_command_client_id_created_at_id", "ix_command_client_id_status_created_at", "ix_command_status_created_at_id"),
+        ordered=False,
+    )
+
+
+def test_claim_pending_commands_uses_partial_index(seeded_connection, seeded_client_ids):
+    """
+    Выдача команд агенту: UPDATE просроченных и выборка FOR UPDATE SKIP LOCKED читают частичный
+    индекс ожидающих команд клиента в порядке выдачи (приоритет, срок, время создания).
+    """
+    from app.crud import crud_command
+
+    with explained_session(seeded_connection) as (session, plans):
+        crud_command.claim_pending_commands(session, client_id=seeded_client_ids[1], limit=10)
+    time_out_plan, claim_plan = plans
+    # Просроченные ожидающие команды клиента: подходит любой из индексов по ожидающим командам
+    assert_index_plan(
+        time_out_plan,
+        ("ix_command_pending_client_id_priority_deadline", "ix_command_pending_dispatch_deadline", "ix_command_client_id_status_created_at"),
+        ordered=False,
+    )
+    node_types = [node["Node Type"] for node in plan_nodes(claim_plan)]
+    assert "LockRows" in node_types, node_types # FOR UPDATE SKIP LOCKED
+    pending_scans = [
+        node for node in plan_nodes(claim_plan)
+        if node.get("Index Name") == "ix_command_pending_client_id_priority_deadline"
+    ]
+    assert pending_scans, node_types
+    # Порядок выдачи дает индекс: сортировки под LockRows нет
+    lock_rows = next(node for node in plan_nodes(claim_plan) if node["Node Type"] == "LockRows")
+    assert "Sort" not in [node["Node Type"] for node in plan_nodes(lock_rows)], node_types
+    assert "Seq Scan" not in node_types, node_types
+
+
+def test_client_lookup_by_api_key_fingerprint_uses_unique_index(seeded_connection):
+    from app.crud import crud_client
+
+    with explained_session(seeded_connection) as (session, plans):
+        crud_client.get_client_by_api_key_fingerprint(session, api_key_fingerprint="0" * 64)
+    assert_index_plan(plans[0], "ix_client_api_key_fingerprint")
@@ -3,10 +3,13 @@ import time
 import random
 import os
 import json
+import threading
+import zlib
 from datetime import datetime, timezone, timedelta
 from uuid import uuid4
 from dotenv import load_dotenv
 import schedule # Для периодических задач
+import websocket # websocket-client: постоянный канал с бэкендом
 
 # Загрузка переменных окружения (API_KEY, BACKEND_URL)
 load_dotenv()
@@ -18,6 +21,16 @@ API_V1_STR = "/api/v1"
 CLIENT_HEARTBEAT_INTERVAL_SECONDS = int(os.getenv("CLIENT_HEARTBEAT_INTERVAL_SECONDS", 60)) # Каждые 60 секунд
 EVENT_SEND_INTERVAL_SECONDS = int(os.getenv("EVENT_SEND_INTERVAL_SECONDS", 120)) # Каждые 120 секунд
 COMMAND_FETCH_INTERVAL_SECONDS = int(os.getenv("COMMAND_FETCH_INTERVAL_SECONDS", 30)) # Каждые 30 секунд
+# Long-poll: сервер держит запрос до появления команды, но не дольше стольких секунд.
+# 0 - прежний периодический опрос раз в COMMAND_FETCH_INTERVAL_SECONDS
+COMMAND_LONG_POLL_SECONDS = int(os.getenv("COMMAND_LONG_POLL_SECONDS", 25))
+# websocket: одно постоянное соединение для команд, heartbeat, статусов и событий; http - отдельные запросы
+AGENT_CHANNEL = os.getenv("AGENT_CHANNEL", "websocket")
+WS_RECONNECT_DELAY_SECONDS = 5
+# События, которые не удалось отправить, копятся в этом файле (NDJSON) и выгружаются
+# одним сжатым потоковым запросом (POST /events/ndjson) после восстановления связи
+EVENT_BACKLOG_FILE = os.getenv("EVENT_BACKLOG_FILE", "event_backlog.ndjson")
+BACKLOG_READ_CHUNK_BYTES = 64 * 1024
 
 if not API_KEY:
     print("Ошибка: CLIENT_AGENT_API_KEY не установлен в .env или переменных окружения.")
@@ -44,14 +57,90 @@ def send_security_events(events: list):
     if not events:
         return
     try:
-        response = requests.post(f"{BACKEND_URL}{API_V1_STR}/events", headers=HEADERS, json=events)
+        # /events/batch отвечает 202 с числом принятых событий, не возвращая их обратно
+        response = requests.post(f"{BACKEND_URL}{API_V1_STR}/events/batch", headers=HEADERS, json=events)
         response.raise_for_status()
-        print(f"[{datetime.now(timezone.utc)}] Successfully sent {len(events)} events. Server response: {response.status_code}")
+        accepted = response.json()
+        print(f"[{datetime.now(timezone.utc)}] Successfully sent {accepted['accepted']} events. Batch ID: {accepted['batch_id']}")
         # print(f"Response data: {response.json()}") # Для отладки можно раскомментировать
     except requests.exceptions.RequestException as e:
         print(f"[{datetime.now(timezone.utc)}] Error sending events: {e}")
         if hasattr(e, 'response') and e.response is not None:
             print(f"Server response: {e.response.text}")
+        buffer_events(events)
+        return
+    # Связь есть - выгружаем накопленное за время недоступности бэкенда
+    upload_event_backlog()
+
+# --- Накопление событий без связи и их выгрузка ---
+
+backlog_lock = threading.Lock() # События отправляются из потока расписания и потока WebSocket
+upload_lock = threading.Lock() # Одна выгрузка накопленного за раз
+
+def buffer_events(events: list):
+    """Дописывает события в файл накопления, чтобы выгрузить их позже."""
+    with backlog_lock:
+        with open(EVENT_BACKLOG_FILE, "a", encoding="utf-8") as backlog:
+            for event in events:
+                backlog.write(json.dumps(event) + "\n")
+    print(f"[{datetime.now(timezone.utc)}] Buffered {len(events)} events to {EVENT_BACKLOG_FILE}.")
+
+def gzip_file_chunks(path: str):
+    """Файл, сжатый gzip на лету порциями: весь файл в памяти не держится."""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) # Формат gzip
+    with open(path, "rb") as source:
+        while True:
+            data = source.read(BACKLOG_READ_CHUNK_BYTES)
+            if not data:
+                break
+            compressed = compressor.compress(data)
+            if compressed:
+                yield compressed
+    yield compressor.flush()
+
+def upload_event_backlog() -> bool:
+    """
+    Выгружает накопленные события одним потоковым запросом (NDJSON, gzip).
+    При ошибке события возвращаются в файл накопления до следующей попытки.
+    """
+    if not upload_lock.acquire(blocking=False):
+        return False # Выгрузка уже идет в другом потоке
+    try:
+        return _upload_event_backlog()
+    finally:
+        upload_lock.release()
+
+def _upload_event_backlog() -> bool:
+    uploading_file = f"{EVENT_BACKLOG_FILE}.uploading"
+    with backlog_lock:
+        if not os.path.exists(EVENT_BACKLOG_FILE):
+            return True
+        os.replace(EVENT_BACKLOG_FILE, uploading_file) # Новые события копятся в новом файле
+    try:
+        # requests передает генератор по частям (chunked transfer encoding)
+        response = requests.post(
+            f"{BACKEND_URL}{API_V1_STR}/events/ndjson",
+            headers={"X-API-Key": API_KEY, "Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+            data=gzip_file_chunks(uploading_file),
+        )
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        # Часть событий могла быть уже записана (сервер пишет порциями) - при повторе возможны дубли
+        print(f"[{datetime.now(timezone.utc)}] Error uploading event backlog: {e}")
+        if hasattr(e, 'response') and e.response is not None:
+            print(f"Server response: {e.response.text}")
+        with backlog_lock:
+            with open(uploading_file, "rb") as source, open(EVENT_BACKLOG_FILE, "ab") as backlog:
+                while data := source.read(BACKLOG_READ_CHUNK_BYTES):
+                    backlog.write(data)
+            os.remove(uploading_file)
+        return False
+    result = response.json()
+    os.remove(uploading_file)
+    print(f"[{datetime.now(timezone.utc)}] Uploaded event backlog: {result['accepted']} accepted, {result['rejected']} rejected.")
+    for line_error in result["errors"]:
+        print(f"  line {line_error['line']}: {line_error['error']}")
+    return True
 
 def generate_random_event():
     event_types = ["login_failure", "file_access_denied", "sql_injection_attempt", "ssh_login", "firewall_block"]
@@ -71,42 +160,69 @@ def generate_random_event():
     event = {k: v for k, v in event.items() if v is not None or k == "details"}
     return event
 
-def fetch_and_process_commands():
-    print(f"[{datetime.now(timezone.utc)}] Fetching commands...")
+def fetch_and_process_commands(wait: int = 0) -> bool:
+    """Запрашивает до 5 команд и выполняет их. Возвращает False при ошибке запроса."""
+    if not wait:
+        print(f"[{datetime.now(timezone.utc)}] Fetching commands...")
     try:
-        response = requests.get(f"{BACKEND_URL}{API_V1_STR}/commands?limit=5", headers=HEADERS) # Запрашиваем до 5 команд
+        response = requests.get(
+            f"{BACKEND_URL}{API_V1_STR}/commands",
+            headers=HEADERS,
+            params={"limit": 5, "wait": wait},
+            timeout=wait + 10 if wait else None, # Запас сверх времени удержания запроса сервером
+        )
         response.raise_for_status()
         commands_to_process = response.json()
 
         if not commands_to_process:
-            print(f"[{datetime.now(timezone.utc)}] No new commands.")
-            return
+            if not wait:
+                print(f"[{datetime.now(timezone.utc)}] No new commands.")
+            return True
 
         print(f"[{datetime.now(timezone.utc)}] Received {len(commands_to_process)} commands.")
-        for command in commands_to_process:
-            process_single_command(command)
-            time.sleep(0.5) # Небольшая задержка между обработкой команд
+        process_commands(commands_to_process)
 
     except requests.exceptions.RequestException as e:
         print(f"[{datetime.now(timezone.utc)}] Error fetching commands: {e}")
         if hasattr(e, 'response') and e.response is not None:
             print(f"Server response: {e.response.text}")
+        return False
+    return True
 
 
-def process_single_command(command: dict):
+def long_poll_commands_forever():
+    """Непрерывный long-poll: новая команда забирается сразу после создания на сервере."""
+    while True:
+        if not fetch_and_process_commands(wait=COMMAND_LONG_POLL_SECONDS):
+            time.sleep(COMMAND_FETCH_INTERVAL_SECONDS) # Пауза перед повтором после ошибки
+
+
+def process_commands(commands: list, report_statuses=None):
+    """
+    Выполняет полученные команды, объединяя сообщения о статусах в пакеты:
+    один пакет `in_progress` по всем командам до выполнения (заменяет отдельные
+    acknowledged и in_progress) и один пакет финальных статусов после.
+    report_statuses(updates) отправляет пакет на сервер.
+    """
+    report_statuses = report_statuses or update_command_statuses
+    report_statuses([{"command_id": command["id"], "status": "in_progress"} for command in commands])
+
+    final_updates = []
+    for command in commands:
+        final_updates.append({"command_id": command["id"], **execute_command(command)})
+        time.sleep(0.5) # Небольшая задержка между обработкой команд
+    report_statuses(final_updates)
+
+
+def execute_command(command: dict) -> dict:
+    """Имитирует выполнение команды. Возвращает финальный статус и результат."""
     command_id = command.get("id")
     command_type = command.get("command_type")
     payload = command.get("payload", {})
     print(f"[{datetime.now(timezone.utc)}] Processing command ID: {command_id}, Type: {command_type}")
-    
-    status_update = {"status": "acknowledged"} # Сначала подтверждаем получение
-    update_command_status(command_id, status_update)
-    time.sleep(0.1) # Даем время на обновление статуса
-
-    status_update["status"] = "in_progress"
-    update_command_status(command_id, status_update)
     time.sleep(random.uniform(0.5, 2)) # Имитация выполнения
 
+    status_update = {}
     # Имитация выполнения команды
     if command_type == "log_message":
         message = payload.get("message", "No message in payload.")
@@ -128,30 +244,143 @@ def process_single_command(command: dict):
         status_update["status"] = "completed"
         status_update["execution_result"] = "Unknown command type processed with generic completion."
 
-    update_command_status(command_id, status_update)
     print(f"[{datetime.now(timezone.utc)}] Finished processing command ID: {command_id}, Final Status: {status_update['status']}")
+    return status_update
 
 
-def update_command_status(command_id: str, update_data: dict):
+def report_status_results(results: list):
+    for result in results:
+        if not result["updated"]:
+            print(f"[{datetime.now(timezone.utc)}] Status for command {result['command_id']} not updated: {result['error']}")
+
+
+def update_command_statuses(updates: list):
     """
-    Обновляет статус команды на сервере.
-    update_data: {"status": "new_status", "execution_result": "optional_result"}
+    Обновляет статусы нескольких команд на сервере одним запросом.
+    updates: [{"command_id": "...", "status": "new_status", "execution_result": "optional_result"}, ...]
     """
     try:
-        response = requests.patch(f"{BACKEND_URL}{API_V1_STR}/commands/{command_id}", headers=HEADERS, json=update_data)
+        response = requests.patch(f"{BACKEND_URL}{API_V1_STR}/commands", headers=HEADERS, json=updates)
         response.raise_for_status()
-        # print(f"[{datetime.now(timezone.utc)}] Status for command {command_id} updated to {update_data['status']}. Result: {response.json().get('execution_result', 'N/A')}")
+        report_status_results(response.json())
     except requests.exceptions.RequestException as e:
-        print(f"[{datetime.now(timezone.utc)}] Error updating status for command {command_id}: {e}")
+        print(f"[{datetime.now(timezone.utc)}] Error updating status for {len(updates)} commands: {e}")
         if hasattr(e, 'response') and e.response is not None:
             print(f"Server response: {e.response.text}")
 
 
-def scheduled_event_generation():
+def scheduled_event_generation(send_events=None):
     num_events = random.randint(1, 3) # Генерируем от 1 до 3 событий за раз
     events = [generate_random_event() for _ in range(num_events)]
     print(f"[{datetime.now(timezone.utc)}] Generated {len(events)} random events to send.")
-    send_security_events(events)
+    (send_events or send_security_events)(events)
+
+
+class WebSocketChannel:
+    """
+    Постоянное соединение с бэкендом (/agents/ws): команды приходят сразу после создания,
+    heartbeat, статусы команд и события отправляются по нему же.
+    Пока соединения нет, heartbeat и события уходят обычными HTTP запросами.
+    Каждая пачка событий ждет подтверждения по batch_id; пачки, которые сервер не принял
+    (очередь переполнена) или не подтвердил до разрыва, откладываются в файл накопления,
+    как при ошибке HTTP отправки.
+    """
+
+    def __init__(self):
+        base_url = BACKEND_URL.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+        self.url = f"{base_url}{API_V1_STR}/agents/ws"
+        self.ws = None
+        self.lock = threading.Lock() # Отправка из потока расписания и потока приема
+        self.unacked_batches = {} # batch_id -> события, отправленные без подтверждения
+        self.unacked_lock = threading.Lock()
+
+    def send(self, message: dict) -> bool:
+        with self.lock:
+            if self.ws is None:
+                return False
+            try:
+                self.ws.send(json.dumps(message))
+                return True
+            except (websocket.WebSocketException, OSError) as e:
+                print(f"[{datetime.now(timezone.utc)}] Error sending over WebSocket: {e}")
+                return False
+
+    def send_heartbeat(self):
+        if not self.send({"type": "heartbeat"}):
+            send_heartbeat()
+
+    def send_events(self, events: list):
+        batch_id = str(uuid4())
+        with self.unacked_lock:
+            self.unacked_batches[batch_id] = events
+        if not self.send({"type": "events", "batch_id": batch_id, "events": events}):
+            with self.unacked_lock:
+                self.unacked_batches.pop(batch_id, None)
+            send_security_events(events)
+
+    def take_unacked_events(self, batch_id=None) -> list:
+        """Снимает с ожидания подтверждения одну пачку (или все, если batch_id не задан)."""
+        with self.unacked_lock:
+            if batch_id is not None:
+                return self.unacked_batches.pop(batch_id, [])
+            batches, self.unacked_batches = self.unacked_batches, {}
+        return [event for events in batches.values() for event in events]
+
+    def report_command_statuses(self, updates: list):
+        if not self.send({"type": "command_status", "updates": updates}):
+            update_command_statuses(updates)
+
+    def handle_message(self, message: dict):
+        message_type = message.get("type")
+        if message_type == "commands":
+            commands = message.get("commands", [])
+            print(f"[{datetime.now(timezone.utc)}] Received {len(commands)} commands.")
+            process_commands(commands, report_statuses=self.report_command_statuses)
+        elif message_type == "command_status_ack":
+            report_status_results(message.get("results", []))
+        elif message_type == "heartbeat_ack":
+            print(f"[{datetime.now(timezone.utc)}] Heartbeat successful. Server response: {message['status']}")
+        elif message_type == "events_accepted":
+            self.take_unacked_events(message["batch_id"])
+            print(f"[{datetime.now(timezone.utc)}] Successfully sent {message['accepted']} events. Batch ID: {message['batch_id']}")
+            if os.path.exists(EVENT_BACKLOG_FILE):
+                # Связь есть - выгружаем отложенное, как после успешной HTTP отправки
+                threading.Thread(target=upload_event_backlog, daemon=True).start()
+        elif message_type == "events_rejected":
+            print(f"[{datetime.now(timezone.utc)}] Events batch {message.get('batch_id')} rejected: {message.get('detail')}")
+            rejected_events = self.take_unacked_events(message.get("batch_id"))
+            if rejected_events:
+                buffer_events(rejected_events)
+        elif message_type == "error":
+            print(f"[{datetime.now(timezone.utc)}] Server error: {message.get('detail')}")
+            if message.get("updates"): # Статусы команд не записаны: повторяем по HTTP
+                update_command_statuses(message["updates"])
+
+    def run_forever(self):
+        """Поток приема: подключается, обрабатывает сообщения и переподключается при разрыве."""
+        while True:
+            try:
+                ws = websocket.create_connection(self.url, header=[f"X-API-Key: {API_KEY}"])
+                with self.lock:
+                    self.ws = ws
+                print(f"[{datetime.now(timezone.utc)}] WebSocket channel connected.")
+                self.send_heartbeat()
+                # События, накопленные без связи, выгружаются отдельным HTTP запросом
+                threading.Thread(target=upload_event_backlog, daemon=True).start()
+                while True:
+                    self.handle_message(json.loads(ws.recv()))
+            except (websocket.WebSocketException, OSError, ValueError) as e:
+                print(f"[{datetime.now(timezone.utc)}] WebSocket channel error: {e}")
+            finally:
+                with self.lock:
+                    if self.ws is not None:
+                        self.ws.close()
+                    self.ws = None
+                # Подтверждение могло не дойти: откладываем (при повторной отправке возможны дубли)
+                unacked_events = self.take_unacked_events()
+                if unacked_events:
+                    buffer_events(unacked_events)
+            time.sleep(WS_RECONNECT_DELAY_SECONDS)
 
 # --- Основной цикл или планировщик ---
 if __name__ == "__main__":
@@ -160,16 +389,28 @@ if __name__ == "__main__":
     print(f"Heartbeat Interval: {CLIENT_HEARTBEAT_INTERVAL_SECONDS}s")
     print(f"Event Send Interval: {EVENT_SEND_INTERVAL_SECONDS}s")
     print(f"Command Fetch Interval: {COMMAND_FETCH_INTERVAL_SECONDS}s")
+    print(f"Command Long-Poll: {COMMAND_LONG_POLL_SECONDS}s")
+    print(f"Channel: {AGENT_CHANNEL}")
 
-    # Первоначальный heartbeat при запуске
-    send_heartbeat()
-    # Первоначальный запрос команд
-    fetch_and_process_commands()
-
-    # Настройка расписания
-    schedule.every(CLIENT_HEARTBEAT_INTERVAL_SECONDS).seconds.do(send_heartbeat)
-    schedule.every(EVENT_SEND_INTERVAL_SECONDS).seconds.do(scheduled_event_generation)
-    schedule.every(COMMAND_FETCH_INTERVAL_SECONDS).seconds.do(fetch_and_process_commands)
+    if AGENT_CHANNEL == "websocket":
+        # Команды приходят по WebSocket; поток приема сам отправляет heartbeat после каждого подключения
+        channel = WebSocketChannel()
+        threading.Thread(target=channel.run_forever, daemon=True).start()
+        schedule.every(CLIENT_HEARTBEAT_INTERVAL_SECONDS).seconds.do(channel.send_heartbeat)
+        schedule.every(EVENT_SEND_INTERVAL_SECONDS).seconds.do(scheduled_event_generation, send_events=channel.send_events)
+    else:
+        # Первоначальный heartbeat при запуске
+        send_heartbeat()
+        # Настройка расписания
+        schedule.every(CLIENT_HEARTBEAT_INTERVAL_SECONDS).seconds.do(send_heartbeat)
+        schedule.every(EVENT_SEND_INTERVAL_SECONDS).seconds.do(scheduled_event_generation)
+        if COMMAND_LONG_POLL_SECONDS > 0:
+            # Команды получаются в отдельном потоке, чтобы удерживаемый запрос не задерживал расписание
+            threading.Thread(target=long_poll_commands_forever, daemon=True).start()
+        else:
+            # Первоначальный запрос команд
+            fetch_and_process_commands()
+            schedule.every(COMMAND_FETCH_INTERVAL_SECONDS).seconds.do(fetch_and_process_commands)
 
     print(f"[{datetime.now(timezone.utc)}] Client agent running. Press Ctrl+C to stop.")
     try:
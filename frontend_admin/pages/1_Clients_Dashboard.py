@@ -38,12 +38,13 @@ st.subheader("Список зарегистрированных клиентов
 
 # Пагинация (простая)
 limit_per_page = st.slider("Клиентов на странице:", 5, 50, 10)
-if 'client_page_number' not in st.session_state:
-    st.session_state.client_page_number = 0
+# Keyset-пагинация: курсоры начала просмотренных страниц, последний - текущая страница
+if 'client_page_cursors' not in st.session_state:
+    st.session_state.client_page_cursors = [None]
 
-skip = st.session_state.client_page_number * limit_per_page
-
-clients_list = api_client.get_clients(skip=skip, limit=limit_per_page)
+clients_list, next_clients_cursor = api_client.get_clients_page(
+    cursor=st.session_state.client_page_cursors[-1], limit=limit_per_page
+)
 
 if clients_list:
     # Убираем api_key_hash из отображения, если он есть
@@ -54,23 +55,26 @@ if clients_list:
     columns_ordered = ['id', 'client_name', 'status', 'ip_address', 'os_info', 'registered_at', 'last_heartbeat']
     display_columns = [col for col in columns_ordered if col in clients_df.columns]
     
+    # Статус "offline" выставляет бэкенд, если heartbeat не приходил дольше CLIENT_INACTIVE_AFTER_SECONDS
+    status_counts = clients_df['status'].value_counts()
+    status_cols = st.columns(max(len(status_counts), 1))
+    for status_col, (client_status, count) in zip(status_cols, status_counts.items()):
+        status_col.metric(f"Статус: {client_status}", int(count))
+
     st.dataframe(clients_df[display_columns], use_container_width=True)
 
     col1, col2 = st.columns(2)
     with col1:
-        if st.session_state.client_page_number > 0:
+        if len(st.session_state.client_page_cursors) > 1:
             if st.button("⬅️ Предыдущая страница"):
-                st.session_state.client_page_number -= 1
+                st.session_state.client_page_cursors.pop()
                 st.rerun()
     with col2:
-        # Для простоты, предполагаем, что если вернулось меньше лимита, то это последняя страница
-        # В идеале, API должен возвращать общее количество для точной пагинации
-        if len(clients_list) == limit_per_page:
+        # Бэкенд возвращает курсор следующей страницы только если страница заполнена полностью
+        if next_clients_cursor:
              if st.button("Следующая страница ➡️"):
-                st.session_state.client_page_number += 1
+                st.session_state.client_page_cursors.append(next_clients_cursor)
                 st.rerun()
-        elif not clients_list and st.session_state.client_page_number > 0: # Если на текущей странице нет данных, а мы не на первой
-            st.info("Больше нет клиентов. Возможно, стоит вернуться на предыдущую страницу.")
 
 
     # --- Детали клиента (опционально) ---
@@ -95,10 +99,10 @@ if clients_list:
     else:
         st.info("Нет клиентов для отображения деталей.")
 
-elif not clients_list and st.session_state.client_page_number > 0:
+elif not clients_list and len(st.session_state.client_page_cursors) > 1:
     st.info("Нет клиентов на этой странице. Попробуйте вернуться на предыдущую.")
     if st.button("⬅️ Вернуться на предыдущую страницу"):
-        st.session_state.client_page_number -= 1
+        st.session_state.client_page_cursors.pop()
         st.rerun()
 elif not clients_list:
      st.info("Пока нет зарегистрированных клиентов.")
@@ -27,6 +27,7 @@ filter_severity = st.sidebar.selectbox(
     options=["", "low", "medium", "high", "critical"], # Пустая строка для отсутствия фильтра
     index=0
 )
+filter_details_contains = st.sidebar.text_input("details содержит (JSON):", placeholder='{"code": 403}')
 
 # Фильтр по дате
 st.sidebar.subheader("Период")
@@ -53,24 +54,33 @@ else:
     filter_end_date = end_d
 
 
+# Колонки таблицы; details (произвольный JSON) запрашивается с сервера только по флажку
+show_event_details = st.sidebar.checkbox("Показывать details", value=False)
+columns_ordered = ['id', 'timestamp', 'client_id', 'event_type', 'severity', 'source_ip', 'db_name_target']
+if show_event_details:
+    columns_ordered.append('details')
+
 # Пагинация
 limit_per_page = st.sidebar.slider("Событий на странице:", 10, 200, 25, key="events_limit")
-if 'event_page_number' not in st.session_state:
-    st.session_state.event_page_number = 0
+# Keyset-пагинация: храним курсоры начала просмотренных страниц, последний - текущая страница
+if 'event_page_cursors' not in st.session_state:
+    st.session_state.event_page_cursors = [None]
 
-skip = st.session_state.event_page_number * limit_per_page
+current_event_cursor = st.session_state.event_page_cursors[-1]
 
 # --- Загрузка и отображение событий ---
 with st.spinner("Загрузка событий..."):
-    events_list = api_client.get_events(
-        skip=skip,
+    events_list, next_events_cursor = api_client.get_events_page(
+        cursor=current_event_cursor,
         limit=limit_per_page,
         client_id=str(filter_client_id) if filter_client_id else None,
         event_type=filter_event_type if filter_event_type else None,
         severity=filter_severity if filter_severity else None,
         start_date=filter_start_date.isoformat() if filter_start_date else None,
         # Для end_date добавляем время конца дня, чтобы включить весь день
-        end_date=(datetime.combine(filter_end_date, datetime.max.time()).isoformat()) if filter_end_date else None
+        end_date=(datetime.combine(filter_end_date, datetime.max.time()).isoformat()) if filter_end_date else None,
+        fields=columns_ordered,
+        details_contains=filter_details_contains.strip() or None
     )
 
 if events_list:
@@ -83,34 +93,31 @@ if events_list:
     # Это потребует дополнительного запроса или предварительной загрузки имен клиентов
     # Для простоты пока оставим client_id
     
-    columns_ordered = ['id', 'timestamp', 'client_id', 'event_type', 'severity', 'source_ip', 'db_name_target', 'details']
     display_columns = [col for col in columns_ordered if col in events_df.columns]
     
     st.dataframe(events_df[display_columns], use_container_width=True)
 
     col1, col2 = st.columns(2)
     with col1:
-        if st.session_state.event_page_number > 0:
+        if len(st.session_state.event_page_cursors) > 1:
             if st.button("⬅️ Предыдущая страница", key="prev_events"):
-                st.session_state.event_page_number -= 1
+                st.session_state.event_page_cursors.pop()
                 st.rerun()
     with col2:
-        if len(events_list) == limit_per_page:
+        if next_events_cursor: # Бэкенд вернул курсор - есть следующая страница
             if st.button("Следующая страница ➡️", key="next_events"):
-                st.session_state.event_page_number += 1
+                st.session_state.event_page_cursors.append(next_events_cursor)
                 st.rerun()
-        elif not events_list and st.session_state.event_page_number > 0:
-            st.info("Больше нет событий. Возможно, стоит вернуться.")
 
-elif not events_list and st.session_state.event_page_number > 0 :
+elif not events_list and len(st.session_state.event_page_cursors) > 1:
      st.info("Нет событий на этой странице. Попробуйте вернуться или изменить фильтры.")
      if st.button("⬅️ Вернуться на предыдущую (события)"):
-        st.session_state.event_page_number -= 1
+        st.session_state.event_page_cursors.pop()
         st.rerun()
 else:
     st.info("Событий по указанным фильтрам не найдено.")
 
 
 if st.sidebar.button("Применить фильтры и обновить"):
-    st.session_state.event_page_number = 0 # Сбрасываем на первую страницу при новых фильтрах
+    st.session_state.event_page_cursors = [None] # Сбрасываем на первую страницу при новых фильтрах
     st.rerun()
\ No newline at end of file
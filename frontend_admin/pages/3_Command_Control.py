@@ -36,6 +36,14 @@ with st.expander("Создать новую команду", expanded=False):
             "Крайний срок отправки (опционально, формат YYYY-MM-DDTHH:MM:SSZ, например, 2025-12-31T23:59:59Z)",
             key="cmd_deadline"
         )
+        cmd_priority = st.number_input(
+            "Приоритет (команды с большим приоритетом выдаются раньше)",
+            value=0, step=1, key="cmd_priority"
+        )
+        cmd_not_before_str = st.text_input(
+            "Не отправлять раньше (опционально, формат YYYY-MM-DDTHH:MM:SSZ)",
+            key="cmd_not_before"
+        )
 
         submitted_cmd = st.form_submit_button("Отправить команду")
         if submitted_cmd:
@@ -52,13 +60,16 @@ with st.expander("Создать новую команду", expanded=False):
                         # Либо можно сделать строже: if ...: st.stop() / return
                 
                 deadline = cmd_deadline_str if cmd_deadline_str else None
+                not_before = cmd_not_before_str if cmd_not_before_str else None
 
                 with st.spinner("Отправка команды..."):
                     command_data = api_client.create_command(
                         client_id=str(cmd_client_id),
                         command_type=cmd_type,
                         payload=payload_dict,
-                        dispatch_deadline=deadline
+                        dispatch_deadline=deadline,
+                        priority=int(cmd_priority),
+                        not_before=not_before
                     )
                 
                 if command_data:
@@ -68,6 +79,88 @@ with st.expander("Создать новую команду", expanded=False):
                 else:
                     st.error("Не удалось создать команду. Проверьте правильность введенных данных и логи сервера.")
 
+# --- Секция рассылки команды группе клиентов ---
+with st.expander("Разослать команду группе клиентов", expanded=False):
+    with st.form("broadcast_command_form"):
+        st.subheader("Адресаты (условия объединяются через И)")
+
+        clients_list_for_broadcast = api_client.get_clients(limit=1000)
+        broadcast_client_options = {client['client_name']: client['id'] for client in clients_list_for_broadcast}
+        selected_broadcast_clients = st.multiselect(
+            "Клиенты (опционально):",
+            options=list(broadcast_client_options.keys()),
+            key="broadcast_clients"
+        )
+        broadcast_client_status = st.selectbox(
+            "Статус клиента (опционально):",
+            options=["", "active", "offline", "inactive", "maintenance", "disabled"],
+            key="broadcast_client_status"
+        )
+        broadcast_os_info = st.text_input("ОС содержит (без учета регистра, опционально)", key="broadcast_os_info")
+        broadcast_name_like = st.text_input("Имя клиента по шаблону LIKE (например, web-%, опционально)", key="broadcast_name_like")
+        broadcast_all_clients = st.checkbox("Всем клиентам (если условия не заданы)", key="broadcast_all_clients")
+
+        st.subheader("Параметры команды")
+        broadcast_cmd_type = st.text_input("Тип команды", key="broadcast_cmd_type")
+        broadcast_payload_str = st.text_area("Полезная нагрузка (JSON формат)", height=100, key="broadcast_payload")
+        broadcast_deadline_str = st.text_input(
+            "Крайний срок отправки (опционально, формат YYYY-MM-DDTHH:MM:SSZ)",
+            key="broadcast_deadline"
+        )
+        broadcast_priority = st.number_input("Приоритет", value=0, step=1, key="broadcast_priority")
+        broadcast_not_before_str = st.text_input(
+            "Не отправлять раньше (опционально, формат YYYY-MM-DDTHH:MM:SSZ)",
+            key="broadcast_not_before"
+        )
+
+        submitted_broadcast = st.form_submit_button("Разослать команду")
+        if submitted_broadcast:
+            broadcast_payload = None
+            payload_valid = True
+            if broadcast_payload_str:
+                try:
+                    broadcast_payload = json.loads(broadcast_payload_str)
+                except json.JSONDecodeError:
+                    payload_valid = False
+                    st.error("Ошибка в формате JSON для полезной нагрузки.")
+
+            if not broadcast_cmd_type:
+                st.error("Тип команды обязателен для заполнения.")
+            elif payload_valid:
+                target = {
+                    "client_ids": [str(broadcast_client_options[name]) for name in selected_broadcast_clients] or None,
+                    "client_status": broadcast_client_status or None,
+                    "os_info_contains": broadcast_os_info or None,
+                    "client_name_like": broadcast_name_like or None,
+                    "all_clients": broadcast_all_clients,
+                }
+                with st.spinner("Рассылка команды..."):
+                    campaign = api_client.create_broadcast_command(
+                        command_type=broadcast_cmd_type,
+                        target=target,
+                        payload=broadcast_payload,
+                        dispatch_deadline=broadcast_deadline_str or None,
+                        priority=int(broadcast_priority),
+                        not_before=broadcast_not_before_str or None
+                    )
+                if campaign:
+                    st.session_state.last_campaign_id = campaign.get('campaign_id')
+                    st.success(f"Рассылка '{campaign.get('campaign_id')}' создана: команд - {campaign.get('total')}.")
+
+    # Прогресс рассылки: число команд кампании в каждом статусе
+    campaign_id_to_check = st.text_input(
+        "ID рассылки для просмотра прогресса:",
+        value=st.session_state.get('last_campaign_id') or "",
+        key="campaign_id_to_check"
+    )
+    if campaign_id_to_check and st.button("Показать прогресс рассылки", key="show_campaign_btn"):
+        campaign = api_client.get_command_campaign(campaign_id_to_check)
+        if campaign:
+            st.metric("Всего команд", campaign.get('total', 0))
+            status_counts = campaign.get('status_counts', {})
+            if status_counts:
+                st.bar_chart(pd.Series(status_counts, name="commands"))
+
 st.markdown("---")
 # --- Секция отображения списка команд ---
 st.subheader("Список отправленных команд")
@@ -96,48 +189,51 @@ filter_cmd_status = st.sidebar.selectbox(
     index=0,
     key="cmd_filter_status"
 )
+filter_cmd_campaign_id = st.sidebar.text_input("ID рассылки (опционально):", key="cmd_filter_campaign")
+filter_cmd_payload_contains = st.sidebar.text_input("payload содержит (JSON):", placeholder='{"ip": "10.0.0.5"}', key="cmd_filter_payload")
 
 # Пагинация
 limit_cmd_per_page = st.sidebar.slider("Команд на странице:", 10, 100, 15, key="commands_limit")
-if 'command_page_number' not in st.session_state:
-    st.session_state.command_page_number = 0
+# Keyset-пагинация: курсоры начала просмотренных страниц, последний - текущая страница
+if 'command_page_cursors' not in st.session_state:
+    st.session_state.command_page_cursors = [None]
 
-skip_cmd = st.session_state.command_page_number * limit_cmd_per_page
+current_command_cursor = st.session_state.command_page_cursors[-1]
 
 with st.spinner("Загрузка команд..."):
-    commands_list = api_client.get_all_commands(
-        skip=skip_cmd,
+    commands_list, next_commands_cursor = api_client.get_all_commands_page(
+        cursor=current_command_cursor,
         limit=limit_cmd_per_page,
         client_id=str(filter_cmd_client_id) if filter_cmd_client_id else None,
-        status=filter_cmd_status if filter_cmd_status else None
+        status=filter_cmd_status if filter_cmd_status else None,
+        campaign_id=filter_cmd_campaign_id.strip() or None,
+        payload_contains=filter_cmd_payload_contains.strip() or None
     )
 
 if commands_list:
     commands_df = pd.DataFrame(commands_list)
     # Форматирование дат
-    for date_col in ['created_at', 'updated_at', 'dispatch_deadline']:
+    for date_col in ['created_at', 'updated_at', 'dispatch_deadline', 'not_before']:
         if date_col in commands_df.columns:
             commands_df[date_col] = pd.to_datetime(commands_df[date_col], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S')
             commands_df[date_col] = commands_df[date_col].fillna("N/A") # Заполняем NaT (если были ошибки конвертации или None)
 
-    columns_cmd_ordered = ['id', 'client_id', 'command_type', 'status', 'created_at', 'updated_at', 'dispatch_deadline', 'execution_result', 'payload']
+    columns_cmd_ordered = ['id', 'client_id', 'campaign_id', 'command_type', 'status', 'priority', 'created_at', 'updated_at', 'not_before', 'dispatch_deadline', 'execution_result', 'payload']
     display_cmd_columns = [col for col in columns_cmd_ordered if col in commands_df.columns]
     
     st.dataframe(commands_df[display_cmd_columns], use_container_width=True)
 
     col1_cmd, col2_cmd = st.columns(2)
     with col1_cmd:
-        if st.session_state.command_page_number > 0:
+        if len(st.session_state.command_page_cursors) > 1:
             if st.button("⬅️ Предыдущая страница", key="prev_commands"):
-                st.session_state.command_page_number -= 1
+                st.session_state.command_page_cursors.pop()
                 st.rerun()
     with col2_cmd:
-        if len(commands_list) == limit_cmd_per_page:
+        if next_commands_cursor:
             if st.button("Следующая страница ➡️", key="next_commands"):
-                st.session_state.command_page_number += 1
+                st.session_state.command_page_cursors.append(next_commands_cursor)
                 st.rerun()
-        elif not commands_list and st.session_state.command_page_number > 0:
-             st.info("Больше нет команд. Возможно, стоит вернуться.")
 
 
     # --- Детали команды (опционально) ---
@@ -164,15 +260,15 @@ if commands_list:
         st.info("Нет команд для отображения деталей.")
 
 
-elif not commands_list and st.session_state.command_page_number > 0:
+elif not commands_list and len(st.session_state.command_page_cursors) > 1:
     st.info("Нет команд на этой странице. Попробуйте вернуться или изменить фильтры.")
     if st.button("⬅️ Вернуться на предыдущую (команды)"):
-        st.session_state.command_page_number -= 1
+        st.session_state.command_page_cursors.pop()
         st.rerun()
 else:
     st.info("Команд по указанным фильтрам не найдено.")
 
 
 if st.sidebar.button("Применить фильтры и обновить список команд"):
-    st.session_state.command_page_number = 0 # Сбрасываем на первую страницу
+    st.session_state.command_page_cursors = [None] # Сбрасываем на первую страницу
     st.rerun()
\ No newline at end of file
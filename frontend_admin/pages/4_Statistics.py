@@ -0,0 +1,88 @@
+import streamlit as st
+import pandas as pd
+from utils import api_client
+from datetime import datetime, timedelta, timezone
+
+st.set_page_config(page_title="Statistics", layout="wide")
+
+st.title("Статистика")
+st.markdown("Агрегаты событий и команд. Подсчет выполняется на сервере, сюда приходят только итоговые числа.")
+
+# --- Параметры ---
+st.sidebar.header("Параметры статистики")
+period_options = {
+    "Последний час": (timedelta(hours=1), "minute"),
+    "Последние 24 часа": (timedelta(days=1), "hour"),
+    "Последние 7 дней": (timedelta(days=7), "hour"),
+    "Последние 30 дней": (timedelta(days=30), "day"),
+}
+selected_period = st.sidebar.selectbox("Период:", options=list(period_options.keys()), index=1)
+period_length, default_bucket = period_options[selected_period]
+bucket_options = ["minute", "hour", "day"]
+stats_bucket = st.sidebar.selectbox("Шаг графика:", options=bucket_options, index=bucket_options.index(default_bucket))
+
+period_start = (datetime.now(timezone.utc) - period_length).isoformat()
+# Поминутная сводка хранится на сервере недолго (EVENT_ROLLUP_MINUTE_RETENTION_DAYS, по умолчанию 2 дня):
+# за более длинный период поминутный график считается по сырым событиям
+minute_stats_exact = stats_bucket == "minute" and period_length > timedelta(days=1)
+
+clients_list_for_stats = api_client.get_clients(limit=1000)
+client_names_by_id = {client['id']: client['client_name'] for client in clients_list_for_stats}
+
+# --- События по времени ---
+st.subheader("События по уровню серьезности")
+with st.spinner("Загрузка статистики событий..."):
+    events_by_severity = api_client.get_event_stats(
+        bucket=stats_bucket, group_by=["severity"], start_date=period_start, exact=minute_stats_exact
+    )
+
+if events_by_severity:
+    severity_df = pd.DataFrame(events_by_severity)
+    severity_df['bucket'] = pd.to_datetime(severity_df['bucket'], errors='coerce')
+    # Строки (интервал, серьезность) -> таблица интервал x серьезность для графика
+    severity_chart = severity_df.pivot_table(index='bucket', columns='severity', values='count', aggfunc='sum', fill_value=0)
+    st.bar_chart(severity_chart)
+    st.metric("Всего событий за период", int(severity_df['count'].sum()))
+else:
+    st.info("Нет событий за выбранный период.")
+
+col_types, col_clients = st.columns(2)
+with col_types:
+    st.subheader("Типы событий")
+    events_by_type = api_client.get_event_stats(group_by=["event_type"], start_date=period_start, limit=20)
+    if events_by_type:
+        st.bar_chart(pd.DataFrame(events_by_type).set_index('event_type')['count'])
+    else:
+        st.info("Нет данных.")
+with col_clients:
+    st.subheader("Клиенты с наибольшим числом событий")
+    events_by_client = api_client.get_event_stats(group_by=["client_id"], start_date=period_start, limit=20)
+    if events_by_client:
+        clients_df = pd.DataFrame(events_by_client)
+        clients_df['client'] = clients_df['client_id'].map(lambda client_id: client_names_by_id.get(client_id, client_id))
+        st.bar_chart(clients_df.set_index('client')['count'])
+    else:
+        st.info("Нет данных.")
+
+st.markdown("---")
+# --- Команды ---
+st.subheader("Команды по статусам")
+with st.spinner("Загрузка статистики команд..."):
+    commands_by_status = api_client.get_command_stats(group_by=["status"], start_date=period_start)
+
+if commands_by_status:
+    status_df = pd.DataFrame(commands_by_status).set_index('status')['count']
+    status_columns = st.columns(len(status_df))
+    for status_column, (command_status, count) in zip(status_columns, status_df.items()):
+        status_column.metric(command_status, int(count))
+
+    commands_over_time = api_client.get_command_stats(bucket=stats_bucket, group_by=["status"], start_date=period_start)
+    if commands_over_time:
+        commands_df = pd.DataFrame(commands_over_time)
+        commands_df['bucket'] = pd.to_datetime(commands_df['bucket'], errors='coerce')
+        st.bar_chart(commands_df.pivot_table(index='bucket', columns='status', values='count', aggfunc='sum', fill_value=0))
+else:
+    st.info("Нет команд за выбранный период.")
+
+if st.sidebar.button("Обновить статистику"):
+    st.rerun()
@@ -1,6 +1,6 @@
 import requests
 import streamlit as st
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import os
 from dotenv import load_dotenv
 
@@ -13,6 +13,17 @@ BASE_ADMIN_URL = f"{BACKEND_URL}{API_V1_STR}/admin"
 BASE_CLIENT_URL = f"{BACKEND_URL}{API_V1_STR}/clients" # Для heartbeat, если понадобится от имени админа (нет)
 BASE_COMMANDS_URL = f"{BACKEND_URL}{API_V1_STR}/commands" # Для получения команд клиентом (не для админа)
 
+# Бэкенд отдает курсор следующей страницы в этом заголовке (keyset-пагинация)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _get_page(url: str, params: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """GET списка; возвращает элементы и курсор следующей страницы (None - страниц больше нет)."""
+    params = {k: v for k, v in params.items() if v is not None and v != ""}
+    response = requests.get(url, params=params)
+    response.raise_for_status()
+    return response.json(), response.headers.get(NEXT_CURSOR_HEADER)
+
 
 # --- Client Management ---
 def register_client(client_name: str, ip_address: Optional[str] = None, os_info: Optional[str] = None) -> Optional[Dict[str, Any]]:
@@ -42,6 +53,13 @@ def get_clients(skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
         st.error(f"Error fetching clients: {e}")
         return []
 
+def get_clients_page(cursor: Optional[str] = None, limit: int = 100) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    try:
+        return _get_page(f"{BASE_ADMIN_URL}/clients", {"cursor": cursor, "limit": limit})
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching clients: {e}")
+        return [], None
+
 def get_client_details(client_id: str) -> Optional[Dict[str, Any]]:
     try:
         response = requests.get(f"{BASE_ADMIN_URL}/clients/{client_id}")
@@ -80,18 +98,50 @@ def get_events(
         st.error(f"Error fetching events: {e}")
         return []
 
+def get_events_page(
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    client_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    start_date: Optional[str] = None, # ISO format string
+    end_date: Optional[str] = None,   # ISO format string
+    fields: Optional[List[str]] = None, # Нужные колонки (id и timestamp приходят всегда); None - все
+    details_contains: Optional[str] = None, # JSON-объект, входящий в details, e.g. '{"code": 403}'
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    params = {
+        "cursor": cursor,
+        "limit": limit,
+        "client_id": client_id,
+        "event_type": event_type,
+        "severity": severity,
+        "start_date": start_date,
+        "end_date": end_date,
+        "fields": fields,
+        "details_contains": details_contains,
+    }
+    try:
+        return _get_page(f"{BASE_ADMIN_URL}/events", params)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching events: {e}")
+        return [], None
+
 # --- Command Management ---
 def create_command(
     client_id: str,
     command_type: str,
     payload: Optional[Dict[str, Any]] = None,
-    dispatch_deadline: Optional[str] = None # ISO format string
+    dispatch_deadline: Optional[str] = None, # ISO format string
+    priority: int = 0,
+    not_before: Optional[str] = None # ISO format string
 ) -> Optional[Dict[str, Any]]:
     command_data = {
         "client_id": client_id,
         "command_type": command_type,
         "payload": payload if payload else {},
-        "dispatch_deadline": dispatch_deadline
+        "dispatch_deadline": dispatch_deadline,
+        "priority": priority,
+        "not_before": not_before
     }
     command_data = {k:v for k,v in command_data.items() if v is not None}
 
@@ -108,6 +158,47 @@ def create_command(
                 st.error(f"Server response (not JSON): {response.text}")
         return None
 
+def create_broadcast_command(
+    command_type: str,
+    target: Dict[str, Any], # client_ids / client_status / os_info_contains / client_name_like / all_clients
+    payload: Optional[Dict[str, Any]] = None,
+    dispatch_deadline: Optional[str] = None, # ISO format string
+    priority: int = 0,
+    not_before: Optional[str] = None # ISO format string
+) -> Optional[Dict[str, Any]]:
+    broadcast_data = {
+        "command_type": command_type,
+        "payload": payload if payload else {},
+        "dispatch_deadline": dispatch_deadline,
+        "priority": priority,
+        "not_before": not_before,
+        "target": {k: v for k, v in target.items() if v is not None and v != ""},
+    }
+    broadcast_data = {k: v for k, v in broadcast_data.items() if v is not None}
+
+    response = None
+    try:
+        response = requests.post(f"{BASE_ADMIN_URL}/commands/broadcast", json=broadcast_data)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error creating broadcast command: {e}")
+        if response is not None and response.content:
+            try:
+                st.error(f"Server response: {response.json()}")
+            except ValueError:
+                st.error(f"Server response (not JSON): {response.text}")
+        return None
+
+def get_command_campaign(campaign_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        response = requests.get(f"{BASE_ADMIN_URL}/commands/campaigns/{campaign_id}")
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching campaign {campaign_id}: {e}")
+        return None
+
 def get_all_commands(
     skip: int = 0,
     limit: int = 100,
@@ -129,6 +220,30 @@ def get_all_commands(
         st.error(f"Error fetching commands: {e}")
         return []
 
+def get_all_commands_page(
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    client_id: Optional[str] = None,
+    status: Optional[str] = None,
+    campaign_id: Optional[str] = None,
+    fields: Optional[List[str]] = None, # Нужные колонки (id и created_at приходят всегда); None - все
+    payload_contains: Optional[str] = None, # JSON-объект, входящий в payload, e.g. '{"ip": "10.0.0.5"}'
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    params = {
+        "cursor": cursor,
+        "limit": limit,
+        "client_id": client_id,
+        "status": status,
+        "campaign_id": campaign_id,
+        "fields": fields,
+        "payload_contains": payload_contains,
+    }
+    try:
+        return _get_page(f"{BASE_ADMIN_URL}/commands", params)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching commands: {e}")
+        return [], None
+
 def get_command_details(command_id: str) -> Optional[Dict[str, Any]]:
     try:
         response = requests.get(f"{BASE_ADMIN_URL}/commands/{command_id}")
@@ -136,4 +251,63 @@ def get_command_details(command_id: str) -> Optional[Dict[str, Any]]:
         return response.json()
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching command details for {command_id}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def get_event_stats(
+    bucket: Optional[str] = None, # "minute", "hour" или "day"
+    group_by: Optional[List[str]] = None, # client_id, event_type, severity
+    client_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    start_date: Optional[str] = None, # ISO format string
+    end_date: Optional[str] = None,   # ISO format string
+    exact: bool = False, # Подсчет по сырым событиям вместо сводки
+    limit: int = 1000,
+) -> List[Dict[str, Any]]:
+    params = {
+        "bucket": bucket,
+        "group_by": group_by or [],
+        "client_id": client_id,
+        "event_type": event_type,
+        "severity": severity,
+        "start_date": start_date,
+        "end_date": end_date,
+        "exact": "true" if exact else None,
+        "limit": limit,
+    }
+    params = {k: v for k, v in params.items() if v is not None and v != ""}
+    try:
+        response = requests.get(f"{BASE_ADMIN_URL}/stats/events", params=params)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching event stats: {e}")
+        return []
+
+def get_command_stats(
+    bucket: Optional[str] = None, # "minute", "hour" или "day"
+    group_by: Optional[List[str]] = None, # client_id, command_type, status
+    client_id: Optional[str] = None,
+    campaign_id: Optional[str] = None,
+    start_date: Optional[str] = None, # ISO format string
+    end_date: Optional[str] = None,   # ISO format string
+    limit: int = 1000,
+) -> List[Dict[str, Any]]:
+    params = {
+        "bucket": bucket,
+        "group_by": group_by or [],
+        "client_id": client_id,
+        "campaign_id": campaign_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "limit": limit,
+    }
+    params = {k: v for k, v in params.items() if v is not None and v != ""}
+    try:
+        response = requests.get(f"{BASE_ADMIN_URL}/stats/commands", params=params)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching command stats: {e}")
+        return []